@@ -0,0 +1,185 @@
+import csv
+import difflib
+import os
+import re
+from collections import deque
+from functools import lru_cache
+
+DEFAULT_SYNONYMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "analytes.csv")
+
+# Near-miss spelling correction only considers single-word synonyms at least this long;
+# fuzzy-matching short abbreviations ("alt", "esr") would map random words onto analytes.
+FUZZY_MIN_LENGTH = 6
+# candidates are pre-selected by similarity, then must be one edit away (a misread, dropped or
+# doubled letter): "myoglobin" is close to "hemoglobin" and "creatine" to "creatinine" by ratio,
+# but they are different tests
+FUZZY_CUTOFF = 0.8
+FUZZY_MAX_EDITS = 1
+_TOKEN_RE = re.compile(r'[a-z]+')
+# analyte column of rows naming tests that are not interpreted (see data/analytes.csv)
+NOT_INTERPRETED = '-'
+
+# -------------------------
+# Synonym table
+# -------------------------
+def load_synonyms(path=DEFAULT_SYNONYMS_PATH):
+    rows = []
+    with open(path, encoding="utf-8", newline='') as fh:
+        reader = csv.DictReader(ln for ln in fh if not ln.startswith('#'))
+        for row in reader:
+            rows.append((row['analyte'].strip(), row['synonym'].strip().lower(), (row.get('match') or 'substring').strip()))
+    return rows
+
+# -------------------------
+# Aho-Corasick automaton
+# -------------------------
+class Automaton:
+    def __init__(self, terms):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for term_id, term in enumerate(terms):
+            node = 0
+            for ch in term:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((term_id, len(term)))
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text):
+        # yields (term_id, start, end) for every occurrence of every term
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for term_id, length in out[node]:
+                yield term_id, i + 1 - length, i + 1
+
+# -------------------------
+# Resolver
+# -------------------------
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+def _edit_distance(a, b, limit):
+    # Levenshtein distance, or limit + 1 once it is certain to exceed limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+class NameResolver:
+    def __init__(self, rows):
+        self.analytes = []
+        priority = {}
+        terms, term_index = [], {}
+        # each entry: (priority, analyte, ids of the terms that must all be present)
+        self._entries = []
+        for row_no, (analyte, synonym, match) in enumerate(rows):
+            # an analyte ranks at its first row; a not-interpreted row ranks at its own position
+            if analyte == NOT_INTERPRETED:
+                rank = row_no
+            else:
+                if analyte not in priority:
+                    priority[analyte] = row_no
+                    self.analytes.append(analyte)
+                rank = priority[analyte]
+            ids = []
+            for part in synonym.split('+'):
+                part = part.strip()
+                key = (part, match == 'word')
+                if key not in term_index:
+                    term_index[key] = len(terms)
+                    terms.append(key)
+                ids.append(term_index[key])
+            self._entries.append((rank, analyte, frozenset(ids)))
+        self._terms = terms
+        self._entries.sort(key=lambda e: e[0])
+        # term -> entries using it, so a lookup only visits entries that can possibly match
+        self._entries_by_term = [[] for _ in terms]
+        for entry in self._entries:
+            for term_id in entry[2]:
+                self._entries_by_term[term_id].append(entry)
+        self._automaton = Automaton([t for t, _ in terms])
+        self._fuzzy_vocab = sorted({t for t, _ in terms if ' ' not in t and t.isalpha() and len(t) >= FUZZY_MIN_LENGTH})
+        self.resolve = lru_cache(maxsize=8192)(self._resolve)
+        self._correct_token = lru_cache(maxsize=8192)(self._correct_token_uncached)
+
+    @classmethod
+    def from_csv(cls, path=DEFAULT_SYNONYMS_PATH):
+        return cls(load_synonyms(path))
+
+    def _lookup(self, s):
+        found = set()
+        for term_id, start, end in self._automaton.iter_matches(s):
+            if self._terms[term_id][1]:
+                if (start > 0 and _is_word_char(s[start - 1])) or (end < len(s) and _is_word_char(s[end])):
+                    continue
+            found.add(term_id)
+        best = None
+        for term_id in found:
+            for entry in self._entries_by_term[term_id]:
+                if best is not None and entry[0] >= best[0]:
+                    break
+                if entry[2] <= found:
+                    best = entry
+                    break
+        return best[1] if best is not None else None
+
+    def _correct_token_uncached(self, token):
+        for close in difflib.get_close_matches(token, self._fuzzy_vocab, n=3, cutoff=FUZZY_CUTOFF):
+            if _edit_distance(token, close, FUZZY_MAX_EDITS) <= FUZZY_MAX_EDITS:
+                return close
+        return None
+
+    def _resolve(self, raw):
+        s = raw.lower()
+        analyte = self._lookup(s)
+        if analyte == NOT_INTERPRETED:
+            return raw.strip()
+        if analyte is not None:
+            return analyte
+        # near-miss fallback: correct OCR-mangled words, then look up again
+        corrected, changed = s, False
+        for m in _TOKEN_RE.finditer(s):
+            token = m.group(0)
+            if len(token) < FUZZY_MIN_LENGTH - 1:
+                continue
+            fix = self._correct_token(token)
+            if fix and fix != token:
+                corrected = corrected.replace(token, fix)
+                changed = True
+        if changed:
+            analyte = self._lookup(corrected)
+            if analyte is not None and analyte != NOT_INTERPRETED:
+                return analyte
+        return raw.strip()
+
+DEFAULT_RESOLVER = NameResolver.from_csv()
+
+def resolve_test_name(raw):
+    return DEFAULT_RESOLVER.resolve(raw)
@@ -0,0 +1,498 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from cache import ResultCache, cache_key
+from instrument import Metrics, capture
+from pipeline import (DEFAULT_CLARITY, STAGE_EXTRACT, STAGE_INTERPRET, STAGE_PARSE, SUPPORTED_EXTS, analyze_many,
+                      analyze_stream, build_summary_and_abnormals, detect_kind, report_settings)
+
+# -------------------------
+# Input discovery
+# -------------------------
+def _is_supported(path):
+    return os.path.splitext(path)[1].lower() in SUPPORTED_EXTS
+
+def read_manifest(manifest_path):
+    # one report path per line, optionally followed by a tab and the patient ID;
+    # returns [(path, patient_id or None)]
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    entries = []
+    with open(manifest_path, encoding="utf-8") as fh:
+        for ln in fh:
+            ln = ln.strip()
+            if not ln or ln.startswith('#'):
+                continue
+            path, _, patient_id = ln.partition('\t')
+            path = path.strip()
+            entries.append((path if os.path.isabs(path) else os.path.join(base, path), patient_id.strip() or None))
+    return entries
+
+def iter_inputs(sources, recursive=False):
+    seen = set()
+    for src in sources:
+        if os.path.isdir(src):
+            if recursive:
+                candidates = []
+                for root, dirs, files in os.walk(src):
+                    dirs.sort()
+                    candidates.extend(os.path.join(root, f) for f in sorted(files))
+            else:
+                candidates = [os.path.join(src, f) for f in sorted(os.listdir(src))]
+        elif glob.has_magic(src):
+            candidates = sorted(glob.glob(src, recursive=True))
+        else:
+            candidates = [src]
+        for path in candidates:
+            if not os.path.isfile(path) or not _is_supported(path):
+                continue
+            path = os.path.abspath(path)
+            if path in seen:
+                continue
+            seen.add(path)
+            yield path
+
+# -------------------------
+# Worker
+# -------------------------
+_worker_cache = None
+_worker_clarity = DEFAULT_CLARITY
+_worker_trace = False
+_worker_profile_dir = None
+_worker_layout = False
+_worker_dedupe = None
+_worker_reuse_scans = False
+
+def _init_worker(cache_dir, clarity=DEFAULT_CLARITY, trace=False, profile_dir=None, layout=False, dedupe_dir=None,
+                 reuse_scans=False):
+    global _worker_cache, _worker_clarity, _worker_trace, _worker_profile_dir, _worker_layout, _worker_dedupe, \
+        _worker_reuse_scans
+    _worker_clarity = clarity
+    _worker_layout = layout
+    _worker_trace = trace
+    _worker_profile_dir = profile_dir
+    _worker_reuse_scans = reuse_scans
+    if cache_dir:
+        # the shared disk tier does the heavy lifting; keep the per-process memory tier small
+        _worker_cache = ResultCache(max_memory_bytes=8 * 1024 * 1024, disk_dir=cache_dir)
+    if dedupe_dir:
+        # workers only look up; the main process adds each finished report (see run_batch)
+        from dedupe import DedupeIndex
+        _worker_dedupe = DedupeIndex(dedupe_dir, readonly=True)
+
+def _failed(path, exc):
+    return {'source': path, 'kind': None, 'basic': {}, 'results': [], 'summary': '', 'abnormal_count': 0,
+            'error': f"{type(exc).__name__}: {exc}"}
+
+def _link(match):
+    return {'source': match['source'], 'cache_key': match['cache_key'], 'match': match['match'],
+            'distance': match['distance']}
+
+def _find_duplicate(data, path):
+    # (fingerprint, link, reused report) for one file, before anything is extracted. Exact
+    # copies are linked always; rescans only with reuse_scans, since a page-hash match
+    # cannot tell a rescan from another report on the same template.
+    from dedupe import add_page_hashes, file_fingerprint, settings_text
+    kind = detect_kind(os.path.basename(path))
+    fp = file_fingerprint(data, kind)
+    if kind is None:
+        return fp, None, None
+    settings = report_settings(kind, _worker_clarity, _worker_layout)
+    fp['cache_key'], fp['settings'] = cache_key(data, **settings), settings
+    match = _worker_dedupe.find_exact(fp['sha256'])
+    if match is not None and match['source'] == path:
+        # the same file again (a re-run): not a duplicate; the result cache covers it
+        return fp, None, None
+    if match is None:
+        add_page_hashes(fp, data)
+        if _worker_reuse_scans:
+            match = _worker_dedupe.find_similar_pages(fp['images'])
+    if match is None:
+        return fp, None, None
+    cached = None
+    if _worker_cache is not None and match['settings'] == settings_text(settings):
+        cached = _worker_cache.get(match['cache_key'])
+    if cached is None:
+        # nothing to reuse: analyze it; only an exact copy is still known to be a duplicate
+        return fp, (_link(match) if match['match'] == 'exact' else None), None
+    report = dict(cached, cached=True, timings={}, duplicate_of=_link(match))
+    report.pop('trace', None)
+    if _worker_trace:
+        report['trace'] = []
+    return fp, report['duplicate_of'], report
+
+def _record_text(report, fp, link, path, earlier):
+    # after extraction: the text fingerprint, and a link to an earlier report with the same
+    # text, in the index or earlier in this chunk (earlier: [(fingerprint, path)], not indexed yet)
+    from dedupe import add_text_fingerprint, compare
+    if report.get('error'):
+        return
+    add_text_fingerprint(fp, report.get('raw_text'), report.get('basic'))
+    if link is None:
+        # reports finished while this one was being extracted are indexed by now
+        _worker_dedupe.refresh()
+        match = _worker_dedupe.find_similar_text(fp['text'], fp['digest'], sha256=fp['sha256'])
+        link = _link(match) if match is not None else None
+    for other, other_path in earlier if link is None else ():
+        found = compare(fp, other)
+        if found is not None:
+            link = {'source': other_path, 'cache_key': other.get('cache_key'), 'match': found[0],
+                    'distance': found[1]}
+            break
+    if link is not None:
+        report['duplicate_of'] = link
+    report['fingerprint'] = fp
+    earlier.append((fp, path))
+
+def analyze_paths(paths):
+    # one task = a chunk of files, so each worker round trip carries several reports
+    items, readable, reports, found = [], [], {}, {}
+    if _worker_dedupe is not None:
+        # see reports the main process indexed since the last chunk (e.g. earlier in this run)
+        _worker_dedupe.refresh()
+    for path in paths:
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+        except OSError as exc:
+            reports[path] = _failed(path, exc)
+            continue
+        if _worker_dedupe is not None:
+            fp, link, duplicate = _find_duplicate(data, path)
+            found[path] = (fp, link)
+            if duplicate is not None:
+                reports[path] = dict(duplicate, source=path)
+                continue
+        items.append((data, os.path.basename(path), None))
+        readable.append(path)
+    try:
+        # files are already spread over the pool, so each one is extracted single-process
+        with capture(profile=_worker_profile_dir is not None) as cap:
+            analyzed = analyze_many(items, cache=_worker_cache, workers=1, clarity=_worker_clarity, catch_errors=True,
+                                    trace=_worker_trace, layout=_worker_layout)
+        if cap.profile is not None:
+            # one file per chunk; merge with pstats.Stats(*paths)
+            cap.profile.dump_stats(os.path.join(_worker_profile_dir, f"chunk-{os.getpid()}-{time.monotonic_ns()}.prof"))
+    except Exception as exc:
+        if len(paths) == 1:
+            return [_failed(paths[0], exc)]
+        # isolate the file that broke the shared pass
+        return [analyze_path(p) for p in paths]
+    for path, report in zip(readable, analyzed):
+        report['source'] = path
+        reports[path] = report
+    earlier = []
+    for path in paths:
+        # in input order, so within a chunk a copy links to the file listed before it
+        if path in found:
+            _record_text(reports[path], *found[path], path, earlier)
+        reports[path].pop('raw_text', None)
+    return [reports[p] for p in paths]
+
+def analyze_path(path):
+    return analyze_paths([path])[0]
+
+def stream_path(path):
+    # bounded-memory variant for very long reports: pages are read and interpreted as they come
+    report = {'source': path, 'kind': None, 'basic': {}, 'results': [], 'summary': '', 'abnormal_count': 0,
+              'error': None, 'work': {}}
+    try:
+        with open(path, 'rb') as fh:
+            for event, payload in analyze_stream(fh, os.path.basename(path), clarity=_worker_clarity):
+                if event == 'basic':
+                    report['basic'] = payload
+                elif event == 'results':
+                    report['results'].extend(payload)
+                elif event == 'revised':
+                    report['results'][:len(payload)] = payload
+                else:
+                    report['work'] = {STAGE_EXTRACT: payload['pages'], STAGE_PARSE: payload['lines'],
+                                      STAGE_INTERPRET: payload['tests']}
+    except Exception as exc:
+        return dict(_failed(path, exc), results=report['results'])
+    report['summary'], abnormals = build_summary_and_abnormals(report['results'])
+    report['abnormal_count'] = len(abnormals)
+    return report
+
+def stream_paths(paths):
+    return [stream_path(p) for p in paths]
+
+# -------------------------
+# Checkpoints & writers
+# -------------------------
+class Checkpoint:
+    # Each line records a finished report and the size of the output file once that report
+    # was written. Output is written first, so after a crash the output may hold reports the
+    # checkpoint does not; resuming truncates the output back to `offset` and redoes them.
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.offset = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                for ln in fh:
+                    try:
+                        entry = json.loads(ln)
+                        self.done.add(entry['source'])
+                    except (ValueError, KeyError):
+                        # a torn last line from a crash; that report is simply redone
+                        continue
+                    self.offset = entry.get('offset', self.offset)
+        self._fh = open(path, 'a', encoding="utf-8")
+
+    def __contains__(self, source):
+        return source in self.done
+
+    def mark(self, report, offset=None):
+        self.done.add(report['source'])
+        entry = {'source': report['source'], 'error': report.get('error')}
+        if offset is not None:
+            entry['offset'] = offset
+        self._fh.write(json.dumps(entry) + "\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def close(self):
+        self._fh.close()
+
+CSV_FIELDS = ['source', 'name', 'age', 'sex', 'report_date', 'test', 'value', 'unit', 'flag', 'note', 'reference',
+              'original_value', 'original_unit', 'duplicate_of', 'error']
+
+def _output_offset(fh):
+    # bytes written so far, for the checkpoint; None for pipes and terminals
+    try:
+        return fh.tell() if fh.seekable() else None
+    except (OSError, ValueError):
+        return None
+
+class JsonlWriter:
+    def __init__(self, fh):
+        self.fh = fh
+
+    def tell(self):
+        return _output_offset(self.fh)
+
+    def write(self, report):
+        self.fh.write(json.dumps(report, ensure_ascii=False, default=str) + "\n")
+        self.fh.flush()
+
+class CsvWriter:
+    def __init__(self, fh, write_header=True):
+        self.fh = fh
+        self.writer = csv.DictWriter(fh, fieldnames=CSV_FIELDS)
+        if write_header:
+            self.writer.writeheader()
+
+    def tell(self):
+        return _output_offset(self.fh)
+
+    def write(self, report):
+        basic = report.get('basic') or {}
+        base = {
+            'source': report.get('source'),
+            'name': basic.get('Name', ''),
+            'age': basic.get('Age', ''),
+            'sex': basic.get('Sex', ''),
+            'report_date': basic.get('Report Date', ''),
+            'duplicate_of': (report.get('duplicate_of') or {}).get('source') or '',
+            'error': report.get('error') or '',
+        }
+        results = report.get('results') or []
+        if not results:
+            self.writer.writerow(base)
+        for r in results:
+            row = dict(base)
+            row.update({
+                'test': r.get('Test'),
+                'value': r.get('Value'),
+                'unit': r.get('Unit', ''),
+                'flag': r.get('Flag') or '',
+                'note': r.get('Note', ''),
+                'reference': r.get('Reference', ''),
+                'original_value': r.get('Original Value'),
+                'original_unit': r.get('Original Unit') or '',
+            })
+            self.writer.writerow(row)
+        self.fh.flush()
+
+def make_writer(fh, fmt, write_header=True):
+    if fmt == 'csv':
+        return CsvWriter(fh, write_header=write_header)
+    return JsonlWriter(fh)
+
+# -------------------------
+# Engine
+# -------------------------
+# files per worker task; small enough to stream, large enough to amortize the round trip to the pool
+DEFAULT_CHUNK_SIZE = 16
+
+def run_batch(paths, writer, workers=None, checkpoint=None, on_result=None, cache_dir=None, clarity=DEFAULT_CLARITY,
+              chunk_size=DEFAULT_CHUNK_SIZE, trace=False, profile_dir=None, stream=False, layout=False,
+              dedupe_dir=None, reuse_scans=False):
+    workers = workers or os.cpu_count() or 1
+    if stream and dedupe_dir:
+        raise ValueError("duplicate detection needs the cached pipeline; it does not work with stream=True")
+    task = stream_paths if stream else analyze_paths
+    pending_paths = [p for p in paths if checkpoint is None or p not in checkpoint]
+    stats = {'total': len(pending_paths), 'done': 0, 'failed': 0, 'duplicates': 0}
+    index = None
+    if dedupe_dir:
+        # created here, before the workers open it read-only
+        from dedupe import DedupeIndex
+        index = DedupeIndex(dedupe_dir)
+    chunks = iter([pending_paths[i:i + chunk_size] for i in range(0, len(pending_paths), chunk_size)])
+    initargs = (cache_dir, clarity, trace, profile_dir, layout, dedupe_dir, reuse_scans)
+    try:
+        _run_pool(task, chunks, workers, initargs, writer, checkpoint, on_result, stats, index)
+    finally:
+        if index is not None:
+            index.close()
+    return stats
+
+def _run_pool(task, chunks, workers, initargs, writer, checkpoint, on_result, stats, index):
+    # keep a bounded window of submitted work so results stream out as they finish
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        in_flight = set()
+        for chunk in chunks:
+            in_flight.add(pool.submit(task, chunk))
+            if len(in_flight) >= window:
+                break
+        while in_flight:
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                for report in fut.result():
+                    fp = report.pop('fingerprint', None)
+                    if index is not None and fp is not None:
+                        index.add(fp, report['source'], fp.get('cache_key'), fp.get('settings'))
+                    writer.write(report)
+                    if checkpoint is not None:
+                        checkpoint.mark(report, offset=writer.tell())
+                    stats['done'] += 1
+                    if report.get('error'):
+                        stats['failed'] += 1
+                    if report.get('duplicate_of'):
+                        stats['duplicates'] += 1
+                    if on_result:
+                        on_result(report, stats)
+                nxt = next(chunks, None)
+                if nxt is not None:
+                    in_flight.add(pool.submit(task, nxt))
+
+# -------------------------
+# CLI
+# -------------------------
+def build_parser():
+    parser = argparse.ArgumentParser(description="Analyze medical reports in bulk (PDF / JPG / PNG / TXT).")
+    parser.add_argument('sources', nargs='*', help="files, directories or glob patterns")
+    parser.add_argument('-m', '--manifest', action='append', default=[], help="text file listing one report path per line, optionally followed by a tab and the patient ID")
+    parser.add_argument('-r', '--recursive', action='store_true', help="descend into sub-directories")
+    parser.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    parser.add_argument('-f', '--format', choices=['jsonl', 'csv'], help="output format (default: from output extension, else jsonl)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: number of CPU cores)")
+    parser.add_argument('-c', '--checkpoint', help="checkpoint file; finished reports are skipped when re-run")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="files per worker task (default: %(default)s)")
+    parser.add_argument('--clarity', type=int, default=DEFAULT_CLARITY, help="OCR clean-up level, 50-100 (default: %(default)s)")
+    parser.add_argument('--cache-dir', help="on-disk result cache shared by workers and across runs")
+    parser.add_argument('--layout', action='store_true', help="read PDF / image tables cell by cell from word positions (keeps printed reference ranges)")
+    parser.add_argument('--dedupe-index', metavar='DIR', help="duplicate index: exact and near copies of reports already seen link to the earlier analysis (reused from --cache-dir, which it needs)")
+    parser.add_argument('--reuse-similar-scans', action='store_true', help="with --dedupe-index, also skip OCR for scans whose page images match an earlier scan (can confuse reports on the same template)")
+    parser.add_argument('--stream', action='store_true', help="read and interpret each report page by page (bounded memory; no cache, traces or profiles)")
+    parser.add_argument('--store', help="also append results to this patient history database (SQLite)")
+    parser.add_argument('--patient-id', help="with --store, file every report under this patient ID (manifest IDs take precedence)")
+    parser.add_argument('--trace', action='store_true', help="attach per-stage traces (time, CPU, bytes, pages, lines) to each report")
+    parser.add_argument('--metrics', help="write Prometheus-style metrics to this file when done")
+    parser.add_argument('--profile-dir', help="write a cProfile dump per worker task into this directory")
+    parser.add_argument('-q', '--quiet', action='store_true', help="no progress on stderr")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sources = list(args.sources)
+    patient_ids = {}
+    for manifest in args.manifest:
+        for path, patient_id in read_manifest(manifest):
+            sources.append(path)
+            if patient_id:
+                patient_ids[os.path.abspath(path)] = patient_id
+    if not sources:
+        build_parser().error("no input given")
+    if args.dedupe_index and not args.cache_dir:
+        # a duplicate links to the earlier analysis through the cache; without one every copy is analyzed again
+        build_parser().error("--dedupe-index needs --cache-dir")
+    if args.dedupe_index and args.stream:
+        build_parser().error("--dedupe-index does not work with --stream")
+    if args.reuse_similar_scans and not args.dedupe_index:
+        build_parser().error("--reuse-similar-scans needs --dedupe-index")
+    if args.patient_id and not args.store:
+        build_parser().error("--patient-id needs --store")
+    paths = list(iter_inputs(sources, recursive=args.recursive))
+    fmt = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+
+    metrics = Metrics() if args.metrics else None
+    store = None
+    if args.store:
+        from store import ResultStore
+        store = ResultStore(args.store)
+    if args.profile_dir:
+        os.makedirs(args.profile_dir, exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    if args.output == '-':
+        out, write_header = sys.stdout, True
+    else:
+        # resuming appends to the previous output instead of truncating it
+        append = checkpoint is not None and bool(checkpoint.done) and os.path.exists(args.output)
+        if append and checkpoint.offset is not None and os.path.getsize(args.output) > checkpoint.offset:
+            # reports written after the last checkpoint entry are redone; drop their rows
+            os.truncate(args.output, checkpoint.offset)
+        write_header = not (append and os.path.getsize(args.output) > 0)
+        out = open(args.output, 'a' if append else 'w', encoding="utf-8", newline='')
+
+    def on_result(report, stats):
+        if metrics is not None:
+            metrics.observe_report(report)
+        if store is not None and not report.get('error'):
+            # without an ID the store matches patients by name, sex and age; it skips reports it already has
+            store.add_report(report, patient_id=patient_ids.get(report['source']) or args.patient_id)
+        if not args.quiet:
+            status = "failed" if report.get('error') else "ok"
+            if report.get('error'):
+                detail = report['error']
+            elif report.get('duplicate_of'):
+                dup = report['duplicate_of']
+                detail = f"{dup['match']} duplicate of {dup['source']}" + (", cached" if report.get('cached') else "")
+            elif report.get('cached'):
+                detail = "cached"
+            else:
+                detail = ", ".join(f"{stage} {n}" for stage, n in (report.get('work') or {}).items())
+            print(f"[{stats['done']}/{stats['total']}] {status} {report['source']} ({detail})", file=sys.stderr)
+
+    try:
+        stats = run_batch(paths, make_writer(out, fmt, write_header), workers=args.workers,
+                          checkpoint=checkpoint, on_result=on_result, cache_dir=args.cache_dir,
+                          clarity=args.clarity, chunk_size=args.chunk_size,
+                          trace=args.trace or metrics is not None, profile_dir=args.profile_dir,
+                          stream=args.stream, layout=args.layout, dedupe_dir=args.dedupe_index,
+                          reuse_scans=args.reuse_similar_scans)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if checkpoint is not None:
+            checkpoint.close()
+        if store is not None:
+            store.close()
+    if metrics is not None:
+        with open(args.metrics, 'w', encoding="utf-8") as fh:
+            fh.write(metrics.render())
+    if not args.quiet:
+        duplicates = f", {stats['duplicates']} duplicate(s)" if args.dedupe_index else ""
+        print(f"Analyzed {stats['done']} report(s), {stats['failed']} failed{duplicates}.", file=sys.stderr)
+    return 1 if stats['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Benchmark: duplicate-index lookups at scale.
+
+    python benchmarks/bench_dedupe.py [--docs 1000000] [--pages 2] [--lookups 2000] [--dir /tmp/idx]
+
+Fills a fresh dedupe.DedupeIndex with --docs synthetic documents (random SHA-256, one text
+SimHash and --pages page hashes each), then times exact, text and page lookups for
+indexed near-copies (hits) and for random fingerprints (misses). Prints p50/p95 latency
+per lookup kind and the on-disk size.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dedupe  # noqa: E402
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def _flip(value, bits, rng):
+    for b in rng.sample(range(64), bits):
+        value ^= 1 << b
+    return value
+
+def _fingerprint(i, pages, rng):
+    return {'sha256': f"{i:064x}", 'pages': pages, 'text': rng.getrandbits(64), 'digest': f"d{i}",
+            'images': [rng.getrandbits(64) for _ in range(pages)]}
+
+def fill(index, docs, pages, seed, batch=20000):
+    rng = random.Random(seed)
+    t0 = time.perf_counter()
+    for start in range(0, docs, batch):
+        index.add_many([(_fingerprint(i, pages, rng), f"doc{i}", None, None)
+                        for i in range(start, min(docs, start + batch))])
+    return time.perf_counter() - t0
+
+def time_lookups(index, docs, pages, lookups, seed):
+    # regenerate a sample of the indexed fingerprints, perturb them, and look them up
+    rng = random.Random(seed)
+    sample = set(random.Random(seed + 1).sample(range(docs), min(lookups, docs)))
+    originals = []
+    for i in range(docs):
+        fp = _fingerprint(i, pages, rng)
+        if i in sample:
+            originals.append(fp)
+    miss = random.Random(seed + 2)
+    cases = {
+        'exact hit': lambda fp: index.find_exact(fp['sha256']),
+        'exact miss': lambda fp: index.find_exact(f"{miss.getrandbits(256):064x}"),
+        'text hit': lambda fp: index.find_similar_text(_flip(fp['text'], 3, miss), fp['digest']),
+        'text miss': lambda fp: index.find_similar_text(miss.getrandbits(64), fp['digest']),
+        'pages hit': lambda fp: index.find_similar_pages([_flip(v, 2, miss) for v in fp['images']]),
+        'pages miss': lambda fp: index.find_similar_pages([miss.getrandbits(64) for _ in fp['images']]),
+    }
+    results = {}
+    for name, fn in cases.items():
+        times, found = [], 0
+        for fp in originals:
+            t0 = time.perf_counter()
+            match = fn(fp)
+            times.append(time.perf_counter() - t0)
+            found += match is not None
+        times.sort()
+        results[name] = (percentile(times, 0.5), percentile(times, 0.95), found, len(originals))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=1000000, help="documents to index (default: %(default)s)")
+    parser.add_argument('--pages', type=int, default=2, help="page hashes per document (default: %(default)s)")
+    parser.add_argument('--lookups', type=int, default=2000, help="lookups per kind (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--dir', help="index directory (default: a temporary one, removed afterwards)")
+    args = parser.parse_args(argv)
+
+    path = args.dir or tempfile.mkdtemp(prefix="dedupe-bench-")
+    try:
+        index = dedupe.DedupeIndex(path)
+        seconds = fill(index, args.docs, args.pages, args.seed)
+        index.compact()
+        print(f"indexed {args.docs} documents / {len(index)} fingerprints in {seconds:.1f}s")
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        print(f"index size {size / 2**20:.0f} MiB")
+        print(f"{'lookup':<14}{'p50':>10}{'p95':>10}   found")
+        for name, (p50, p95, found, total) in time_lookups(index, args.docs, args.pages, args.lookups,
+                                                           args.seed).items():
+            print(f"{name:<14}{p50 * 1e3:>8.3f}ms{p95 * 1e3:>8.3f}ms   {found}/{total}")
+        index.close()
+    finally:
+        if not args.dir:
+            shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Microbenchmark: compiled lab-line parser vs. the original four-regex implementation.
+
+    python benchmarks/bench_parser.py [--pages 200] [--repeat 5]
+
+Checks that both produce identical results on a synthetic multi-page report,
+then prints lines/sec for each.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import parse_lab_lines  # noqa: E402
+
+# -------------------------
+# Reference implementation (parse_lab_lines before the compiled parser)
+# -------------------------
+def legacy_parse_lab_lines(text):
+    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+    tests = []
+    for ln in lines:
+        ln_clean = re.sub(r'\s{2,}', ' ', ln)
+        qual_match = re.search(r'\b(HBsAg|HBs Ag|HBs|VDRL|V\.D\.R\.L|V D R L|HCV|H\.C\.V|Tri[- ]Dot|H\.B & H\.B|H\.B & H\.B s Ag)\b.*?[:\-]?\s*([A-Za-z \-\(\)0-9/:]+)', ln_clean, re.IGNORECASE)
+        if qual_match:
+            tests.append({'name': qual_match.group(1).strip(), 'value_raw': qual_match.group(2).strip(), 'type': 'qualitative', 'line': ln_clean})
+            continue
+        num_match = re.search(r'([A-Za-z .%()&/-]{3,50})\s+(:\s*)?(-?\d{1,3}\.?\d+)\s*([A-Za-z/%µμlhL]*)', ln_clean)
+        if num_match:
+            tests.append({'name': num_match.group(1).strip(), 'value_raw': num_match.group(3).strip(), 'unit': num_match.group(4).strip(), 'type': 'numeric', 'line': ln_clean})
+            continue
+        num_match2 = re.search(r'([A-Za-z .]{2,40})\s+[:\-]?\s*(\d{2,7}\.?\d*)\s*(?:/|per)?\s*([A-Za-z/%µμlhL]*)', ln_clean)
+        if num_match2:
+            tests.append({'name': num_match2.group(1).strip(), 'value_raw': num_match2.group(2).strip(), 'unit': num_match2.group(3).strip(), 'type': 'numeric', 'line': ln_clean})
+            continue
+        qual_inline = re.search(r'([A-Za-z .&/()-]{3,40})\s*[:\-]?\s*(Negative|Positive|Reactive|Non\s*-\s*Reactive|Non\s*Reactive|Non-Reactive|Not detected|Detected)', ln_clean, re.IGNORECASE)
+        if qual_inline:
+            tests.append({'name': qual_inline.group(1).strip(), 'value_raw': qual_inline.group(2).strip(), 'type': 'qualitative', 'line': ln_clean})
+    return tests
+
+# -------------------------
+# Synthetic report
+# -------------------------
+LAB_LINES = [
+    "Hemoglobin {v:.1f} g/dL   13.0 - 17.0",
+    "Total WBC Count   {i} /cumm",
+    "Platelet Count : {v:.1f} lakhs/cumm",
+    "R.B.C Count {v:.2f} million/cumm",
+    "E.S.R (Westergren) {i2} mm/hr",
+    "Fasting Blood Glucose   {i3} mg/dL",
+    "Serum Creatinine : {v:.2f} mg/dL",
+    "HBsAg : Non Reactive",
+    "V.D.R.L   Negative",
+    "HCV Tri-Dot : Non - Reactive",
+    "Urine sugar   Not detected",
+]
+NOISE_LINES = [
+    "Patient Name: John Doe   Age: 45   Sex: Male",
+    "Date: 12/03/2024    Ref. by Dr. Rao",
+    "*** End of report ***",
+    "Page {i2} of 200",
+    "Sample collected at 08:30 AM",
+]
+
+def garbage_line(rng, length):
+    alphabet = "abcdefghijklmnopqrstuvwxyz .,;:|/-()'\"0123456789"
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+def make_report(pages, lines_per_page=60, seed=7):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(pages):
+        for _ in range(lines_per_page):
+            r = rng.random()
+            fields = {'v': rng.uniform(0.5, 20), 'i': rng.randint(2000, 20000), 'i2': rng.randint(1, 99), 'i3': rng.randint(60, 300)}
+            if r < 0.6:
+                out.append(rng.choice(LAB_LINES).format(**fields))
+            elif r < 0.85:
+                out.append(rng.choice(NOISE_LINES).format(**fields))
+            elif r < 0.97:
+                out.append(garbage_line(rng, rng.randint(20, 120)))
+            else:
+                # long OCR garbage lines are where backtracking patterns hurt
+                out.append(garbage_line(rng, rng.randint(400, 1500)))
+        out.append("")
+    return "\n".join(out)
+
+def bench(fn, text, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    text = make_report(args.pages)
+    n_lines = sum(1 for ln in text.splitlines() if ln.strip())
+    if parse_lab_lines(text) != legacy_parse_lab_lines(text):
+        print("MISMATCH: compiled parser disagrees with the reference implementation", file=sys.stderr)
+        return 1
+    legacy = bench(legacy_parse_lab_lines, text, args.repeat)
+    current = bench(parse_lab_lines, text, args.repeat)
+    print(f"{n_lines} lines ({args.pages} pages), best of {args.repeat}")
+    print(f"  legacy   {n_lines / legacy:12,.0f} lines/s  ({legacy * 1000:.1f} ms)")
+    print(f"  compiled {n_lines / current:12,.0f} lines/s  ({current * 1000:.1f} ms)  x{legacy / current:.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""Benchmark suite: throughput, p50/p95 latency and peak memory per pipeline stage.
+
+    python benchmarks/bench_suite.py [--pages 20] [--repeat 20] [--json out.json]
+    python benchmarks/bench_suite.py --against HEAD~1 [--threshold 0.10]
+
+Every stage runs on the same synthetic corpus (benchmarks/corpus.py). With --against,
+the suite also runs on REV (checked out into a temporary git worktree, measured with
+this copy of the suite) and prints the ratio per stage; a p50 slowdown beyond
+--threshold exits with status 1. Stages a revision does not have are skipped.
+Revisions from before pipeline.py are measured through the functions in their app.py;
+a revision that has neither is reported as not comparable (exit status 0).
+"""
+import argparse
+import ast
+import gc
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from io import BytesIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+from corpus import make_report_lines, render_pdf, render_png, render_txt  # noqa: E402
+
+# -------------------------
+# Measurement
+# -------------------------
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float('nan')
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def measure(fn, units, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    gc.collect()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    # peak memory from one extra, traced run; tracing slows the code, so it is not timed
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    p50 = percentile(times, 0.5)
+    return {'units': units, 'repeat': repeat, 'p50': p50, 'p95': percentile(times, 0.95),
+            'mean': sum(times) / len(times), 'throughput': units[0] / p50 if p50 else float('inf'),
+            'peak_kib': peak / 1024}
+
+def _call(fn, *args, **kwargs):
+    # older revisions lack some keyword arguments (e.g. workers=); pass only what they accept
+    params = inspect.signature(fn).parameters
+    if not any(p.kind == p.VAR_KEYWORD for p in params.values()):
+        kwargs = {k: v for k, v in kwargs.items() if k in params}
+    return fn(*args, **kwargs)
+
+def _tesseract_available():
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+# -------------------------
+# Stages
+# -------------------------
+def build_cases(pipeline, pages, noise):
+    # returns [(stage, (units, unit name), fn)]; a stage is left out when this revision lacks it
+    content = make_report_lines(pages=pages, lines_per_page=40, noise=noise, seed=1)
+    txt = render_txt(content)
+    pdf = render_pdf(content)
+    text = txt.decode("utf-8")
+    n_lines = sum(1 for lines in content for ln in lines if ln.strip())
+    cases = [('parse', (n_lines, 'lines'), lambda: pipeline.parse_lab_lines(text))]
+    tests = pipeline.parse_lab_lines(text)
+    basic = pipeline.find_basic_fields(text)
+    names = [t['name'] for t in tests]
+    cases.append(('map_test_name', (len(names), 'names'), lambda: [pipeline.map_test_name(n) for n in names]))
+    cases.append(('interpret', (len(tests), 'tests'), lambda: pipeline.interpret_tests(tests, basic)))
+    cases.append(('extract_pdf', (pages, 'pages'),
+                  lambda: _call(pipeline.extract_text_from_pdf, BytesIO(pdf), workers=1)))
+    if hasattr(pipeline, 'analyze_bytes'):
+        cases.append(('analyze_txt', (1, 'reports'), lambda: pipeline.analyze_bytes(txt, "report.txt")))
+        cases.append(('analyze_pdf', (1, 'reports'), lambda: _call(pipeline.analyze_bytes, pdf, "report.pdf", workers=1)))
+        if 'layout' in inspect.signature(pipeline.analyze_bytes).parameters:
+            cases.append(('analyze_pdf_layout', (1, 'reports'),
+                          lambda: pipeline.analyze_bytes(pdf, "report.pdf", workers=1, layout=True)))
+    if _tesseract_available():
+        png = render_png(content[0], noise=noise, seed=1)
+        cases.append(('ocr_png', (1, 'pages'), lambda: _call(pipeline.extract_text_from_image, BytesIO(png), workers=1)))
+    return cases
+
+def _uses_streamlit(node):
+    return any(isinstance(n, ast.Name) and n.id == 'st' for n in ast.walk(node))
+
+def _app_functions(path):
+    # app.py of revisions before pipeline.py: its imports, constants and functions, without
+    # the Streamlit UI that runs at module level
+    with open(path, encoding="utf-8") as fh:
+        tree = ast.parse(fh.read(), path)
+    keep = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if not any(alias.name.split('.')[0] == 'streamlit' for alias in node.names) and \
+                    not (isinstance(node, ast.ImportFrom) and (node.module or '').startswith('streamlit')):
+                keep.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            keep.append(node)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)) and not _uses_streamlit(node):
+            keep.append(node)
+    module = types.ModuleType('pipeline')
+    module.__file__ = path
+    exec(compile(ast.Module(body=keep, type_ignores=[]), path, 'exec'), module.__dict__)
+    return module
+
+def load_pipeline(repo_dir):
+    # the revision's pipeline module, or None when it has nothing the suite can measure
+    sys.path.insert(0, repo_dir)
+    os.chdir(repo_dir)
+    if os.path.exists(os.path.join(repo_dir, 'pipeline.py')):
+        import pipeline
+        return pipeline
+    app = os.path.join(repo_dir, 'app.py')
+    if not os.path.exists(app):
+        return None
+    try:
+        module = _app_functions(app)
+    except Exception as exc:
+        print(f"app.py: cannot load its functions ({type(exc).__name__}: {exc})", file=sys.stderr)
+        return None
+    return module if hasattr(module, 'parse_lab_lines') else None
+
+def run_suite(repo_dir, pages, repeat, noise, only=None):
+    # None when the revision cannot be measured
+    pipeline = load_pipeline(repo_dir)
+    if pipeline is None:
+        return None
+    results = {}
+    for stage, units, fn in build_cases(pipeline, pages, noise):
+        if only and stage not in only:
+            continue
+        try:
+            results[stage] = measure(fn, units, repeat)
+        except Exception as exc:
+            # e.g. an old revision's OCR stage without Tesseract; the others are still compared
+            print(f"{stage}: skipped ({type(exc).__name__}: {exc})", file=sys.stderr)
+    return results
+
+def _revision(repo_dir):
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=repo_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# -------------------------
+# Comparison
+# -------------------------
+def run_against(rev, args):
+    # measure REV in a throwaway worktree, in a fresh interpreter so imports don't mix
+    with tempfile.TemporaryDirectory() as tmp:
+        worktree = os.path.join(tmp, "rev")
+        added = subprocess.run(['git', 'worktree', 'add', '--detach', worktree, rev], cwd=REPO_DIR,
+                               capture_output=True, text=True)
+        if added.returncode:
+            raise SystemExit(f"--against {rev}: {added.stderr.strip() or 'git worktree add failed'}")
+        try:
+            out = os.path.join(tmp, "rev.json")
+            cmd = [sys.executable, os.path.abspath(__file__), '--repo', worktree, '--pages', str(args.pages),
+                   '--repeat', str(args.repeat), '--noise', str(args.noise), '--json', out, '--quiet']
+            if args.only:
+                cmd += ['--only', args.only]
+            subprocess.run(cmd, check=True)
+            with open(out, encoding="utf-8") as fh:
+                return json.load(fh)
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=REPO_DIR, capture_output=True)
+
+def compare(base, current, threshold):
+    # returns the stages whose p50 got slower than base by more than threshold
+    if base['results'] is None:
+        print(f"\nnot comparable: {base['revision'] or 'the base revision'} has neither pipeline.py nor "
+              f"usable functions in app.py")
+        return []
+    print(f"\n{'stage':<20}{'base p50':>12}{'p50':>12}{'ratio':>9}   (base: {base['revision']})")
+    regressions = []
+    for stage, cur in current['results'].items():
+        old = base['results'].get(stage)
+        if old is None:
+            print(f"{stage:<20}{'-':>12}{cur['p50'] * 1000:>10.2f}ms{'new':>9}")
+            continue
+        ratio = cur['p50'] / old['p50'] if old['p50'] else float('inf')
+        mark = ""
+        if ratio > 1 + threshold:
+            regressions.append(stage)
+            mark = "  REGRESSION"
+        print(f"{stage:<20}{old['p50'] * 1000:>10.2f}ms{cur['p50'] * 1000:>10.2f}ms{ratio:>8.2f}x{mark}")
+    return regressions
+
+def print_results(report):
+    print(f"{report['revision'] or '?'} · python {report['python']} · {report['pages']} pages, "
+          f"{report['repeat']} runs per stage")
+    print(f"{'stage':<20}{'throughput':>20}{'p50':>11}{'p95':>11}{'peak mem':>12}")
+    for stage, r in report['results'].items():
+        n, unit = r['units']
+        print(f"{stage:<20}{r['throughput']:>14,.0f} {unit + '/s':<9}{r['p50'] * 1000:>7.2f}ms"
+              f"{r['p95'] * 1000:>9.2f}ms{r['peak_kib']:>9,.0f}KiB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20, help="pages in the synthetic report (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=20, help="timed runs per stage (default: %(default)s)")
+    parser.add_argument('--noise', type=float, default=0.05, help="corpus noise level (default: %(default)s)")
+    parser.add_argument('--only', help="comma-separated stages to run")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--against', metavar='REV', help="git revision to compare with")
+    parser.add_argument('--threshold', type=float, default=0.10, help="p50 slowdown that counts as a regression (default: %(default)s)")
+    parser.add_argument('--repo', default=REPO_DIR, help=argparse.SUPPRESS)
+    parser.add_argument('--quiet', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    base = run_against(args.against, args) if args.against else None
+    only = set(args.only.split(',')) if args.only else None
+    report = {'revision': _revision(args.repo), 'python': platform.python_version(), 'pages': args.pages,
+              'repeat': args.repeat, 'noise': args.noise,
+              'results': run_suite(args.repo, args.pages, args.repeat, args.noise, only)}
+    if args.json:
+        with open(args.json, 'w', encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    if report['results'] is None:
+        if not args.quiet:
+            print(f"{args.repo}: nothing to measure (no pipeline.py or app.py functions)")
+        return 0
+    if not args.quiet:
+        print_results(report)
+    if base is not None:
+        if compare(base, report, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
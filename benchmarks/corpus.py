@@ -0,0 +1,183 @@
+"""Synthetic lab-report corpus: TXT, text-layer PDF and rasterized PNG.
+
+    python benchmarks/corpus.py OUT_DIR [--reports 20] [--pages 2] [--noise 0.1]
+                                [--analytes Hemoglobin,WBC,...] [--formats txt,pdf,png]
+
+Reports are deterministic for a given seed. Noise mixes in OCR-style character
+swaps, garbage lines and (for PNG) speckle and a slight rotation.
+"""
+import argparse
+import os
+import random
+import sys
+from io import BytesIO
+
+# -------------------------
+# Report content
+# -------------------------
+# analyte -> (line template, low, high, decimals); values are drawn around the normal range
+LAB_TEMPLATES = {
+    'Hemoglobin': ("Hemoglobin {v} g/dL   13.0 - 17.0", 8.0, 19.0, 1),
+    'WBC': ("Total WBC Count   {v} /cumm   4000 - 11000", 2000, 20000, 0),
+    'Platelet': ("Platelet Count : {v} lakhs/cumm   1.5 - 4.5", 0.5, 6.0, 1),
+    'RBC': ("R.B.C Count {v} million/cumm", 3.0, 6.5, 2),
+    'ESR': ("E.S.R (Westergren) {v} mm/hr", 2, 60, 0),
+    'Glucose (Fasting)': ("Fasting Blood Glucose   {v} mg/dL   70 - 100", 60, 300, 0),
+    'Creatinine': ("Serum Creatinine : {v} mg/dL", 0.4, 3.0, 2),
+    'Urea': ("Blood Urea {v} mg/dL", 10, 80, 0),
+    'Total Cholesterol': ("Total Cholesterol {v} mg/dL", 120, 320, 0),
+    'Triglycerides': ("Triglycerides {v} mg/dL", 60, 400, 0),
+    'TSH': ("TSH {v} mIU/L", 0.1, 9.0, 2),
+    'ALT (SGPT)': ("SGPT (ALT) {v} U/L", 5, 120, 0),
+    'HBsAg': ("HBsAg : {q}", None, None, None),
+    'VDRL': ("V.D.R.L   {q}", None, None, None),
+    'HCV': ("HCV Tri-Dot : {q}", None, None, None),
+}
+QUALITATIVE_VALUES = ["Non Reactive", "Negative", "Reactive", "Positive", "Not detected"]
+NOISE_LINES = [
+    "Date: 12/03/2024    Ref. by Dr. Rao",
+    "Sample collected at 08:30 AM",
+    "Method: Automated analyzer",
+    "*** End of report ***",
+]
+# common OCR confusions, applied per character with probability `noise`
+OCR_SWAPS = {'l': '1', 'O': '0', 'o': '0', 'S': '5', 'B': '8', 'i': 'l', 'e': 'c'}
+PATIENTS = [("John Doe", 45, "Male"), ("Asha Verma", 32, "Female"), ("Ravi Kumar", 61, "Male"),
+            ("Meera Nair", 8, "Female")]
+
+def _value(rng, low, high, decimals):
+    v = rng.uniform(low, high)
+    return f"{v:.{decimals}f}" if decimals else str(int(v))
+
+def _garble(rng, line, noise):
+    return "".join(OCR_SWAPS.get(ch, ch) if rng.random() < noise else ch for ch in line)
+
+def make_report_lines(pages=1, lines_per_page=40, analytes=None, noise=0.0, seed=0):
+    # returns one list of lines per page; the first page opens with the patient header
+    rng = random.Random(seed)
+    analytes = list(analytes or LAB_TEMPLATES)
+    name, age, sex = PATIENTS[seed % len(PATIENTS)]
+    out = []
+    for page in range(pages):
+        lines = []
+        if page == 0:
+            lines += [f"Patient Name: {name}", f"Age: {age} Years   Sex: {sex}", "Report Date: 12/03/2024", ""]
+        while len(lines) < lines_per_page:
+            r = rng.random()
+            if r < noise / 2:
+                alphabet = "abcdefghijklmnopqrstuvwxyz .,;:|/-()0123456789"
+                lines.append("".join(rng.choice(alphabet) for _ in range(rng.randint(10, 80))))
+            elif r < 0.15:
+                lines.append(rng.choice(NOISE_LINES))
+            else:
+                template, low, high, decimals = LAB_TEMPLATES[rng.choice(analytes)]
+                if low is None:
+                    line = template.format(q=rng.choice(QUALITATIVE_VALUES))
+                else:
+                    line = template.format(v=_value(rng, low, high, decimals))
+                lines.append(_garble(rng, line, noise) if noise else line)
+        lines.append(f"Page {page + 1} of {pages}")
+        out.append(lines)
+    return out
+
+# -------------------------
+# Renderers
+# -------------------------
+def render_txt(pages):
+    return "\n\n".join("\n".join(lines) for lines in pages).encode("utf-8")
+
+def _pdf_string(text):
+    text = text.encode("latin-1", "replace")
+    return b"(" + text.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def render_pdf(pages):
+    # minimal PDF 1.4 with one Helvetica text layer per page; enough for PdfReader.extract_text
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for lines in pages:
+        ops = [b"BT /F1 10 Tf 12 TL 40 800 Td"] + [_pdf_string(ln) + b" Tj T*" for ln in lines] + [b"ET"]
+        content = b"\n".join(ops)
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % off for off in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+def render_png(lines, noise=0.0, seed=0, dpi=150):
+    # one page as a grayscale scan; noise adds speckle and up to ~1.5 degrees of skew
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(seed)
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    size = max(10, dpi // 8)
+    try:
+        font = ImageFont.load_default(size=size)
+    except TypeError:
+        font = ImageFont.load_default()
+    img = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    y = dpi // 2
+    for ln in lines:
+        draw.text((dpi // 2, y), ln, fill=0, font=font)
+        y += int(size * 1.5)
+    if noise:
+        img = img.rotate(rng.uniform(-1.5, 1.5) * noise * 5, fillcolor=255)
+        pixels = img.load()
+        for _ in range(int(width * height * noise * 0.01)):
+            pixels[rng.randrange(width), rng.randrange(height)] = rng.choice((0, 128))
+    out = BytesIO()
+    img.save(out, format="PNG", dpi=(dpi, dpi))
+    return out.getvalue()
+
+def make_corpus(reports=10, pages=1, lines_per_page=40, analytes=None, noise=0.0, formats=('txt', 'pdf', 'png'), seed=0):
+    # yields (filename, bytes); PNG reports are one image per page
+    for i in range(reports):
+        content = make_report_lines(pages, lines_per_page, analytes, noise, seed=seed + i)
+        if 'txt' in formats:
+            yield f"report_{i:04d}.txt", render_txt(content)
+        if 'pdf' in formats:
+            yield f"report_{i:04d}.pdf", render_pdf(content)
+        if 'png' in formats:
+            for p, lines in enumerate(content):
+                yield f"report_{i:04d}_p{p + 1}.png", render_png(lines, noise, seed=seed + i)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out_dir')
+    parser.add_argument('--reports', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=2)
+    parser.add_argument('--lines-per-page', type=int, default=40)
+    parser.add_argument('--noise', type=float, default=0.0, help="0 (clean) to ~0.3 (very noisy)")
+    parser.add_argument('--analytes', help="comma-separated subset of: " + ", ".join(LAB_TEMPLATES))
+    parser.add_argument('--formats', default="txt,pdf,png")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    analytes = [a.strip() for a in args.analytes.split(',')] if args.analytes else None
+    unknown = [a for a in analytes or [] if a not in LAB_TEMPLATES]
+    if unknown:
+        parser.error(f"unknown analyte(s): {', '.join(unknown)}")
+    os.makedirs(args.out_dir, exist_ok=True)
+    count = 0
+    for name, data in make_corpus(args.reports, args.pages, args.lines_per_page, analytes, args.noise,
+                                  tuple(f.strip() for f in args.formats.split(',')), args.seed):
+        with open(os.path.join(args.out_dir, name), 'wb') as fh:
+            fh.write(data)
+        count += 1
+    print(f"Wrote {count} file(s) to {args.out_dir}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
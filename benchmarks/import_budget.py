@@ -0,0 +1,84 @@
+"""Import-time budget: cold-import cost of the non-UI modules, and which backends they pull in.
+
+    python benchmarks/import_budget.py [--repeat 5] [--scale 1.5] [--json out.json]
+
+Each module is imported in a fresh interpreter with `python -X importtime`; the median
+cumulative time over --repeat runs is checked against its budget (scaled by --scale on
+slow machines), and the heavy backends (pandas, numpy, PyPDF2, PIL, pytesseract,
+streamlit) must not be loaded by the import itself. Exits with status 1 on a breach.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+HEAVY_MODULES = ('pandas', 'numpy', 'PyPDF2', 'PIL', 'pytesseract', 'streamlit')
+# module -> milliseconds of cumulative import time (interpreter start-up not included)
+BUDGETS_MS = {
+    'layout': 15,
+    'rules': 40,
+    'store': 40,
+    'pipeline': 60,
+    'batch': 120,
+    'service': 150,
+}
+
+def import_once(module, repo_dir=REPO_DIR):
+    # (cumulative import time in seconds, heavy modules that ended up loaded)
+    code = (f"import sys, json; import {module}; "
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=repo_dir,
+                          capture_output=True, text=True, check=True)
+    cumulative = None
+    for ln in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"; top level has no indent
+        parts = ln.split('|')
+        if len(parts) == 3 and parts[2].rstrip() == f" {module}":
+            cumulative = int(parts[1]) / 1e6
+    return cumulative, json.loads(proc.stdout.strip().splitlines()[-1])
+
+def check(modules, repeat, scale, repo_dir=REPO_DIR):
+    results = {}
+    for module in modules:
+        # the first run may write .pyc files; it is not counted
+        import_once(module, repo_dir)
+        times, heavy = [], set()
+        for _ in range(repeat):
+            seconds, loaded = import_once(module, repo_dir)
+            times.append(seconds)
+            heavy.update(loaded)
+        times.sort()
+        median = times[len(times) // 2]
+        budget = BUDGETS_MS[module] * scale / 1000
+        results[module] = {'median': median, 'budget': budget, 'heavy': sorted(heavy),
+                           'ok': median <= budget and not heavy}
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', help=f"modules to check (default: {', '.join(BUDGETS_MS)})")
+    parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per module (default: %(default)s)")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply every budget, e.g. on slow CI machines")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    unknown = [m for m in args.modules if m not in BUDGETS_MS]
+    if unknown:
+        parser.error(f"no budget for: {', '.join(unknown)}")
+    results = check(args.modules or list(BUDGETS_MS), args.repeat, args.scale)
+    print(f"{'module':<12}{'median':>10}{'budget':>10}   heavy imports")
+    for module, r in results.items():
+        mark = "" if r['ok'] else "  OVER BUDGET"
+        print(f"{module:<12}{r['median'] * 1000:>8.1f}ms{r['budget'] * 1000:>8.0f}ms   "
+              f"{', '.join(r['heavy']) or '-'}{mark}")
+    if args.json:
+        with open(args.json, 'w', encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    return 0 if all(r['ok'] for r in results.values()) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
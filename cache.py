@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# -------------------------
+# Keys
+# -------------------------
+# bump when the shape or meaning of cached reports changes so old disk entries are not reused
+CACHE_VERSION = 2
+
+def cache_key(data, **settings):
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}:".encode("ascii"))
+    h.update(data)
+    # settings are part of the key so e.g. a different OCR configuration never reuses stale text
+    h.update(json.dumps(settings, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+# -------------------------
+# Two-tier result cache
+# -------------------------
+class ResultCache:
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=1024 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = disk_dir
+        self._mem = OrderedDict()
+        self._mem_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    # --- memory tier ---
+    def _mem_put(self, key, value, size):
+        if size > self.max_memory_bytes:
+            return
+        if key in self._mem:
+            self._mem_bytes -= self._mem.pop(key)[1]
+        self._mem[key] = (value, size)
+        self._mem_bytes += size
+        while self._mem_bytes > self.max_memory_bytes:
+            _, (_, old_size) = self._mem.popitem(last=False)
+            self._mem_bytes -= old_size
+            self.counters['evictions'] += 1
+
+    # --- disk tier ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".json")
+
+    def _disk_entries(self):
+        entries = []
+        for fname in os.listdir(self.disk_dir):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.disk_dir, fname))
+            except FileNotFoundError:
+                continue
+            entries.append((fname, st.st_size, st.st_mtime))
+        return entries
+
+    def _disk_get(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, encoding="utf-8") as fh:
+                payload = fh.read()
+            value = json.loads(payload)
+        except (FileNotFoundError, ValueError):
+            return None, 0
+        try:
+            os.utime(path)  # mtime doubles as last-use time for eviction
+        except OSError:
+            pass
+        return value, len(payload)
+
+    def _disk_put(self, key, payload):
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding="utf-8") as fh:
+            fh.write(payload)
+        os.replace(tmp, self._disk_path(key))
+        self._disk_bytes += len(payload)
+        if self._disk_bytes > self.max_disk_bytes:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        # other processes may share the directory, so re-measure before evicting
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for fname, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, fname))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.counters['evictions'] += 1
+        self._disk_bytes = total
+
+    # --- public API ---
+    def get(self, key):
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self._mem[key][0]
+            if self.disk_dir:
+                value, size = self._disk_get(key)
+                if value is not None:
+                    self.counters['disk_hits'] += 1
+                    self._mem_put(key, value, size)
+                    return value
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, key, value):
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._mem_put(key, value, len(payload))
+            if self.disk_dir:
+                self._disk_put(key, payload)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            self._mem_bytes = 0
+            if self.disk_dir:
+                for fname, _, _ in self._disk_entries():
+                    try:
+                        os.remove(os.path.join(self.disk_dir, fname))
+                    except FileNotFoundError:
+                        pass
+                self._disk_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['memory_hits'] + self.counters['disk_hits'] + self.counters['misses']
+            hits = lookups - self.counters['misses']
+            return dict(self.counters,
+                        memory_entries=len(self._mem),
+                        memory_bytes=self._mem_bytes,
+                        disk_bytes=self._disk_bytes,
+                        hit_rate=(hits / lookups) if lookups else 0.0)
@@ -0,0 +1,362 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from io import BytesIO
+
+import numpy as np
+
+# -------------------------
+# Fingerprints
+# -------------------------
+# Three tiers, from cheap and certain to expensive and fuzzy:
+#   exact  sha256 of the file's bytes
+#   text   64-bit SimHash over word shingles of the extracted text, plus a digest of every
+#          number on the report and the patient fields, which must match exactly
+#   image  64-bit DCT perceptual hash (pHash) per page of an image or an all-scanned PDF
+# Scans of different reports on the same lab template are only a few pHash bits apart,
+# and a changed value or name moves the hash less than a rescan does, so an image match
+# alone never proves two scans carry the same results; see DedupeIndex.find_similar_pages.
+TEXT_SHINGLE = 3
+# texts with fewer shingles than this are too short to tell apart by SimHash
+TEXT_MIN_SHINGLES = 8
+PHASH_SIZE = 32
+# pages whose 32x32 thumbnail is this flat (grey-level std) are blank and get no hash
+BLANK_PAGE_STD = 2.0
+# scanned PDF pages are rendered this small for hashing (pypdfium2); 72 dpi is plenty for 32x32
+PDF_HASH_SCALE = 0.5
+
+_WORD_RE = re.compile(r'\w+')
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?')
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    return np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+def _pack_bits(bits):
+    # 64 booleans -> int, bit i = bits[i]
+    return int(np.packbits(bits, bitorder='little').view('<u8')[0])
+
+def page_hash(img):
+    # pHash of one page image: signs of the 64 lowest DCT frequencies against their median
+    from PIL import Image
+    gray = np.asarray(img.convert('L').resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS), dtype=np.float64)
+    if gray.std() < BLANK_PAGE_STD:
+        return None
+    coeffs = _DCT @ gray @ _DCT.T
+    # the DC term only says how dark the page is; the next row's first term takes its place
+    low = np.append(coeffs[:8, :8].ravel()[1:], coeffs[8, 0])
+    return _pack_bits(low > np.median(low))
+
+def text_simhash(text):
+    words = _WORD_RE.findall(text.lower())
+    shingles = {" ".join(words[i:i + TEXT_SHINGLE]) for i in range(len(words) - TEXT_SHINGLE + 1)}
+    if len(shingles) < TEXT_MIN_SHINGLES:
+        return None
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), 'little')
+                       for s in shingles], dtype='<u8')
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    return _pack_bits(bits.sum(axis=0) * 2 > len(hashes))
+
+def values_digest(text, basic=None):
+    # every number in reading order plus the patient fields; near-duplicate text must agree on all of them
+    numbers = [n.replace(',', '.') for n in _NUMBER_RE.findall(text)]
+    identity = sorted((k, " ".join(str(v).lower().split())) for k, v in (basic or {}).items())
+    blob = json.dumps([numbers, identity], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+def _scanned(page):
+    # a page without fonts has no text layer; what it shows comes from images
+    try:
+        return '/Font' not in page['/Resources']
+    except (KeyError, TypeError):
+        return True
+
+def _pdf_page_hashes(data):
+    # (page count, one hash per page) when every page is a scan; text-layer PDFs get no image hashes
+    from PyPDF2 import PdfReader
+    reader = PdfReader(BytesIO(data))
+    n_pages = len(reader.pages)
+    if not n_pages or not all(_scanned(p) for p in reader.pages):
+        return n_pages, []
+    try:
+        import pypdfium2
+    except ImportError:
+        pypdfium2 = None
+    from PIL import Image
+    hashes = []
+    if pypdfium2 is not None:
+        doc = pypdfium2.PdfDocument(data)
+        try:
+            hashes = [page_hash(doc[i].render(scale=PDF_HASH_SCALE).to_pil()) for i in range(n_pages)]
+        finally:
+            doc.close()
+    else:
+        # the largest embedded image stands for the page, as when it is OCR'd without a renderer
+        for page in reader.pages:
+            images = [Image.open(BytesIO(im.data)) for im in page.images]
+            hashes.append(page_hash(max(images, key=lambda im: im.width * im.height)) if images else None)
+    return n_pages, hashes
+
+def file_fingerprint(data, kind):
+    # what is known from the bytes alone; page hashes and text fingerprints are added in turn
+    return {'sha256': hashlib.sha256(data).hexdigest(), 'kind': kind, 'pages': 1, 'images': [],
+            'text': None, 'digest': None}
+
+def add_page_hashes(fp, data):
+    # before extraction: page count and, for images and all-scanned PDFs, one pHash per page
+    try:
+        if fp['kind'] == 'image':
+            from PIL import Image
+            fp['pages'], fp['images'] = 1, [page_hash(Image.open(BytesIO(data)))]
+        elif fp['kind'] == 'pdf':
+            fp['pages'], fp['images'] = _pdf_page_hashes(data)
+    except Exception:
+        # unreadable files still dedupe exactly; the analysis reports the actual error
+        fp['images'] = []
+    if None in fp['images']:
+        # a blank page matches every other blank page
+        fp['images'] = []
+    return fp
+
+def add_text_fingerprint(fp, text, basic=None):
+    # after extraction: SimHash and values digest of the report's text
+    fp['text'] = text_simhash(text or "")
+    fp['digest'] = values_digest(text or "", basic) if fp['text'] is not None else None
+    return fp
+
+# -------------------------
+# Index
+# -------------------------
+# A directory with:
+#   documents.sqlite  one row per distinct file (sha256 UNIQUE) with its cache key and source
+#   fingerprints.bin  fixed-size records (hash, document, page, kind), append-only
+#   bands.npy         the first N records sorted four times, once per 16-bit band of the hash
+# Two 64-bit hashes within 3 bits of each other agree on at least one of the four bands
+# (pigeonhole), so a lookup is four binary searches over the memory-mapped bands plus a
+# popcount over their buckets; records appended since the last compaction (the tail) are
+# scanned directly. The writer (one process) compacts once the tail reaches COMPACT_TAIL.
+BANDS = 4
+BAND_BITS = 64 // BANDS
+TEXT_MAX_DISTANCE = 3
+IMAGE_MAX_DISTANCE = 3
+COMPACT_TAIL = 32768
+
+KIND_TEXT = 0
+KIND_IMAGE = 1
+RECORD = np.dtype([('hash', '<u8'), ('doc', '<u4'), ('page', '<u2'), ('kind', 'u1'), ('pad', 'u1')])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    source TEXT,
+    cache_key TEXT,
+    settings TEXT,
+    pages INTEGER NOT NULL,
+    digest TEXT,
+    added_at TEXT NOT NULL
+);
+"""
+
+# candidates must be older than the document being looked up, if that is indexed already
+_BEFORE = "id < COALESCE((SELECT id FROM documents WHERE sha256 = ?), id + 1)"
+
+def _popcount(x):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    return np.unpackbits(np.ascontiguousarray(x).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+def settings_text(settings):
+    # settings as stored per document; a cached analysis is only reused under equal settings
+    return json.dumps(settings, sort_keys=True, default=str) if settings is not None else None
+
+def compare(fp, other, max_distance=TEXT_MAX_DISTANCE):
+    # two fingerprints held in memory (e.g. not indexed yet) -> ('exact' | 'text', distance) or None
+    if fp['sha256'] == other['sha256']:
+        return 'exact', 0
+    if fp.get('text') is None or other.get('text') is None or fp.get('digest') != other.get('digest'):
+        return None
+    distance = bin(fp['text'] ^ other['text']).count('1')
+    return ('text', distance) if distance <= max_distance else None
+
+class DedupeIndex:
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        db_path = os.path.join(path, "documents.sqlite")
+        if readonly:
+            self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        else:
+            self._conn = sqlite3.connect(db_path)
+            with self._conn:
+                # WAL lets pool workers read while the batch's main process appends
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.executescript(_SCHEMA)
+        self._records_path = os.path.join(path, "fingerprints.bin")
+        self._bands_path = os.path.join(path, "bands.npy")
+        if not readonly and not os.path.exists(self._records_path):
+            open(self._records_path, 'ab').close()
+        self._records, self._bands, self._bands_stamp = None, None, None
+        self.refresh()
+
+    def close(self):
+        self._conn.close()
+        self._records = self._bands = None
+
+    def refresh(self):
+        # pick up records and compactions written since the last call (cheap: two stat calls).
+        # Bands before records: records are only appended and a compaction covers records
+        # already written, so records sized afterwards cover every row the bands refer to.
+        try:
+            st = os.stat(self._bands_path)
+            stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            stamp = None
+        if stamp != self._bands_stamp:
+            self._bands = np.load(self._bands_path, mmap_mode='r') if stamp is not None else None
+            self._bands_stamp = stamp
+        size = os.path.getsize(self._records_path) if os.path.exists(self._records_path) else 0
+        n = size // RECORD.itemsize
+        if self._records is None or len(self._records) != n:
+            self._records = np.memmap(self._records_path, dtype=RECORD, mode='r', shape=(n,)) if n else \
+                np.zeros(0, dtype=RECORD)
+
+    def __len__(self):
+        return len(self._records)
+
+    # --- lookups ---
+    def _document(self, doc_id, match, distance):
+        row = self._conn.execute("SELECT source, cache_key, settings FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        source, key, settings = row
+        return {'id': doc_id, 'source': source, 'cache_key': key, 'settings': settings, 'match': match,
+                'distance': distance}
+
+    def find_exact(self, sha256):
+        row = self._conn.execute("SELECT id FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+        return self._document(row[0], 'exact', 0) if row else None
+
+    def _near(self, value, kind, max_distance):
+        # records of `kind` within max_distance bits of value -> (doc ids, pages, distances)
+        if max_distance >= BANDS:
+            raise ValueError(f"max_distance must be below {BANDS} (one per band)")
+        records = self._records
+        base = self._bands.shape[1] if self._bands is not None else 0
+        rows = [np.arange(min(base, len(records)), len(records), dtype=np.int64)]
+        for b in range(BANDS if base else 0):
+            key = (value >> (b * BAND_BITS)) & ((1 << BAND_BITS) - 1)
+            band = self._bands[b]
+            lo, hi = np.searchsorted(band, np.array([key << 32, (key + 1) << 32], dtype=np.uint64))
+            if hi > lo:
+                rows.append((band[lo:hi] & 0xFFFFFFFF).astype(np.int64))
+        rows = np.unique(np.concatenate(rows))
+        # bands newer than the records (an index replaced under a reader) name rows it cannot see yet
+        rows = rows[rows < len(records)]
+        found = records[rows]
+        distance = _popcount(found['hash'] ^ np.uint64(value))
+        keep = (found['kind'] == kind) & (distance <= max_distance)
+        return found['doc'][keep], found['page'][keep], distance[keep]
+
+    def find_similar_text(self, simhash, digest, max_distance=TEXT_MAX_DISTANCE, sha256=None):
+        # the closest (then earliest) document whose text is within max_distance bits and
+        # whose numbers and patient fields are identical. sha256: the file being looked up;
+        # when it is indexed itself (a re-run), only documents indexed before it count.
+        if simhash is None:
+            return None
+        docs, _, distance = self._near(simhash, KIND_TEXT, max_distance)
+        best = {}
+        for doc, d in zip(docs.tolist(), distance.tolist()):
+            best[doc] = min(d, best.get(doc, d))
+        if not best:
+            return None
+        ids = sorted(best, key=lambda doc: (best[doc], doc))
+        marks = ",".join("?" * len(ids))
+        same = {r[0] for r in self._conn.execute(
+            f"SELECT id FROM documents WHERE id IN ({marks}) AND digest = ? AND {_BEFORE}", ids + [digest, sha256])}
+        for doc in ids:
+            if doc in same:
+                return self._document(doc, 'text', best[doc])
+        return None
+
+    def find_similar_pages(self, hashes, max_distance=IMAGE_MAX_DISTANCE, sha256=None):
+        # a document with the same number of pages, each within max_distance bits of the
+        # page at the same position. This finds rescans and re-sent faxes of a report, but
+        # also other patients' reports on the same template: callers decide what it means.
+        if not hashes:
+            return None
+        candidates = None
+        for page, value in enumerate(hashes):
+            docs, pages, distance = self._near(value, KIND_IMAGE, max_distance)
+            worst = {}
+            for doc, d in zip(docs[pages == page].tolist(), distance[pages == page].tolist()):
+                worst[doc] = min(d, worst.get(doc, d))
+            if candidates is not None:
+                worst = {doc: max(d, candidates[doc]) for doc, d in worst.items() if doc in candidates}
+            candidates = worst
+            if not candidates:
+                return None
+        ids = sorted(candidates, key=lambda doc: (candidates[doc], doc))
+        marks = ",".join("?" * len(ids))
+        same_length = {r[0] for r in self._conn.execute(
+            f"SELECT id FROM documents WHERE id IN ({marks}) AND pages = ? AND {_BEFORE}", ids + [len(hashes), sha256])}
+        for doc in ids:
+            if doc in same_length:
+                return self._document(doc, 'image', candidates[doc])
+        return None
+
+    # --- writing (one process) ---
+    def add_many(self, entries):
+        # entries: (fingerprint, source, cache_key, settings); returns the new document ids,
+        # None where the file was already indexed
+        if self.readonly:
+            raise ValueError("index opened read-only")
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        ids, records = [], []
+        with self._conn:
+            for fp, source, key, settings in entries:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO documents (sha256, source, cache_key, settings, pages, digest, added_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (fp['sha256'], source, key, settings_text(settings), fp['pages'], fp.get('digest'), now))
+                doc = cur.lastrowid if cur.rowcount else None
+                ids.append(doc)
+                if doc is None:
+                    continue
+                if fp.get('text') is not None:
+                    records.append((fp['text'], doc, 0, KIND_TEXT, 0))
+                records.extend((value, doc, page, KIND_IMAGE, 0) for page, value in enumerate(fp.get('images') or []))
+        # documents are committed first, so a reader never finds a record without its row
+        if records:
+            with open(self._records_path, 'ab') as fh:
+                fh.write(np.array(records, dtype=RECORD).tobytes())
+        self.refresh()
+        base = self._bands.shape[1] if self._bands is not None else 0
+        if len(self._records) - base >= COMPACT_TAIL:
+            self.compact()
+        return ids
+
+    def add(self, fp, source=None, cache_key=None, settings=None):
+        return self.add_many([(fp, source, cache_key, settings)])[0]
+
+    def compact(self):
+        # re-sort every record into the four bands; readers switch over on their next refresh
+        records = np.array(self._records)
+        rows = np.arange(len(records), dtype=np.uint64)
+        bands = np.empty((BANDS, len(records)), dtype=np.uint64)
+        for b in range(BANDS):
+            keys = (records['hash'] >> np.uint64(b * BAND_BITS)) & np.uint64((1 << BAND_BITS) - 1)
+            bands[b] = np.sort((keys << np.uint64(32)) | rows)
+        tmp = self._bands_path + ".tmp"
+        with open(tmp, 'wb') as fh:
+            np.save(fh, bands)
+        os.replace(tmp, self._bands_path)
+        self.refresh()
@@ -0,0 +1,187 @@
+import io
+import threading
+import time
+from contextlib import contextmanager
+
+# -------------------------
+# Per-report traces
+# -------------------------
+# A span covers one stage of one report. It costs two clock pairs, so traces are always
+# kept and the pipeline only decides whether to attach them to the report. CPU time is
+# the calling thread's; work handed to a process pool is in wall time only.
+SPAN_COUNTS = ('bytes_in', 'chars_out', 'pages', 'lines', 'items')
+
+class Span:
+    __slots__ = ('name', 'wall', 'cpu') + SPAN_COUNTS
+
+    def __init__(self, name, **counts):
+        self.name = name
+        self.wall = self.cpu = 0.0
+        for key in SPAN_COUNTS:
+            setattr(self, key, counts.get(key, 0))
+
+    def to_dict(self):
+        d = {'stage': self.name, 'wall': self.wall, 'cpu': self.cpu}
+        d.update((key, getattr(self, key)) for key in SPAN_COUNTS if getattr(self, key))
+        return d
+
+class Trace:
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def span(self, name, **counts):
+        s = Span(name, **counts)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield s
+        finally:
+            s.wall = time.perf_counter() - wall
+            s.cpu = time.thread_time() - cpu
+            self.spans.append(s)
+
+    def add(self, name, wall, cpu=0.0, **counts):
+        # a span measured elsewhere, e.g. one shared pass over several reports
+        s = Span(name, **counts)
+        s.wall, s.cpu = wall, cpu
+        self.spans.append(s)
+        return s
+
+    def timings(self):
+        out = {}
+        for s in self.spans:
+            out[s.name] = out.get(s.name, 0.0) + s.wall
+        return out
+
+    def to_list(self):
+        return [s.to_dict() for s in self.spans]
+
+# -------------------------
+# Profiling capture
+# -------------------------
+class Capture:
+    def __init__(self):
+        self.profile = None
+        self.peak_bytes = None
+
+    def stats_text(self, limit=25, sort='cumulative'):
+        if self.profile is None:
+            return ''
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+@contextmanager
+def capture(profile=False, memory=False):
+    # opt-in cProfile / tracemalloc around a block; both slow the code they watch
+    # (and are only imported when asked for)
+    if profile:
+        import cProfile
+    if memory:
+        import tracemalloc
+    cap = Capture()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+    else:
+        started_tracing = False
+    if profile:
+        cap.profile = cProfile.Profile()
+        cap.profile.enable()
+    try:
+        yield cap
+    finally:
+        if profile:
+            cap.profile.disable()
+        if memory and tracemalloc.is_tracing():
+            cap.peak_bytes = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+
+# -------------------------
+# Prometheus-style metrics
+# -------------------------
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _label_value(value):
+    # backslash, double quote and newline are escaped in label values
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_label_value(v)}"' for k, v in sorted(labels.items())) + '}'
+
+class Metrics:
+    def __init__(self, prefix="report_analyzer", buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._gauges = {}
+        # (name, labels) -> [bucket counts..., sum, count]
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('counter', help_text))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('gauge', help_text))
+            self._gauges[key] = value
+
+    def observe(self, name, value, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('histogram', help_text))
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def observe_report(self, report):
+        status = 'error' if report.get('error') else 'cached' if report.get('cached') else 'ok'
+        self.inc('reports_total', help_text="Reports analyzed", kind=report.get('kind') or 'unknown', status=status)
+        for span in report.get('trace') or []:
+            stage = span['stage']
+            self.observe('stage_seconds', span['wall'], help_text="Wall time per report and stage", stage=stage)
+            self.inc('stage_cpu_seconds_total', span.get('cpu', 0.0), help_text="CPU time per stage", stage=stage)
+            for key in SPAN_COUNTS:
+                if span.get(key):
+                    self.inc(f'stage_{key}_total', span[key], help_text=f"{key.replace('_', ' ').capitalize()} per stage", stage=stage)
+
+    def render(self):
+        # Prometheus text exposition format (version 0.0.4)
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                full = f"{self.prefix}_{name}"
+                if help_text:
+                    lines.append(f"# HELP {full} {help_text}")
+                lines.append(f"# TYPE {full} {kind}")
+                if kind in ('counter', 'gauge'):
+                    values = self._counters if kind == 'counter' else self._gauges
+                    for (n, labels), value in sorted(values.items()):
+                        if n == name:
+                            lines.append(f"{full}{_labels(dict(labels))} {value:g}")
+                    continue
+                for (n, labels), h in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    labels = dict(labels)
+                    for bound, count in zip(self.buckets, h):
+                        lines.append(f"{full}_bucket{_labels(dict(labels, le=f'{bound:g}'))} {count}")
+                    lines.append(f"{full}_bucket{_labels(dict(labels, le='+Inf'))} {h[-1]}")
+                    lines.append(f"{full}_sum{_labels(labels)} {h[-2]:g}")
+                    lines.append(f"{full}_count{_labels(labels)} {h[-1]}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,295 @@
+import math
+import re
+from bisect import bisect_right
+
+# -------------------------
+# Word boxes
+# -------------------------
+# A word is a tuple (x0, y0, x1, y1, text) with the origin at the top left of the page,
+# in the source's own units (pixels for scans, points for PDFs). Tuples sort by x0,
+# which is the order words are read within a row.
+
+# Tesseract TSV columns; tesserocr's GetTSVText leaves out the header line
+_TSV_FIELDS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+_TSV_WORD_LEVEL = '5'
+
+def words_from_tsv(tsv, min_conf=0):
+    # word rows of Tesseract image_to_data output; other levels (blocks, lines) are skipped
+    words = []
+    left, top, width, height = (_TSV_FIELDS.index(k) for k in ('left', 'top', 'width', 'height'))
+    conf, text_at = _TSV_FIELDS.index('conf'), _TSV_FIELDS.index('text')
+    for ln in tsv.splitlines():
+        f = ln.split('\t')
+        if len(f) <= text_at or f[0] != _TSV_WORD_LEVEL:
+            continue
+        text = f[text_at].strip()
+        if not text:
+            continue
+        try:
+            if float(f[conf]) < min_conf:
+                continue
+            x, y = int(f[left]), int(f[top])
+            words.append((x, y, x + int(f[width]), y + int(f[height]), text))
+        except ValueError:
+            continue
+    return words
+
+def text_words(text, line_height=10):
+    # a text without positions (e.g. PyPDF2's extract_text): one row per line, one cell per row
+    words = []
+    for i, ln in enumerate(t for t in text.splitlines() if t.strip()):
+        y = i * line_height
+        words.append((0, y, len(ln), y + line_height * 0.8, " ".join(ln.split())))
+    return words
+
+# -------------------------
+# PDF text positions
+# -------------------------
+# PyPDF2's extract_text joins everything printed on one baseline, so the content stream
+# is read here instead: each text-showing operator gives the exact start of a run of
+# text; run widths are estimated at half an em per character (no font metrics needed).
+EM_PER_CHAR = 0.5
+_IDENTITY = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+
+def _mult(m, n):
+    return [m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+            m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+            m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5]]
+
+def _translate(tx, ty, m):
+    return _mult([1.0, 0.0, 0.0, 1.0, tx, ty], m)
+
+def _decode(raw, char_map):
+    # mirrors PyPDF2's own decoding: byte encoding first, then the font's ToUnicode map
+    _, _, encoding, to_unicode, _ = char_map
+    if isinstance(raw, str):
+        raw = raw.get_original_bytes() if hasattr(raw, 'get_original_bytes') else raw.encode('latin-1', 'replace')
+    if isinstance(encoding, str):
+        try:
+            text = raw.decode(encoding, 'surrogatepass')
+        except Exception:
+            text = raw.decode('utf-16-be' if encoding == 'charmap' else 'charmap', 'surrogatepass')
+    else:
+        text = "".join(encoding.get(b, chr(b)) for b in raw)
+    return "".join(to_unicode.get(ch, ch) for ch in text)
+
+def pdf_page_words(page):
+    # word boxes of a PyPDF2 page's text layer; [] when the page has none we can place.
+    # The fonts' character maps come from PyPDF2's internal build_char_map, which is why
+    # requirements.txt pins PyPDF2: the public extract_text(visitor_text=...) of 3.0.1 reports
+    # each run with the text matrix of the next line and merges runs sharing a baseline.
+    # Without it, callers fall back to one cell per extracted line (text_words).
+    try:
+        from PyPDF2._cmap import build_char_map
+    except ImportError:
+        return []
+    from PyPDF2.generic import ContentStream
+
+    contents = page.get_contents()
+    if contents is None:
+        return []
+    if not isinstance(contents, ContentStream):
+        contents = ContentStream(contents, page.pdf)
+    try:
+        font_names = list(page['/Resources']['/Font'])
+    except (KeyError, TypeError):
+        return []
+    fonts = {}
+    for name in font_names:
+        try:
+            fonts[name] = build_char_map(name, 200.0, page)
+        except Exception:
+            continue
+    top = float(page.mediabox.top)
+    words = []
+    cm, cm_stack = list(_IDENTITY), []
+    tm = tlm = list(_IDENTITY)
+    font, size, leading = None, 12.0, 0.0
+
+    def show(raw):
+        nonlocal tm
+        text = _decode(raw, font) if font is not None else ""
+        m = _mult(tm, cm)
+        width, height = math.hypot(m[0], m[1]) * size, math.hypot(m[2], m[3]) * size
+        # upright text only; rotated runs (stamps, margins) are not part of a table
+        if text and m[0] > 0 and abs(m[1]) < 1e-6:
+            base = top - m[5]
+            for w in re.finditer(r'\S+', text):
+                words.append((m[4] + w.start() * EM_PER_CHAR * width, base - 0.8 * height,
+                              m[4] + w.end() * EM_PER_CHAR * width, base + 0.2 * height, w.group()))
+        tm = _translate(len(text) * EM_PER_CHAR * size, 0.0, tm)
+
+    def next_line(tx, ty):
+        nonlocal tm, tlm
+        tlm = _translate(tx, ty, tlm)
+        tm = tlm
+
+    for operands, op in contents.operations:
+        try:
+            if op == b'BT':
+                tm = tlm = list(_IDENTITY)
+            elif op == b'q':
+                cm_stack.append(cm)
+            elif op == b'Q':
+                cm = cm_stack.pop() if cm_stack else list(_IDENTITY)
+            elif op == b'cm':
+                cm = _mult([float(v) for v in operands], cm)
+            elif op == b'Tf':
+                font, size = fonts.get(operands[0]), float(operands[1])
+            elif op == b'TL':
+                leading = float(operands[0])
+            elif op == b'Td':
+                next_line(float(operands[0]), float(operands[1]))
+            elif op == b'TD':
+                leading = -float(operands[1])
+                next_line(float(operands[0]), float(operands[1]))
+            elif op == b'Tm':
+                tm = tlm = [float(v) for v in operands]
+            elif op == b'T*':
+                next_line(0.0, -leading)
+            elif op == b'Tj':
+                show(operands[0])
+            elif op == b"'":
+                next_line(0.0, -leading)
+                show(operands[0])
+            elif op == b'"':
+                next_line(0.0, -leading)
+                show(operands[2])
+            elif op == b'TJ':
+                for part in operands[0]:
+                    if isinstance(part, (str, bytes)):
+                        show(part)
+                    else:
+                        # kerning / spacing in thousandths of an em
+                        tm = _translate(-float(part) / 1000.0 * size, 0.0, tm)
+        except (IndexError, TypeError, ValueError):
+            # one malformed operator should not lose the rest of the page
+            continue
+    return words
+
+# -------------------------
+# Rows and cells
+# -------------------------
+# Rows: words sorted by vertical centre are swept once; a word joins the open row while
+# its centre is within ROW_TOLERANCE line heights of the row's mean centre.
+# Cells: within a row, words closer than CELL_GAP line heights belong to the same cell.
+ROW_TOLERANCE = 0.5
+CELL_GAP = 0.8
+CELL_SEPARATOR = "   "
+
+def line_height(words):
+    heights = sorted(w[3] - w[1] for w in words)
+    return heights[len(heights) // 2] if heights else 0
+
+def group_rows(words, height=None):
+    if not words:
+        return []
+    tol = (height if height is not None else line_height(words)) * ROW_TOLERANCE
+    rows, row, centre = [], [], 0.0
+    for w in sorted(words, key=lambda w: w[1] + w[3]):
+        c = (w[1] + w[3]) / 2
+        if row and c - centre > tol:
+            rows.append(sorted(row))
+            row = []
+        row.append(w)
+        centre += (c - centre) / len(row) if len(row) > 1 else c - centre
+    rows.append(sorted(row))
+    return rows
+
+def row_cells(row, gap):
+    # row: words sorted by x0 -> [(x0, x1, text)]
+    cells = []
+    for x0, _, x1, _, text in row:
+        if cells and x0 - cells[-1][1] <= gap:
+            cx0, cx1, ctext = cells[-1]
+            cells[-1] = (cx0, max(cx1, x1), ctext + " " + text)
+        else:
+            cells.append((x0, x1, text))
+    return cells
+
+# -------------------------
+# Tables
+# -------------------------
+# A header row (Test | Result | Unit | Reference ...) fixes the columns until the next
+# header, across pages. Column boundaries sit halfway between neighbouring header cells;
+# a cell belongs to the column its left edge falls in (bisect over the boundaries).
+# Words are matched in this order, so "Reference Value" is a reference column.
+_HEADER_ROLES = (
+    ('reference', ('reference', 'ref', 'range', 'interval', 'normal', 'biological')),
+    ('unit', ('unit', 'units')),
+    ('result', ('result', 'results', 'value', 'values', 'observed', 'observation')),
+    ('name', ('test', 'tests', 'investigation', 'investigations', 'parameter', 'parameters', 'examination',
+              'description', 'analyte')),
+)
+_HEADER_WORD_RE = re.compile(r'[a-z]+')
+# every header names a result column and has no digits; most rows fail this cheap test
+_HEADER_HINT_RE = re.compile(r'result|value|observ', re.IGNORECASE)
+_DIGIT_RE = re.compile(r'\d')
+# a numeric result: the number, then whatever follows it in the cell (unit, H/L marker)
+_RESULT_NUMBER_RE = re.compile(r'^([<>≤≥]?\s*-?\d+(?:[.,]\d+)?)(?![\d.,]*\s*-\s*\d)\s*(.*)$')
+_FLAG_MARKERS = {'h', 'l', '*', 'high', 'low', '(h)', '(l)'}
+
+def _header_role(text):
+    found = set(_HEADER_WORD_RE.findall(text.lower()))
+    for role, words in _HEADER_ROLES:
+        if found.intersection(words):
+            return role
+    return None
+
+def header_columns(cells):
+    # (boundaries, roles) when the row reads like a table header, else None
+    roles = [_header_role(text) for _, _, text in cells]
+    known = [r for r in roles if r]
+    if 'name' not in known or 'result' not in known or len(known) < len(roles) - len(known):
+        return None
+    bounds = [(cells[i][1] + cells[i + 1][0]) / 2 for i in range(len(cells) - 1)]
+    return bounds, roles
+
+def table_test(cells, columns, line):
+    # one table row -> a parsed test (the shape parse_lab_line returns), or None
+    bounds, roles = columns
+    fields = {}
+    for x0, _, text in cells:
+        role = roles[bisect_right(bounds, x0)]
+        if role:
+            fields[role] = fields[role] + " " + text if role in fields else text
+    name, result = fields.get('name'), fields.get('result')
+    if not name or not result:
+        return None
+    m = _RESULT_NUMBER_RE.match(result)
+    if m:
+        unit = fields.get('unit')
+        if unit is None:
+            unit = " ".join(t for t in m.group(2).split() if t.lower() not in _FLAG_MARKERS)
+        test = {'name': name, 'value_raw': m.group(1).replace(' ', ''), 'unit': unit, 'type': 'numeric'}
+    elif re.search(r'[A-Za-z]', result) and not re.search(r'\d', result):
+        test = {'name': name, 'value_raw': result, 'type': 'qualitative'}
+    else:
+        return None
+    test['line'] = line
+    test['reference'] = fields.get('reference', '')
+    return test
+
+def read_tables(pages, parse_line):
+    # pages: one list of words per page. Table rows become tests directly; every other
+    # row is handed to parse_line as text. Returns (tests, row texts).
+    tests, lines = [], []
+    columns = None
+    for words in pages:
+        height = line_height(words)
+        for row in group_rows(words, height):
+            cells = row_cells(row, height * CELL_GAP)
+            line = CELL_SEPARATOR.join(text for _, _, text in cells)
+            lines.append(line)
+            if _HEADER_HINT_RE.search(line) and not _DIGIT_RE.search(line):
+                header = header_columns(cells)
+                if header is not None:
+                    columns = header
+                    continue
+            test = table_test(cells, columns, " ".join(line.split())) if columns else None
+            if test is None:
+                test = parse_line(line)
+            if test is not None:
+                tests.append(test)
+    return tests, lines
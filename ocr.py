@@ -0,0 +1,351 @@
+import atexit
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+# -------------------------
+# Settings
+# -------------------------
+TARGET_DPI = 300
+# A4 width in inches, used to guess the resolution of images that carry no DPI tag
+PAGE_WIDTH_IN = 8.27
+MIN_SCALE, MAX_SCALE = 0.5, 2.0
+# band height / overlap are in pixels at TARGET_DPI (~4 in bands, ~0.25 in overlap)
+BAND_HEIGHT = 1200
+BAND_OVERLAP = 80
+TESSERACT_LANG = "eng"
+TESSERACT_PSM = 6
+TESSERACT_CONFIG = f"--psm {TESSERACT_PSM}"
+
+# Clarity (50-100) controls how hard a scan is cleaned up before recognition:
+#   >= 60  contrast stretch + Otsu binarization
+#   >= 75  also median-filter speckle noise
+#   >= 85  also deskew
+# Within that, higher clarity moves the threshold up so faint strokes survive binarization.
+CLARITY_BINARIZE = 60
+CLARITY_DENOISE = 75
+CLARITY_DESKEW = 85
+# with a pool, deskewing and denoising run in strips of at least this many rows, one per worker
+PREPROCESS_MIN_ROWS = 512
+
+# -------------------------
+# Preprocessing
+# -------------------------
+def image_dpi(img):
+    dpi = img.info.get('dpi')
+    if dpi and dpi[0] and dpi[0] > 1:
+        return float(dpi[0])
+    return img.width / PAGE_WIDTH_IN
+
+def rescale_to_dpi(img, target_dpi=TARGET_DPI):
+    scale = target_dpi / image_dpi(img)
+    scale = max(MIN_SCALE, min(MAX_SCALE, scale))
+    if abs(scale - 1.0) < 0.1:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.LANCZOS if scale < 1 else Image.BICUBIC)
+
+def otsu_threshold(img):
+    hist = img.histogram()[:256]
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_bg = weight_bg = 0
+    best, best_var = 127, -1.0
+    for t in range(256):
+        weight_bg += hist[t]
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * hist[t]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if var > best_var:
+            best, best_var = t, var
+    return best
+
+def binarize(img, clarity):
+    img = ImageOps.autocontrast(img, cutoff=1)
+    threshold = otsu_threshold(img) + (clarity - 90) // 2
+    threshold = max(1, min(254, threshold))
+    return img.point(lambda p: 255 if p > threshold else 0)
+
+def estimate_skew(img, max_angle=5.0, step=0.5):
+    # projection-profile search on a thumbnail: text rows give the sharpest row profile when level
+    thumb = img.copy()
+    thumb.thumbnail((800, 800))
+    ink = ImageOps.invert(thumb)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        rows = np.asarray(ink.rotate(float(angle), fillcolor=0), dtype=np.float32).sum(axis=1)
+        score = float(np.var(rows))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def deskew(img):
+    angle = estimate_skew(img)
+    if abs(angle) < 0.25:
+        return img
+    return img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+def _rotation(size, angle):
+    # (output size, inverse affine matrix) of img.rotate(angle, expand=True), as PIL computes them
+    w, h = size
+    rad = -math.radians(angle % 360.0)
+    a, b = round(math.cos(rad), 15), round(math.sin(rad), 15)
+    matrix = [a, b, 0.0, -b, a, 0.0]
+    cx, cy = w / 2, h / 2
+    matrix[2] = a * -cx + b * -cy + cx
+    matrix[5] = -b * -cx + a * -cy + cy
+    corners = [(a * x + b * y + matrix[2], -b * x + a * y + matrix[5]) for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    nw = math.ceil(max(x for x, _ in corners)) - math.floor(min(x for x, _ in corners))
+    nh = math.ceil(max(y for _, y in corners)) - math.floor(min(y for _, y in corners))
+    tx, ty = -(nw - w) / 2.0, -(nh - h) / 2.0
+    matrix[2], matrix[5] = a * tx + b * ty + matrix[2], -b * tx + a * ty + matrix[5]
+    return (nw, nh), matrix
+
+def _strip_source(img, width, matrix, top, bottom):
+    # the part of img that rows [top, bottom) of the deskewed page are drawn from, and the
+    # matrix moved onto it; only that crop is sent to a worker
+    if matrix is None:
+        return img.crop((0, top, img.width, bottom)), None
+    a, b, c, d, e, f = matrix
+    c, f = c + b * top, f + e * top
+    xs = [a * x + b * y + c for x in (0, width) for y in (0, bottom - top)]
+    ys = [d * x + e * y + f for x in (0, width) for y in (0, bottom - top)]
+    # bicubic reads two pixels either side of each sample point
+    x0, x1 = max(0, math.floor(min(xs)) - 3), min(img.width, math.ceil(max(xs)) + 3)
+    y0, y1 = max(0, math.floor(min(ys)) - 3), min(img.height, math.ceil(max(ys)) + 3)
+    x1, y1 = max(x1, x0 + 1), max(y1, y0 + 1)
+    return img.crop((x0, y0, x1, y1)), [a, b, c - x0, d, e, f - y0]
+
+def _clean_strip(src, matrix, width, rows, trim_top, trim_bottom, clarity):
+    # deskew and denoise one strip; the trimmed context rows keep the median filter exact
+    strip = src if matrix is None else src.transform((width, rows), Image.AFFINE, matrix, Image.BICUBIC,
+                                                     fillcolor=255)
+    if clarity >= CLARITY_DENOISE:
+        strip = strip.filter(ImageFilter.MedianFilter(3))
+    return strip.crop((0, trim_top, width, rows - trim_bottom))
+
+def _clean_page(img, size, matrix, clarity, pool=None):
+    # the deskewed, denoised page; with a pool, strip by strip in its workers
+    width, height = size
+    n = 1 if pool is None else max(1, min(pool.workers, height // PREPROCESS_MIN_ROWS))
+    bounds = [height * i // n for i in range(n + 1)]
+    jobs = []
+    for top, bottom in zip(bounds, bounds[1:]):
+        # one row of context either side, except at the page edges
+        ctx_top, ctx_bottom = max(0, top - 1), min(height, bottom + 1)
+        src, strip_matrix = _strip_source(img, width, matrix, ctx_top, ctx_bottom)
+        args = (src, strip_matrix, width, ctx_bottom - ctx_top, top - ctx_top, ctx_bottom - bottom, clarity)
+        jobs.append((top, _clean_strip(*args) if pool is None else pool.call(_clean_strip, *args)))
+    if n == 1 and pool is None:
+        return jobs[0][1]
+    page = Image.new("L", size, 255)
+    for top, strip in jobs:
+        page.paste(strip if pool is None else strip.result(), (0, top))
+    return page
+
+def preprocess(img, clarity=90, target_dpi=TARGET_DPI, pool=None):
+    # pool: an OcrPool to run the expensive steps (deskew rotation, median filter) in; only
+    # rescaling, the skew estimate on a thumbnail and the global threshold stay in this process
+    img = rescale_to_dpi(img.convert("L"), target_dpi)
+    size, matrix = img.size, None
+    if clarity >= CLARITY_DESKEW:
+        angle = estimate_skew(img)
+        if abs(angle) >= 0.25:
+            size, matrix = _rotation(img.size, angle)
+    if matrix is not None or clarity >= CLARITY_DENOISE:
+        img = _clean_page(img, size, matrix, clarity, pool)
+    if clarity >= CLARITY_BINARIZE:
+        img = binarize(img, clarity)
+    return img
+
+# -------------------------
+# Banding & stitching
+# -------------------------
+def _ink_per_row(img):
+    return (np.asarray(img, dtype=np.uint8) < 128).sum(axis=1)
+
+def split_bands(img, band_height=BAND_HEIGHT, overlap=BAND_OVERLAP):
+    # -> (bands, overlapped): overlapped[i] is True when band i repeats the bottom of band i - 1
+    if img.height <= band_height + overlap:
+        return [img], [False]
+    ink = _ink_per_row(img)
+    bands, overlapped = [], []
+    top, shared = 0, False
+    while top < img.height:
+        nominal = top + band_height
+        overlapped.append(shared)
+        if nominal + overlap >= img.height:
+            bands.append(img.crop((0, top, img.width, img.height)))
+            break
+        # cut on the emptiest row near the nominal boundary so text lines are rarely split
+        lo, hi = nominal - overlap, nominal + overlap
+        cut = lo + int(np.argmin(ink[lo:hi]))
+        if ink[cut] == 0:
+            bands.append(img.crop((0, top, img.width, cut)))
+            top, shared = cut, False
+        else:
+            # no clean gap: overlap the bands and let stitch() drop the repeated lines
+            bands.append(img.crop((0, top, img.width, min(img.height, cut + overlap))))
+            top, shared = max(top + 1, cut - overlap), True
+    return bands, overlapped
+
+def _norm_line(ln):
+    return " ".join(ln.split()).lower()
+
+def stitch(texts, overlapped, max_repeat=4):
+    # joins band texts; only where a band overlaps the previous one (see split_bands) are its
+    # leading lines that repeat the previous band's tail dropped, since they were read twice
+    lines = []
+    for text, shared in zip(texts, overlapped):
+        band_lines = [ln for ln in text.splitlines() if ln.strip()]
+        skip = 0
+        for k in range(min(max_repeat, len(lines), len(band_lines)) if shared else 0, 0, -1):
+            if [_norm_line(x) for x in lines[-k:]] == [_norm_line(x) for x in band_lines[:k]]:
+                skip = k
+                break
+        lines.extend(band_lines[skip:])
+    return "\n".join(lines)
+
+# -------------------------
+# Recognition engines
+# -------------------------
+# With tesserocr installed each process keeps one initialized Tesseract API (language
+# data loaded once) for its whole life. Otherwise pytesseract is used, which still
+# starts a tesseract binary per call; the worker pool then only saves pool start-up.
+_engine = None
+_engine_loaded = False
+# the in-process engine is shared by the app's session threads; the C API is not re-entrant
+_engine_lock = threading.Lock()
+
+def _load_engine(lang=TESSERACT_LANG, psm=TESSERACT_PSM):
+    global _engine, _engine_loaded
+    _engine_loaded = True
+    try:
+        import tesserocr
+    except ImportError:
+        _engine = None
+        return
+    _engine = tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+
+def recognize(img):
+    with _engine_lock:
+        if not _engine_loaded:
+            _load_engine()
+        if _engine is not None:
+            _engine.SetImage(img)
+            return _engine.GetUTF8Text()
+    # without tesserocr: pytesseract, imported here so tesserocr-only installs never need it
+    import pytesseract
+    return pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
+
+def recognize_data(img):
+    # word boxes as Tesseract TSV (image_to_data); see layout.words_from_tsv
+    with _engine_lock:
+        if not _engine_loaded:
+            _load_engine()
+        if _engine is not None:
+            _engine.SetImage(img)
+            return _engine.GetTSVText(0)
+    import pytesseract
+    return pytesseract.image_to_data(img, config=TESSERACT_CONFIG)
+
+# -------------------------
+# Persistent worker pool
+# -------------------------
+class OcrPool:
+    def __init__(self, workers=None, max_pending=None, lang=TESSERACT_LANG, psm=TESSERACT_PSM):
+        self.workers = workers or os.cpu_count() or 1
+        self.lang = lang
+        self.psm = psm
+        # bounded queue: submit() blocks once this many images are queued or running
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 2)
+        self._lock = threading.Lock()
+        self._executor = self._start()
+
+    def _start(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_load_engine, initargs=(self.lang, self.psm))
+
+    def submit(self, img):
+        return self.call(recognize, img)
+
+    def call(self, fn, *args):
+        self._slots.acquire()
+        try:
+            try:
+                fut = self._executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # a worker died (e.g. killed by the OOM killer); replace the pool once
+                with self._lock:
+                    self._executor.shutdown(wait=False)
+                    self._executor = self._start()
+                fut = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        return fut
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(workers=None):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OcrPool(workers)
+            atexit.register(_pool.shutdown)
+        return _pool
+
+def _for_transfer(img):
+    # binarized bands go over the pipe as 1-bit images, an eighth of the bytes
+    colors = img.getcolors(2) if img.mode == "L" else None
+    if colors and all(value in (0, 255) for _, value in colors):
+        return img.convert("1", dither=Image.Dither.NONE)
+    return img
+
+# -------------------------
+# Recognition
+# -------------------------
+def ocr_image(img, clarity=90, workers=None, on_progress=None):
+    # workers=1 keeps everything in this process; otherwise preprocessing strips and bands go
+    # to the shared pool, which is sized by the first caller and reused for the life of the process
+    pool = None if workers == 1 else get_pool(workers)
+    img = preprocess(img, clarity, pool=pool)
+    bands, overlapped = split_bands(img)
+    total = len(bands)
+    if on_progress:
+        on_progress(0, total)
+    texts = [""] * total
+    if workers == 1 or total == 1:
+        for i, band in enumerate(bands):
+            texts[i] = recognize(band)
+            if on_progress:
+                on_progress(i + 1, total)
+    else:
+        futures = {pool.submit(_for_transfer(band)): i for i, band in enumerate(bands)}
+        for done, fut in enumerate(as_completed(futures), 1):
+            texts[futures[fut]] = fut.result()
+            if on_progress:
+                on_progress(done, total)
+    if total == 1:
+        return texts[0].strip()
+    return stitch(texts, overlapped).strip()
+
+def ocr_image_data(img, clarity=90):
+    # word boxes for layout analysis: the page is recognized whole, so every box is in
+    # one coordinate frame (that of the preprocessed image)
+    return recognize_data(preprocess(img, clarity))
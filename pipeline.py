@@ -0,0 +1,631 @@
+import os
+import re
+import time
+from io import BytesIO, TextIOWrapper
+from analytes import resolve_test_name
+from cache import cache_key
+from instrument import Trace
+from layout import pdf_page_words, read_tables, text_words, words_from_tsv
+
+# -------------------------
+# Lazy backends
+# -------------------------
+# PDF (PyPDF2), image / OCR (PIL, numpy, pytesseract) and DataFrame (pandas, rules) code
+# is imported on first use, so parsing text, spawning pool workers and starting the
+# batch or HTTP front ends stay cheap. benchmarks/import_budget.py keeps it that way.
+_LAZY_NAMES = {
+    'PdfReader': 'PyPDF2',
+    'Image': 'PIL.Image',
+    'ocr_image': 'ocr',
+    'ocr_image_data': 'ocr',
+    'QUAL_RESULTS_NEGATIVE': 'rules',
+    'QUAL_RESULTS_POSITIVE': 'rules',
+}
+
+def __getattr__(name):
+    # names this module used to import eagerly (pipeline.PdfReader, pipeline.ocr_image ...)
+    if name in _LAZY_NAMES:
+        import importlib
+        module = importlib.import_module(_LAZY_NAMES[name])
+        return module if name == 'Image' else getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# -------------------------
+# Progress reporting
+# -------------------------
+# Long-running functions accept on_progress(stage, done, total) and call it as real
+# work completes: once per PDF page / OCR tile, per parsed line, per interpreted test.
+STAGE_EXTRACT = 'extract'
+STAGE_PARSE = 'parse'
+STAGE_INTERPRET = 'interpret'
+STAGES = (STAGE_EXTRACT, STAGE_PARSE, STAGE_INTERPRET)
+
+def _notify(on_progress, stage, done, total):
+    if on_progress is not None:
+        on_progress(stage, done, total)
+
+# -------------------------
+# Extraction helpers
+# -------------------------
+# Clarity (OCR sensitivity, 50-100) as exposed by the UI slider; see ocr.preprocess
+DEFAULT_CLARITY = 90
+# PDFs with fewer pages than this are extracted in-process; a pool costs more than it saves
+PDF_PARALLEL_MIN_PAGES = 4
+PDF_OCR_DPI = 300
+
+def _rasterize_pdf_page(data, page, index):
+    try:
+        import pypdfium2
+    except ImportError:
+        pypdfium2 = None
+    if pypdfium2 is not None:
+        doc = pypdfium2.PdfDocument(data)
+        try:
+            return [doc[index].render(scale=PDF_OCR_DPI / 72).to_pil()]
+        finally:
+            doc.close()
+    # without a renderer, scanned pages still carry their scan as embedded images
+    from PIL import Image
+    images = []
+    for embedded in page.images:
+        try:
+            images.append(Image.open(BytesIO(embedded.data)))
+        except Exception:
+            continue
+    return images
+
+def _ocr_words(images, clarity):
+    # word boxes of several images of one page, stacked top to bottom. Boxes are in the
+    # preprocessed image's frame (rescaled to the OCR DPI, enlarged by deskewing), so that
+    # is the height each image is offset by.
+    from ocr import preprocess, recognize_data
+    words, offset = [], 0
+    for img in images:
+        img = preprocess(img, clarity)
+        img_words = words_from_tsv(recognize_data(img))
+        words.extend((x0, y0 + offset, x1, y1 + offset, text) for x0, y0, x1, y1, text in img_words)
+        offset += img.height
+    return words
+
+def _extract_pdf_page(data, reader, index, clarity, layout=False):
+    # the page's text, or with layout=True its word boxes
+    page = reader.pages[index]
+    if layout:
+        words = pdf_page_words(page)
+        if words:
+            return words
+    page_text = page.extract_text() or ""
+    if page_text.strip():
+        return text_words(page_text) if layout else page_text
+    # no text layer: OCR whatever the page looks like (pages are already spread over workers)
+    images = _rasterize_pdf_page(data, page, index)
+    if layout:
+        return _ocr_words(images, clarity)
+    from ocr import ocr_image
+    texts = []
+    for img in images:
+        ocr_text = ocr_image(img, clarity=clarity, workers=1)
+        if ocr_text:
+            texts.append(ocr_text)
+    return "\n".join(texts)
+
+_pdf_worker_doc = None
+
+def _init_pdf_worker(data, clarity, layout=False):
+    global _pdf_worker_doc
+    from PyPDF2 import PdfReader
+    # each worker parses the document once, then serves any number of page ranges
+    _pdf_worker_doc = (data, PdfReader(BytesIO(data)), clarity, layout)
+
+def _extract_pdf_range(indices):
+    data, reader, clarity, layout = _pdf_worker_doc
+    return [(i, _extract_pdf_page(data, reader, i, clarity, layout)) for i in indices]
+
+def _extract_pdf_pages(data, on_progress, workers, clarity, layout=False):
+    from PyPDF2 import PdfReader
+    reader = PdfReader(BytesIO(data))
+    total = len(reader.pages)
+    pages = [None] * total
+    _notify(on_progress, STAGE_EXTRACT, 0, total)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, total)
+    if workers <= 1 or total < PDF_PARALLEL_MIN_PAGES:
+        for i in range(total):
+            pages[i] = _extract_pdf_page(data, reader, i, clarity, layout)
+            _notify(on_progress, STAGE_EXTRACT, i + 1, total)
+    else:
+        # several interleaved page sets per worker keep the pool busy when scanned pages cluster together
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        n_chunks = min(total, workers * 4)
+        chunks = [range(total)[k::n_chunks] for k in range(n_chunks)]
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pdf_worker, initargs=(data, clarity, layout)) as pool:
+            for fut in as_completed([pool.submit(_extract_pdf_range, list(c)) for c in chunks]):
+                extracted = fut.result()
+                for i, page_text in extracted:
+                    pages[i] = page_text
+                done += len(extracted)
+                _notify(on_progress, STAGE_EXTRACT, done, total)
+    return pages
+
+def extract_text_from_pdf(uploaded_file, on_progress=None, workers=None, clarity=DEFAULT_CLARITY):
+    pages = _extract_pdf_pages(uploaded_file.read(), on_progress, workers, clarity)
+    return "\n".join(p for p in pages if p).strip()
+
+def extract_words_from_pdf(uploaded_file, on_progress=None, workers=None, clarity=DEFAULT_CLARITY):
+    # one list of word boxes per page, for layout.read_tables
+    return _extract_pdf_pages(uploaded_file.read(), on_progress, workers, clarity, layout=True)
+
+def extract_text_from_image(uploaded_file, on_progress=None, workers=None, clarity=DEFAULT_CLARITY):
+    from PIL import Image
+    from ocr import ocr_image
+    img = Image.open(uploaded_file)
+    bands_progress = None
+    if on_progress is not None:
+        bands_progress = lambda done, total: on_progress(STAGE_EXTRACT, done, total)
+    return ocr_image(img, clarity=clarity, workers=workers, on_progress=bands_progress)
+
+def extract_words_from_image(uploaded_file, on_progress=None, clarity=DEFAULT_CLARITY):
+    from PIL import Image
+    _notify(on_progress, STAGE_EXTRACT, 0, 1)
+    words = _ocr_words([Image.open(uploaded_file)], clarity)
+    _notify(on_progress, STAGE_EXTRACT, 1, 1)
+    return [words]
+
+def extract_text_from_txt(uploaded_file):
+    return uploaded_file.read().decode("utf-8").strip()
+
+# -------------------------
+# Basic field detection
+# -------------------------
+def clean_extracted_name(raw_name):
+    if not raw_name:
+        return ""
+    s = raw_name.strip()
+    s = re.sub(r'\s+Age.*$', '', s, flags=re.IGNORECASE)
+    s = re.sub(r'^(name[:\-\s]*)', '', s, flags=re.IGNORECASE)
+    return s.strip()
+
+def find_basic_fields(text):
+    info = {}
+    name_match = re.search(r'(?:Name|Patient Name)\s*[:\-]?\s*(.+?)(?:\s{2,}|\s+Age\b|\n|$)', text, re.IGNORECASE)
+    sex_match = re.search(r'\bSex\s*[:\-]?\s*(Male|Female|M|F)\b', text, re.IGNORECASE)
+    age_match = re.search(r'Age\s*[:\-]?\s*(\d{1,3})', text, re.IGNORECASE)
+    date_match = re.search(r'\bDate\s*[:\-]?\s*([0-3]?\d[\/\-\s][01]?\d[\/\-\s]\d{2,4}|\d{4}-\d{2}-\d{2})', text, re.IGNORECASE)
+    raw_name = name_match.group(1).strip() if name_match else ""
+    info['Name'] = clean_extracted_name(raw_name) if raw_name else ""
+    info['Sex'] = (sex_match.group(1).strip() if sex_match else "")
+    info['Age'] = (age_match.group(1).strip() if age_match else "")
+    info['Report Date'] = (date_match.group(1).strip() if date_match else "")
+    return info
+
+# -------------------------
+# Parsing
+# -------------------------
+def normalize_number(s):
+    if s is None:
+        return None
+    s = str(s).replace(',', '.').strip()
+    m = re.findall(r'-?\d+\.?\d*', s)
+    if not m:
+        return None
+    try:
+        return float(m[0])
+    except:
+        return None
+
+# Line patterns, tried in this order; the first that matches decides the line.
+_QUAL_MARKER_RE = re.compile(r'\b(HBsAg|HBs Ag|HBs|VDRL|V\.D\.R\.L|V D R L|HCV|H\.C\.V|Tri[- ]Dot|H\.B & H\.B|H\.B & H\.B s Ag)\b.*?[:\-]?\s*([A-Za-z \-\(\)0-9/:]+)', re.IGNORECASE)
+_NUMERIC_RE = re.compile(r'([A-Za-z .%()&/-]{3,50})\s+(:\s*)?(-?\d{1,3}\.?\d+)\s*([A-Za-z/%µμlhL]*)')
+_NUMERIC_LOOSE_RE = re.compile(r'([A-Za-z .]{2,40})\s+[:\-]?\s*(\d{2,7}\.?\d*)\s*(?:/|per)?\s*([A-Za-z/%µμlhL]*)')
+_QUAL_INLINE_RE = re.compile(r'([A-Za-z .&/()-]{3,40})\s*[:\-]?\s*(Negative|Positive|Reactive|Non\s*-\s*Reactive|Non\s*Reactive|Non-Reactive|Not detected|Detected)', re.IGNORECASE)
+# Cheap necessary conditions for the patterns above, so most lines skip the expensive searches:
+# every marker contains one of _QUAL_MARKER_HINTS, both numeric patterns need a digit, and
+# every qualitative result word contains "tive" or "detected". The substring hints are only
+# exact for ASCII lines (IGNORECASE also folds e.g. the long s), so other lines use the regexes.
+_QUAL_MARKER_HINTS = ('hbs', 'vdrl', 'v.d.r.l', 'v d r l', 'hcv', 'h.c.v', 'tri', 'h.b &')
+_DIGIT_RE = re.compile(r'\d')
+_QUAL_WORD_RE = re.compile(r'tive|detected', re.IGNORECASE)
+_MULTISPACE_RE = re.compile(r'\s{2,}')
+# OCR garbage can produce enormous "lines"; bounding them bounds the regex work per line
+MAX_LINE_LENGTH = 2000
+
+def parse_lab_line(ln):
+    ln_clean = _MULTISPACE_RE.sub(' ', ln.strip()[:MAX_LINE_LENGTH])
+    low = ln_clean.lower() if ln_clean.isascii() else None
+    if low is None or any(h in low for h in _QUAL_MARKER_HINTS):
+        m = _QUAL_MARKER_RE.search(ln_clean)
+        if m:
+            return {'name': m.group(1).strip(), 'value_raw': m.group(2).strip(), 'type': 'qualitative', 'line': ln_clean}
+    if _DIGIT_RE.search(ln_clean):
+        m = _NUMERIC_RE.search(ln_clean)
+        if m:
+            return {'name': m.group(1).strip(), 'value_raw': m.group(3).strip(), 'unit': m.group(4).strip(), 'type': 'numeric', 'line': ln_clean}
+        m = _NUMERIC_LOOSE_RE.search(ln_clean)
+        if m:
+            return {'name': m.group(1).strip(), 'value_raw': m.group(2).strip(), 'unit': m.group(3).strip(), 'type': 'numeric', 'line': ln_clean}
+    if ('tive' in low or 'detected' in low) if low is not None else _QUAL_WORD_RE.search(ln_clean):
+        m = _QUAL_INLINE_RE.search(ln_clean)
+        if m:
+            return {'name': m.group(1).strip(), 'value_raw': m.group(2).strip(), 'type': 'qualitative', 'line': ln_clean}
+    return None
+
+def iter_lab_lines(lines):
+    # accepts a whole text or any iterable of lines (e.g. a file or a page stream)
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    for ln in lines:
+        if not ln.strip():
+            continue
+        test = parse_lab_line(ln)
+        if test is not None:
+            yield test
+
+def parse_lab_lines(text, on_progress=None):
+    if on_progress is None:
+        return list(iter_lab_lines(text))
+    lines = [ln for ln in text.splitlines() if ln.strip()]
+    tests = []
+    total = len(lines)
+    _notify(on_progress, STAGE_PARSE, 0, total)
+    for i, ln in enumerate(lines, 1):
+        test = parse_lab_line(ln)
+        if test is not None:
+            tests.append(test)
+        on_progress(STAGE_PARSE, i, total)
+    return tests
+
+def map_test_name(raw):
+    return resolve_test_name(raw)
+
+# -------------------------
+# Interpretation
+# -------------------------
+def interpret_many(reports, on_progress=None):
+    # reports: list of (parsed tests, basic fields); see rules.interpret_rows
+    from rules import interpret_rows
+    reports = list(reports)
+    total = sum(len(tests) for tests, _ in reports)
+    _notify(on_progress, STAGE_INTERPRET, 0, total)
+    results = interpret_rows(reports)
+    _notify(on_progress, STAGE_INTERPRET, total, total)
+    return results
+
+def interpret_tests(tests, basic_info, on_progress=None):
+    return interpret_many([(tests, basic_info)], on_progress=on_progress)[0]
+
+def build_summary_and_abnormals(interpreted):
+    abnormalities = [r for r in interpreted if r.get('Flag')]
+    lines = []
+    for r in interpreted:
+        val = r.get('Value')
+        ref = r.get('Reference','')
+        if r.get('Flag'):
+            lines.append(f"{r['Test']}: {r['Flag']} ({val}) — {r.get('Note','')}{(' — ref: '+ref) if ref else ''}")
+        else:
+            lines.append(f"{r['Test']}: {val}{(' '+r.get('Unit','')) if r.get('Unit') else ''}")
+    summary = "\n".join(lines) if lines else "No lab values detected."
+    return summary, abnormalities
+
+# -------------------------
+# Whole-report pipeline
+# -------------------------
+PDF_EXTS = ('.pdf',)
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+TEXT_EXTS = ('.txt',)
+SUPPORTED_EXTS = PDF_EXTS + IMAGE_EXTS + TEXT_EXTS
+
+MIME_KINDS = {
+    'application/pdf': 'pdf',
+    'image/jpeg': 'image',
+    'image/jpg': 'image',
+    'image/png': 'image',
+    'text/plain': 'text',
+}
+
+def detect_kind(filename, mime=None):
+    if mime and mime in MIME_KINDS:
+        return MIME_KINDS[mime]
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in PDF_EXTS:
+        return 'pdf'
+    if ext in IMAGE_EXTS:
+        return 'image'
+    if ext in TEXT_EXTS:
+        return 'text'
+    return None
+
+def extract_text(uploaded_file, kind, on_progress=None, workers=None, clarity=DEFAULT_CLARITY):
+    if kind == 'pdf':
+        return extract_text_from_pdf(uploaded_file, on_progress=on_progress, workers=workers, clarity=clarity)
+    if kind == 'image':
+        return extract_text_from_image(uploaded_file, on_progress=on_progress, workers=workers, clarity=clarity)
+    if kind == 'text':
+        text = extract_text_from_txt(uploaded_file)
+        _notify(on_progress, STAGE_EXTRACT, 1, 1)
+        return text
+    return ""
+
+# kinds that can be read as word boxes (layout=True); plain text has no layout to keep
+LAYOUT_KINDS = ('pdf', 'image')
+
+def extract_words(uploaded_file, kind, on_progress=None, workers=None, clarity=DEFAULT_CLARITY):
+    if kind == 'pdf':
+        return extract_words_from_pdf(uploaded_file, on_progress=on_progress, workers=workers, clarity=clarity)
+    if kind == 'image':
+        return extract_words_from_image(uploaded_file, on_progress=on_progress, clarity=clarity)
+    return []
+
+def _summarize(report, results):
+    summary, abnormals = build_summary_and_abnormals(results)
+    report.update({'results': results, 'summary': summary, 'abnormal_count': len(abnormals)})
+    return report
+
+def analyze_text(raw_text, on_progress=None):
+    basic = find_basic_fields(raw_text)
+    parsed = parse_lab_lines(raw_text, on_progress=on_progress)
+    return _summarize({'basic': basic}, interpret_tests(parsed, basic, on_progress=on_progress))
+
+def _recording(on_progress, work):
+    # keeps the last count seen per stage on the report, then forwards the event
+    def record(stage, done, total):
+        work[stage] = done
+        _notify(on_progress, stage, done, total)
+    return record
+
+# a range printed on a line: "11 - 32", "< 200", "≥ 40"
+_PRINTED_RANGE_HINT_RE = re.compile(r'\d\s*[-–]\s*\d|[<>≤≥]\s*\d')
+
+def _needs_layout(tests):
+    # the line pass found no tests, or a numeric test whose line prints a range: only the
+    # layout pass reads that range, and it wins over the rule table, so a report's flags
+    # must not depend on whether some other row sends it through the layout pass
+    return not tests or any(t['type'] == 'numeric' and _PRINTED_RANGE_HINT_RE.search(t['line']) for t in tests)
+
+def _text_layer_pass(data, progress, trace):
+    # layout=True on a PDF: the text layer through the line parser first, about 4 ms a page
+    # against 10 for word boxes. (raw_text, tests), or None when a page has no text layer
+    # (it is OCRed once, by the layout pass) or the layout pass is needed after all.
+    from PyPDF2 import PdfReader
+    with trace.span(STAGE_EXTRACT, bytes_in=len(data)) as span:
+        reader = PdfReader(BytesIO(data))
+        texts = []
+        for page in reader.pages:
+            page_text = page.extract_text() or ""
+            if not page_text.strip():
+                return None
+            texts.append(page_text)
+        raw_text = "\n".join(texts).strip()
+        span.chars_out, span.pages = len(raw_text), len(texts)
+    with trace.span(STAGE_PARSE) as span:
+        lines = [ln for ln in raw_text.splitlines() if ln.strip()]
+        tests = list(iter_lab_lines(lines))
+        span.lines, span.items = len(lines), len(tests)
+    if _needs_layout(tests):
+        return None
+    _notify(progress, STAGE_EXTRACT, len(texts), len(texts))
+    _notify(progress, STAGE_PARSE, len(lines), len(lines))
+    return raw_text, tests
+
+def _extract_and_parse_layout(data, kind, progress, workers, clarity, trace):
+    # word boxes -> table rows; rows outside a table go through the line parser
+    with trace.span(STAGE_EXTRACT, bytes_in=len(data)) as extract_span:
+        pages = extract_words(BytesIO(data), kind, on_progress=progress, workers=workers, clarity=clarity)
+        extract_span.pages = len(pages)
+    with trace.span(STAGE_PARSE) as span:
+        tests, lines = read_tables(pages, parse_lab_line)
+        _notify(progress, STAGE_PARSE, len(lines), len(lines))
+        span.lines, span.items = len(lines), len(tests)
+    raw_text = "\n".join(lines).strip()
+    extract_span.chars_out = len(raw_text)
+    return raw_text, tests
+
+def _extract_and_parse(data, kind, on_progress, workers, clarity, trace, layout=False):
+    work = {}
+    report = {'kind': kind, 'raw_text': '', 'basic': {}, 'results': [], 'summary': '', 'abnormal_count': 0,
+              'error': None, 'work': work}
+    if kind is None:
+        report['error'] = "Unsupported file type"
+        return report, None
+    progress = _recording(on_progress, work)
+    first = _text_layer_pass(data, progress, trace) if layout and kind == 'pdf' else None
+    if first is not None:
+        raw_text, tests = first
+    elif layout and kind in LAYOUT_KINDS:
+        raw_text, tests = _extract_and_parse_layout(data, kind, progress, workers, clarity, trace)
+    else:
+        with trace.span(STAGE_EXTRACT, bytes_in=len(data)) as span:
+            raw_text = extract_text(BytesIO(data), kind, on_progress=progress, workers=workers, clarity=clarity)
+            span.chars_out = len(raw_text)
+            span.pages = work.get(STAGE_EXTRACT, 0) if kind == 'pdf' else 1
+        tests = None
+    report['raw_text'] = raw_text
+    if not raw_text.strip():
+        report['error'] = "No text could be extracted"
+        return report, None
+    if tests is not None:
+        report['basic'] = find_basic_fields(raw_text)
+        return report, tests
+    with trace.span(STAGE_PARSE) as span:
+        report['basic'] = find_basic_fields(raw_text)
+        tests = parse_lab_lines(raw_text, on_progress=progress)
+        span.lines, span.items = work.get(STAGE_PARSE, 0), len(tests)
+    return report, tests
+
+def report_settings(kind, clarity=DEFAULT_CLARITY, layout=False):
+    # everything besides the file's bytes that decides its report (part of the cache key)
+    settings = {'kind': kind}
+    if kind in ('pdf', 'image'):
+        settings['clarity'] = clarity
+        if layout:
+            settings['layout'] = True
+    return settings
+
+def analyze_many(items, cache=None, on_progress=None, workers=None, clarity=DEFAULT_CLARITY, catch_errors=False,
+                 trace=False, layout=False):
+    # items: iterable of (data, filename, mime). Extraction and parsing run per document;
+    # interpretation runs once over every parsed row of every document.
+    # Every report gets 'timings' (wall seconds per stage); trace=True also attaches the
+    # per-stage spans (CPU time, bytes in, characters out, pages, lines) as 'trace'.
+    # layout=True reads PDFs and images as word boxes and takes table rows cell by cell
+    # (see layout.read_tables), which also keeps the reference range printed per row.
+    items = list(items)
+    reports, pending = [], []
+    for data, filename, mime in items:
+        kind = detect_kind(filename, mime)
+        key = None
+        if cache is not None and kind is not None:
+            key = cache_key(data, **report_settings(kind, clarity, layout))
+            cached = cache.get(key)
+            if cached is not None:
+                # stage timings belong to the run that filled the cache
+                hit = dict(cached, cached=True, timings={})
+                hit.pop('trace', None)
+                reports.append(dict(hit, trace=[]) if trace else hit)
+                continue
+        report_trace = Trace()
+        try:
+            report, tests = _extract_and_parse(data, kind, on_progress, workers, clarity, report_trace, layout)
+        except Exception as exc:
+            if not catch_errors:
+                raise
+            reports.append({'kind': kind, 'basic': {}, 'results': [], 'summary': '', 'abnormal_count': 0,
+                            'error': f"{type(exc).__name__}: {exc}"})
+            continue
+        reports.append(report)
+        pending.append((report, tests, key, report_trace))
+    parsed = [(report, tests, report_trace) for report, tests, _, report_trace in pending if tests is not None]
+    wall, cpu = time.perf_counter(), time.thread_time()
+    interpreted = interpret_many([(tests, report['basic']) for report, tests, _ in parsed], on_progress=on_progress)
+    wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+    for (report, _, report_trace), results in zip(parsed, interpreted):
+        _summarize(report, results)
+        report['work'][STAGE_INTERPRET] = len(results)
+        # one shared pass: each report records the whole pass
+        report_trace.add(STAGE_INTERPRET, wall, cpu, items=len(results))
+    for report, _, key, report_trace in pending:
+        report['timings'] = report_trace.timings()
+        if trace:
+            report['trace'] = report_trace.to_list()
+        if key is not None:
+            cache.put(key, report)
+    # cached reports are shared, so every caller gets a copy carrying its own upload's name
+    return [dict(report, source=filename) for report, (_, filename, _) in zip(reports, items)]
+
+def analyze_bytes(data, filename, mime=None, cache=None, on_progress=None, workers=None, clarity=DEFAULT_CLARITY,
+                  trace=False, layout=False):
+    return analyze_many([(data, filename, mime)], cache=cache, on_progress=on_progress, workers=workers, clarity=clarity,
+                        trace=trace, layout=layout)[0]
+
+# -------------------------
+# Streaming
+# -------------------------
+# For very long reports: pages are pulled one at a time, parsed line by line and
+# interpreted in chunks, so memory is bounded by a page plus a chunk of results and the
+# first results are out before the last page is read. The cache is not used here.
+STREAM_CHUNK_TESTS = 256
+# basic fields (name, age, sex, date) are looked for in the first pages only
+STREAM_BASIC_PAGES = 2
+# fields the reference ranges depend on; results interpreted before they were found are redone
+STREAM_RANGE_FIELDS = ('Age', 'Sex')
+# plain text has no pages; this many lines count as one
+STREAM_TEXT_PAGE_LINES = 500
+
+def iter_pdf_page_texts(fileobj, clarity=DEFAULT_CLARITY):
+    # PdfReader seeks in the file object and loads page content on demand
+    from PyPDF2 import PdfReader
+    from ocr import ocr_image
+    reader = PdfReader(fileobj)
+    for i, page in enumerate(reader.pages):
+        page_text = page.extract_text() or ""
+        if not page_text.strip():
+            texts = [ocr_image(img, clarity=clarity, workers=1) for img in _rasterize_pdf_page(fileobj, page, i)]
+            page_text = "\n".join(t for t in texts if t)
+        yield page_text
+
+def iter_text_pages(fileobj, page_lines=STREAM_TEXT_PAGE_LINES):
+    text = TextIOWrapper(fileobj, encoding="utf-8")
+    try:
+        page = []
+        for ln in text:
+            page.append(ln)
+            if len(page) >= page_lines or '\f' in ln:
+                yield "".join(page)
+                page = []
+        if page:
+            yield "".join(page)
+    finally:
+        # leave the caller's file open
+        text.detach()
+
+def iter_page_texts(fileobj, kind, clarity=DEFAULT_CLARITY):
+    if kind == 'pdf':
+        yield from iter_pdf_page_texts(fileobj, clarity)
+    elif kind == 'image':
+        from PIL import Image
+        from ocr import ocr_image
+        yield ocr_image(Image.open(fileobj), clarity=clarity, workers=1)
+    elif kind == 'text':
+        yield from iter_text_pages(fileobj)
+
+def analyze_stream(fileobj, filename, mime=None, clarity=DEFAULT_CLARITY, chunk_tests=STREAM_CHUNK_TESTS,
+                   on_progress=None):
+    # yields ('basic', fields) after the first page and again whenever a later header page
+    # fills in a missing field, ('results', [result, ...]) per interpreted chunk, and finally
+    # ('done', totals); totals count pages, lines, tests and abnormal results. When age or sex
+    # is only found after results went out, ('revised', [result, ...]) re-interprets them: it
+    # replaces that many results from the start.
+    kind = detect_kind(filename, mime)
+    if kind is None:
+        raise ValueError("Unsupported file type")
+    totals = {'pages': 0, 'lines': 0, 'tests': 0, 'abnormal_count': 0}
+    basic, head, pending = None, [], []
+    # tests already emitted while the header was still being read, and their results
+    early, early_results = [], []
+
+    def flush():
+        results = interpret_many([(pending, basic)])[0]
+        if head is not None:
+            early.extend(pending)
+            early_results.extend(results)
+        pending.clear()
+        totals['tests'] += len(results)
+        totals['abnormal_count'] += sum(1 for r in results if r.get('Flag'))
+        _notify(on_progress, STAGE_INTERPRET, totals['tests'], 0)
+        return results
+
+    for page_text in iter_page_texts(fileobj, kind, clarity):
+        totals['pages'] += 1
+        _notify(on_progress, STAGE_EXTRACT, totals['pages'], 0)
+        lines = [ln for ln in page_text.splitlines() if ln.strip()]
+        totals['lines'] += len(lines)
+        pending.extend(iter_lab_lines(lines))
+        _notify(on_progress, STAGE_PARSE, totals['lines'], 0)
+        if head is not None:
+            head.append(page_text)
+            found = find_basic_fields("\n".join(head))
+            if basic is None:
+                basic = found
+                yield 'basic', basic
+            elif any(found[k] and not basic[k] for k in found):
+                ranges_changed = any(found[k] and not basic[k] for k in STREAM_RANGE_FIELDS)
+                basic = {k: basic[k] or found[k] for k in found}
+                yield 'basic', basic
+                if ranges_changed and early:
+                    revised = interpret_many([(early, basic)])[0]
+                    totals['abnormal_count'] += (sum(1 for r in revised if r.get('Flag')) -
+                                                 sum(1 for r in early_results if r.get('Flag')))
+                    early_results[:] = revised
+                    yield 'revised', revised
+            if totals['pages'] >= STREAM_BASIC_PAGES or all(basic.values()):
+                head, early, early_results = None, None, None
+        # the first chunk goes out as soon as there is one, later ones once they are full
+        if pending and (len(pending) >= chunk_tests or not totals['tests']):
+            yield 'results', flush()
+    if basic is None:
+        basic = find_basic_fields("")
+        yield 'basic', basic
+    if pending:
+        yield 'results', flush()
+    yield 'done', totals
@@ -0,0 +1,184 @@
+import csv
+import math
+import os
+import re
+from collections import namedtuple
+
+from analytes import resolve_test_name
+from units import UnitRegistry
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "reference_ranges.csv")
+
+QUAL_RESULTS_POSITIVE = ['positive', 'reactive', 'detected', 'reactivity']
+QUAL_RESULTS_NEGATIVE = ['negative', 'non-reactive', 'non reactive', 'not detected', 'nonreactive', 'non - reactive']
+_QUAL_NEGATIVE_RE = '|'.join(re.escape(x) for x in QUAL_RESULTS_NEGATIVE)
+_QUAL_POSITIVE_RE = '|'.join(re.escape(x) for x in QUAL_RESULTS_POSITIVE)
+
+# Note on a result whose unit has no conversion into the unit its ranges are written in
+UNIT_NOT_RECOGNISED = "Unit not recognised; not compared with the reference range"
+
+_RULE_NUMBER_COLUMNS = ('age_min', 'age_max', 'low', 'high')
+
+# -------------------------
+# Rule table
+# -------------------------
+def _rule_number(text):
+    return float(text) if text else math.nan
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    # one Rule per row, in table order; blank numbers are NaN, blank sex is U (any)
+    with open(path, encoding="utf-8", newline='') as fh:
+        reader = csv.DictReader(ln for ln in fh if not ln.startswith('#'))
+        Rule = namedtuple('Rule', [c.strip() for c in reader.fieldnames])
+        rules = []
+        for row in reader:
+            row = {k.strip(): (v or '').strip() for k, v in row.items()}
+            for col in _RULE_NUMBER_COLUMNS:
+                row[col] = _rule_number(row[col])
+            row['sex'] = row['sex'].upper() or 'U'
+            rules.append(Rule(**row))
+    return rules
+
+def canonical_units(rules):
+    # the unit each analyte's ranges are written in; results are converted into it before comparison
+    units = {}
+    for rule in rules:
+        if rule.unit:
+            units.setdefault(rule.analyte, rule.unit)
+    return units
+
+def rule_index(rules):
+    # analyte -> its rules in table order, for row-by-row matching
+    index = {}
+    for rule in rules:
+        index.setdefault(rule.analyte, []).append(rule)
+    return index
+
+DEFAULT_RULES = load_rules()
+DEFAULT_RULE_INDEX = rule_index(DEFAULT_RULES)
+DEFAULT_UNITS = UnitRegistry.from_csv(canonical_units(DEFAULT_RULES))
+
+# -------------------------
+# Patient
+# -------------------------
+def sex_key(sex):
+    if sex and re.match(r'^(male|m)$', sex, re.I):
+        return 'M'
+    if sex and re.match(r'^(female|f)$', sex, re.I):
+        return 'F'
+    return 'U'
+
+def _age_years(age):
+    m = re.match(r'\s*(\d{1,3})', str(age or ''))
+    return float(m.group(1)) if m else math.nan
+
+# -------------------------
+# Interpretation
+# -------------------------
+# Row by row against the rule index: ~8 us per row, with no per-call setup, so a single
+# report costs no more than its rows.
+_NUMBER_RE = re.compile(r'(-?\d+\.?\d*)')
+# printed ranges: "13.0 - 17.0", "4.0 to 10.0", "< 200", "Up to 40", "> 40"
+_PRINTED_BETWEEN = re.compile(r'(-?\d+\.?\d*)\s*(?:-|–|to)\s*(-?\d+\.?\d*)')
+_PRINTED_BELOW = re.compile(r'(?:<=?|≤|up\s*to|upto|less\s+than|below)\s*(\d+\.?\d*)')
+_PRINTED_ABOVE = re.compile(r'(?:>=?|≥|more\s+than|above|greater\s+than)\s*(\d+\.?\d*)')
+_QUAL_NEGATIVE = re.compile(_QUAL_NEGATIVE_RE)
+_QUAL_POSITIVE = re.compile(_QUAL_POSITIVE_RE)
+
+def _text(value):
+    # cell text; None and NaN read as ''
+    if type(value) is str:
+        return value
+    return '' if value is None or value != value else str(value)
+
+def _number(text):
+    m = _NUMBER_RE.search(text.replace(',', '.'))
+    return float(m.group(1)) if m else math.nan
+
+def _printed_range(text):
+    s = text.replace(',', '.').lower()
+    m = _PRINTED_BETWEEN.search(s)
+    if m:
+        return float(m.group(1)), float(m.group(2))
+    above, below = _PRINTED_ABOVE.search(s), _PRINTED_BELOW.search(s)
+    return float(above.group(1)) if above else math.nan, float(below.group(1)) if below else math.nan
+
+def _pick_rule(candidates, sex, age):
+    # most specific fitting rule: age band > own sex > U; earlier rows win ties
+    best, best_score = None, -1
+    for rule in candidates:
+        if rule.sex != sex and rule.sex != 'U':
+            continue
+        banded = not (math.isnan(rule.age_min) and math.isnan(rule.age_max))
+        if banded and not ((math.isnan(rule.age_min) or age >= rule.age_min) and
+                           (math.isnan(rule.age_max) or age <= rule.age_max)):
+            continue
+        score = banded * 2 + (rule.sex == sex)
+        if score > best_score:
+            best, best_score = rule, score
+    return best
+
+def _interpret_row(t, sex, age, index, picked, units):
+    # picked: analyte -> rule already chosen for this patient
+    test = resolve_test_name(_text(t.get('name', '')))
+    value_raw = t.get('value_raw', '')
+    if t['type'] == 'qualitative':
+        status = _text(value_raw).strip()
+        lower = status.lower()
+        if _QUAL_NEGATIVE.search(lower):
+            status = 'Negative'
+        elif _QUAL_POSITIVE.search(lower):
+            status = 'Positive'
+        return {'Test': test, 'Value': status, 'Unit': '', 'Flag': None, 'Note': _text(t.get('line', '')),
+                'Reference': '', 'Original Value': None, 'Original Unit': None}
+    raw_num = _number(_text(value_raw))
+    raw_unit = _text(t.get('unit', ''))
+    num, unit, converted, source_unit, unrecognised = units.convert_one(test, raw_num, raw_unit,
+                                                                        line=_text(t.get('line', '')))
+    flag, note, reference = None, UNIT_NOT_RECOGNISED if unrecognised else '', ''
+    rule = None
+    if num == num:
+        if test in picked:
+            rule = picked[test]
+        else:
+            rule = picked[test] = _pick_rule(index.get(test, ()), sex, age)
+        if rule is not None:
+            reference = rule.reference
+            if not unrecognised and num < rule.low and rule.low_flag:
+                flag, note = rule.low_flag, rule.low_note
+            elif not unrecognised and num > rule.high and rule.high_flag:
+                flag, note = rule.high_flag, rule.high_note
+    printed = t.get('reference')
+    printed = _text(printed).strip() if printed else ''
+    if printed and raw_num == raw_num:
+        p_low, p_high = _printed_range(printed)
+        if not (math.isnan(p_low) and math.isnan(p_high)):
+            # a range printed on the report wins over the table: it is the lab's own, for its own
+            # method and population. It is in the report's unit, so the printed value is compared;
+            # the table still says whether a side matters (e.g. a low ESR is not flagged).
+            low_flag, high_flag = (rule.low_flag, rule.high_flag) if rule is not None else ('Low', 'High')
+            flag, note = None, ''
+            if raw_num < p_low and low_flag:
+                flag, note = low_flag, rule.low_note if rule is not None else ''
+            elif raw_num > p_high and high_flag:
+                flag, note = high_flag, rule.high_note if rule is not None else ''
+            reference = printed + (' ' + raw_unit if raw_unit else '')
+    if num == num:
+        # converted counts come out whole ("1.2 lakhs" -> 120000); keep them integers
+        value = int(num) if converted and num == round(num) else num
+    else:
+        value = value_raw
+    return {'Test': test, 'Value': value, 'Unit': unit, 'Flag': flag, 'Note': note, 'Reference': reference,
+            'Original Value': raw_num if converted else None, 'Original Unit': source_unit if converted else None}
+
+def interpret_rows(reports, rules=None, units=None):
+    # reports: iterable of (parsed tests, basic fields); per-report lists of result dicts
+    index = DEFAULT_RULE_INDEX if rules is None else rule_index(rules)
+    if units is None:
+        units = DEFAULT_UNITS
+    results = []
+    for tests, basic in reports:
+        sex, age = sex_key(basic.get('Sex', '')), _age_years(basic.get('Age', ''))
+        picked = {}
+        results.append([_interpret_row(t, sex, age, index, picked, units) for t in tests])
+    return results
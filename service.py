@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, quote, urlsplit
+
+from cache import ResultCache
+from instrument import Metrics
+from pipeline import DEFAULT_CLARITY, analyze_many, detect_kind
+
+# -------------------------
+# Settings
+# -------------------------
+# jobs admitted (queued + running) before new requests are turned away with 503
+DEFAULT_MAX_QUEUE = 64
+# text files and PDFs up to this size wait briefly so they can share one worker call
+SMALL_JOB_BYTES = 256 * 1024
+BATCH_WINDOW = 0.02
+BATCH_MAX_ITEMS = 16
+MAX_BODY_BYTES = 50 * 1024 * 1024
+RETRY_AFTER_SECONDS = 1
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 415: "Unsupported Media Type", 500: "Internal Server Error",
+            503: "Service Unavailable"}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# -------------------------
+# Worker
+# -------------------------
+_worker_cache = None
+
+def _init_worker(cache_dir):
+    global _worker_cache
+    if cache_dir:
+        _worker_cache = ResultCache(max_memory_bytes=8 * 1024 * 1024, disk_dir=cache_dir)
+
+def analyze_job(items, clarity):
+    # runs in the executor; requests are already spread over its workers, so one process per job
+    started = time.perf_counter()
+    reports = analyze_many(items, cache=_worker_cache, workers=1, clarity=clarity, catch_errors=True,
+                           trace=True)
+    elapsed = time.perf_counter() - started
+    for report in reports:
+        # reports may share dicts with the worker's cache; give each its own timings
+        report['timings'] = dict(report.get('timings') or {}, worker=elapsed)
+    return reports
+
+# -------------------------
+# Service
+# -------------------------
+class _Job:
+    def __init__(self, item, clarity, include_text, future):
+        self.item = item
+        self.clarity = clarity
+        self.include_text = include_text
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+class AnalysisService:
+    def __init__(self, workers=None, max_queue=DEFAULT_MAX_QUEUE, batch_window=BATCH_WINDOW,
+                 batch_max_items=BATCH_MAX_ITEMS, small_job_bytes=SMALL_JOB_BYTES, cache_dir=None, executor=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.batch_window = batch_window
+        self.batch_max_items = batch_max_items
+        self.small_job_bytes = small_job_bytes
+        # an injected executor (e.g. a ThreadPoolExecutor in tests) is not shut down by close()
+        self._own_executor = executor is None
+        self.executor = executor or ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                        initargs=(cache_dir,))
+        self._running = None
+        self._admitted = 0
+        # clarity -> small jobs waiting for the batch window to close, and the timer that closes it
+        self._batches = {}
+        self._timers = {}
+        self.stats = {'requests': 0, 'rejected': 0, 'reports': 0, 'batches': 0, 'batched_reports': 0}
+        self.metrics = Metrics()
+
+    def _semaphore(self):
+        # created lazily so it belongs to the loop that serves requests
+        if self._running is None:
+            self._running = asyncio.Semaphore(self.workers)
+        return self._running
+
+    def close(self):
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
+
+    # --- scheduling ---
+    async def _execute(self, jobs):
+        async with self._semaphore():
+            started = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            try:
+                reports = await loop.run_in_executor(self.executor, analyze_job, [j.item for j in jobs], jobs[0].clarity)
+            except Exception as exc:
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(exc)
+                return
+        for job, report in zip(jobs, reports):
+            report['timings']['queue'] = started - job.queued_at
+            if not job.include_text:
+                report.pop('raw_text', None)
+            if not job.future.done():
+                job.future.set_result(report)
+
+    def _flush(self, clarity):
+        # a batch flushed early must not leave its timer to cut the next batch's window short
+        timer = self._timers.pop(clarity, None)
+        if timer is not None:
+            timer.cancel()
+        jobs = self._batches.pop(clarity, None)
+        if jobs:
+            self.stats['batches'] += 1
+            self.stats['batched_reports'] += len(jobs)
+            asyncio.ensure_future(self._execute(jobs))
+
+    def _is_small(self, data, kind):
+        return kind in ('text', 'pdf') and len(data) <= self.small_job_bytes
+
+    async def submit(self, data, filename, mime=None, clarity=DEFAULT_CLARITY, include_text=False):
+        if self._admitted >= self.max_queue:
+            self.stats['rejected'] += 1
+            raise HttpError(503, "Analysis queue is full, retry later")
+        self._admitted += 1
+        try:
+            job = _Job((data, filename, mime), clarity, include_text, asyncio.get_running_loop().create_future())
+            if self._is_small(data, detect_kind(filename, mime)):
+                batch = self._batches.setdefault(clarity, [])
+                batch.append(job)
+                if len(batch) == 1:
+                    self._timers[clarity] = asyncio.get_running_loop().call_later(self.batch_window, self._flush,
+                                                                                  clarity)
+                if len(batch) >= self.batch_max_items:
+                    self._flush(clarity)
+            else:
+                asyncio.ensure_future(self._execute([job]))
+            report = await job.future
+        finally:
+            self._admitted -= 1
+        report['timings']['total'] = time.perf_counter() - job.queued_at
+        self.stats['reports'] += 1
+        self.metrics.observe_report(report)
+        for stage in ('queue', 'total'):
+            self.metrics.observe('request_seconds', report['timings'][stage], help_text="Time per report in the service",
+                                 stage=stage)
+        return report
+
+    # --- request handling ---
+    async def handle(self, method, target, headers, body):
+        # returns (status, extra headers, JSON payload); the transport lives in serve()
+        self.stats['requests'] += 1
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        routes = {'/health': ('GET', self._health), '/metrics': ('GET', self._metrics),
+                  '/analyze': ('POST', self._analyze), '/analyze/batch': ('POST', self._analyze_batch)}
+        try:
+            if url.path not in routes:
+                raise HttpError(404, f"No route for {url.path}")
+            allowed, handler = routes[url.path]
+            if method != allowed:
+                raise HttpError(405, f"Use {allowed} for {url.path}")
+            status, extra, payload = 200, {}, await handler(query, headers, body)
+        except HttpError as exc:
+            extra = {'Retry-After': str(RETRY_AFTER_SECONDS)} if exc.status == 503 else {}
+            status, payload = exc.status, {'error': str(exc)}
+        except Exception as exc:
+            status, extra, payload = 500, {}, {'error': f"{type(exc).__name__}: {exc}"}
+        self.metrics.inc('http_requests_total', help_text="HTTP requests by route and status",
+                         path=url.path if url.path in routes else 'other', status=status)
+        return status, extra, payload
+
+    async def _health(self, query, headers, body):
+        return {'status': 'ok', 'workers': self.workers, 'admitted': self._admitted,
+                'max_queue': self.max_queue, **self.stats}
+
+    async def _metrics(self, query, headers, body):
+        self.metrics.set('admitted_jobs', self._admitted, help_text="Jobs queued or running")
+        self.metrics.set('max_queue', self.max_queue, help_text="Admission limit")
+        # a str payload goes out as text/plain; see _write_response
+        return self.metrics.render()
+
+    def _clarity(self, value):
+        try:
+            clarity = int(value) if value not in (None, '') else DEFAULT_CLARITY
+        except ValueError:
+            raise HttpError(400, "clarity must be an integer") from None
+        return max(50, min(100, clarity))
+
+    async def _analyze(self, query, headers, body):
+        # body: the file itself; name from ?filename= or X-Filename, type from Content-Type
+        filename = query.get('filename') or headers.get('x-filename') or ''
+        mime = (headers.get('content-type') or '').split(';')[0].strip() or None
+        if detect_kind(filename, mime) is None:
+            raise HttpError(415, "Unsupported file type; send a PDF, JPG, PNG or TXT file")
+        if not body:
+            raise HttpError(400, "Empty request body")
+        return await self.submit(body, filename, mime, clarity=self._clarity(query.get('clarity')),
+                                 include_text=query.get('include_text') in ('1', 'true'))
+
+    async def _analyze_batch(self, query, headers, body):
+        # body: {"files": [{"filename": ..., "content": <base64>, "mime": ...}, ...]}
+        try:
+            files = json.loads(body or b'{}')['files']
+            items = [(base64.b64decode(f['content'], validate=True), f.get('filename', ''), f.get('mime')) for f in files]
+        except (ValueError, KeyError, TypeError, binascii.Error) as exc:
+            raise HttpError(400, f"Expected {{\"files\": [{{\"filename\", \"content\" (base64)}}]}}: {exc}") from None
+        if len(items) > self.max_queue:
+            raise HttpError(413, f"At most {self.max_queue} files per request")
+        if self._admitted + len(items) > self.max_queue:
+            # admit the whole request or none of it
+            self.stats['rejected'] += 1
+            raise HttpError(503, "Analysis queue is full, retry later")
+        clarity = self._clarity(query.get('clarity'))
+        include_text = query.get('include_text') in ('1', 'true')
+        reports = await asyncio.gather(*(self.submit(data, name, mime, clarity=clarity, include_text=include_text)
+                                         for data, name, mime in items), return_exceptions=True)
+        return {'reports': [{'source': name, 'error': f"{type(r).__name__}: {r}"} if isinstance(r, Exception) else r
+                            for r, (_, name, _) in zip(reports, items)]}
+
+    # --- HTTP/1.1 transport ---
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError:
+            raise HttpError(400, "Malformed request line") from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, "Content-Length must be an integer") from None
+        if length < 0:
+            raise HttpError(400, "Content-Length must not be negative")
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, f"Request body over {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    async def _write_response(self, writer, status, extra, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8'), "application/json"
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{k}: {v}" for k, v in extra.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as exc:
+                    await self._write_response(writer, exc.status, {}, {'error': str(exc)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, extra, payload = await self.handle(method, target, headers, body)
+                await self._write_response(writer, status, extra, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self._serve_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+# -------------------------
+# Local client
+# -------------------------
+class LocalClient:
+    """Calls a service in-process, without sockets; for tests and scripts."""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def request(self, method, path, body=b'', headers=None):
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        status, _, payload = await self.service.handle(method, path, headers, body)
+        return status, payload
+
+    async def analyze(self, data, filename, mime=None, clarity=None):
+        path = f"/analyze?filename={quote(filename, safe='')}" + (f"&clarity={clarity}" if clarity is not None else "")
+        return await self.request('POST', path, data, {'Content-Type': mime} if mime else None)
+
+    async def analyze_batch(self, files, clarity=None):
+        # files: iterable of (data, filename, mime)
+        body = json.dumps({'files': [{'filename': name, 'mime': mime, 'content': base64.b64encode(data).decode('ascii')}
+                                     for data, name, mime in files]}).encode('utf-8')
+        return await self.request('POST', "/analyze/batch" + (f"?clarity={clarity}" if clarity is not None else ""), body)
+
+# -------------------------
+# CLI
+# -------------------------
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve report analysis over HTTP (JSON).")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: number of CPU cores)")
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE, help="jobs admitted before answering 503 (default: %(default)s)")
+    parser.add_argument('--batch-window-ms', type=float, default=BATCH_WINDOW * 1000, help="how long small jobs wait to be batched (default: %(default)s)")
+    parser.add_argument('--cache-dir', help="on-disk result cache shared by workers and across restarts")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    service = AnalysisService(workers=args.workers, max_queue=args.max_queue,
+                              batch_window=args.batch_window_ms / 1000, cache_dir=args.cache_dir)
+    print(f"Serving on http://{args.host}:{args.port} with {service.workers} worker(s)", file=sys.stderr)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
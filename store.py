@@ -0,0 +1,228 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+
+DEFAULT_STORE_PATH = os.environ.get("REPORT_STORE_PATH", os.path.join(os.path.expanduser("~"), ".report-analyzer", "results.sqlite"))
+
+# -------------------------
+# Keys & dates
+# -------------------------
+def patient_key(patient_id=None, name=None, sex=None, born=None):
+    # an explicit ID wins; otherwise reports are grouped by the normalized patient name, sex and
+    # estimated birth year, so two patients who share a name are kept apart
+    if patient_id and str(patient_id).strip():
+        return str(patient_id).strip()
+    name = " ".join(str(name or '').lower().split())
+    if not name:
+        return None
+    sex = str(sex or '').strip()[:1].upper()
+    return f"name:{name}|{sex if sex in ('M', 'F') else ''}|{born or ''}"
+
+def patient_label(key):
+    # display name for a key made by patient_key
+    return key[len('name:'):].split('|')[0].title() if key.startswith('name:') else key
+
+def birth_year(age, on):
+    # from the age printed on a report dated `on` (ISO text); one year either way, by birthday
+    try:
+        age = int(str(age).strip())
+    except ValueError:
+        return None
+    return int(on[:4]) - age if 0 <= age < 130 else None
+
+_DATE_DMY_RE = re.compile(r'^\s*(\d{1,2})[\/\-\s.](\d{1,2})[\/\-\s.](\d{2,4})\s*$')
+_DATE_ISO_RE = re.compile(r'^\s*(\d{4})-(\d{2})-(\d{2})\s*$')
+
+def parse_report_date(text):
+    # report dates are printed day-first (12/03/2024 is 12 March); returns ISO text or None
+    m = _DATE_ISO_RE.match(text or '')
+    if m:
+        y, mo, d = (int(g) for g in m.groups())
+    else:
+        m = _DATE_DMY_RE.match(text or '')
+        if not m:
+            return None
+        d, mo, y = (int(g) for g in m.groups())
+        if y < 100:
+            y += 2000 if y < 70 else 1900
+        if mo > 12 and d <= 12:
+            # unambiguously month-first
+            d, mo = mo, d
+    try:
+        return datetime.date(y, mo, d).isoformat()
+    except ValueError:
+        return None
+
+# -------------------------
+# Store
+# -------------------------
+# Results are denormalized (patient and date on every row) so both query shapes are
+# answered from one index without touching the reports table:
+#   per patient + analyte over time  -> (patient_id, analyte, report_date)
+#   abnormal results since a date    -> (report_date, analyte, patient_id) over flagged rows only
+# report_date is NULL when no date is printed on the report.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    patient_name TEXT,
+    report_date TEXT,
+    date_printed INTEGER NOT NULL,
+    source TEXT,
+    fingerprint TEXT NOT NULL UNIQUE,
+    stored_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    patient_id TEXT NOT NULL,
+    analyte TEXT NOT NULL,
+    report_date TEXT,
+    value REAL,
+    value_text TEXT,
+    unit TEXT,
+    flag TEXT
+);
+CREATE INDEX IF NOT EXISTS results_by_patient ON results (patient_id, analyte, report_date);
+CREATE INDEX IF NOT EXISTS results_abnormal ON results (report_date, analyte, patient_id) WHERE flag IS NOT NULL;
+CREATE INDEX IF NOT EXISTS results_by_report ON results (report_id);
+"""
+
+def _fingerprint(patient_id, report_date, results):
+    # the same report stored twice (re-analysis, re-run batch) is recognized and skipped
+    rows = sorted((str(r.get('Test')), str(r.get('Value')), str(r.get('Unit') or '')) for r in results)
+    blob = json.dumps([patient_id, report_date, rows], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+class ResultStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # one connection shared by the app's session threads; the lock serializes use
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # with WAL a crash never corrupts the store; a power cut may lose the last few reports
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(_SCHEMA)
+
+    def _migrate(self):
+        # stores written before undated reports were kept undated have report_date NOT NULL
+        # and the analysis day in it; rebuild both tables with the column nullable
+        columns = {row[1]: row[3] for row in self._conn.execute("PRAGMA table_info(reports)")}
+        if not columns.get('report_date'):
+            return
+        self._conn.execute("PRAGMA foreign_keys=OFF")
+        with self._conn:
+            # DDL does not open a transaction by itself; the rebuild is all or nothing
+            self._conn.execute("BEGIN")
+            for table in ('reports', 'results'):
+                sql = self._conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                         (table,)).fetchone()[0]
+                sql = re.sub(rf'\b{table}\b', f"{table}_new", sql, count=1)
+                self._conn.execute(sql.replace("report_date TEXT NOT NULL", "report_date TEXT"))
+                self._conn.execute(f"INSERT INTO {table}_new SELECT * FROM {table}")
+                self._conn.execute(f"DROP TABLE {table}")
+                self._conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+            self._conn.execute("UPDATE reports SET report_date = NULL WHERE date_printed = 0")
+            self._conn.execute("UPDATE results SET report_date = NULL"
+                               " WHERE report_id IN (SELECT id FROM reports WHERE date_printed = 0)")
+
+    def close(self):
+        self._conn.close()
+
+    def patient_for(self, report, patient_id=None, today=None):
+        # the key add_report files this report under; without an explicit ID, a stored patient
+        # with the same name and sex whose birth year is one off is the same person
+        basic = report.get('basic') or {}
+        if patient_id and str(patient_id).strip():
+            return patient_key(patient_id)
+        on = parse_report_date(basic.get('Report Date', '')) or (today or datetime.date.today()).isoformat()
+        born = birth_year(basic.get('Age'), on)
+        key = patient_key(None, basic.get('Name'), basic.get('Sex'), born)
+        if key is None or born is None:
+            return key
+        near = [patient_key(None, basic.get('Name'), basic.get('Sex'), born + d) for d in (-1, 1)]
+        with self._lock:
+            found = {row[0] for row in self._conn.execute(
+                "SELECT DISTINCT patient_id FROM reports WHERE patient_id IN (?, ?, ?)", [key] + near)}
+        return next((k for k in [key] + near if k in found), key)
+
+    def add_report(self, report, patient_id=None, source=None, today=None):
+        # returns the new report id, or None when it was already stored or has no patient
+        basic = report.get('basic') or {}
+        pid = self.patient_for(report, patient_id, today)
+        results = report.get('results') or []
+        if pid is None or not results:
+            return None
+        # None when no readable date is printed on the report
+        report_date = parse_report_date(basic.get('Report Date', ''))
+        rows = []
+        for r in results:
+            value = r.get('Value')
+            number = float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+            rows.append((pid, r.get('Test'), report_date, number, None if number is not None else str(value),
+                         r.get('Unit') or None, r.get('Flag') or None))
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO reports (patient_id, patient_name, report_date, date_printed, source, fingerprint, stored_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (pid, basic.get('Name') or None, report_date, int(report_date is not None), source or report.get('source'),
+                 _fingerprint(pid, report_date, results), datetime.datetime.now().isoformat(timespec='seconds')))
+            if not cur.rowcount:
+                return None
+            report_id = cur.lastrowid
+            self._conn.executemany(
+                "INSERT INTO results (report_id, patient_id, analyte, report_date, value, value_text, unit, flag)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(report_id,) + row for row in rows])
+        return report_id
+
+    def _query(self, sql, params=()):
+        # pandas only for reading back; batch runs that just append never load it
+        import pandas as pd
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def series(self, patient_id, analyte, since=None, until=None):
+        # one analyte for one patient over time, oldest first; undated results come last
+        sql = ("SELECT report_date, value, value_text, unit, flag FROM results"
+               " WHERE patient_id = ? AND analyte = ?")
+        params = [patient_id, analyte]
+        if since:
+            sql += " AND report_date >= ?"
+            params.append(str(since))
+        if until:
+            sql += " AND report_date <= ?"
+            params.append(str(until))
+        return self._query(sql + " ORDER BY report_date IS NULL, report_date", params)
+
+    def abnormal_since(self, days, analyte=None, today=None):
+        # cohort view: patients with a flagged result in the last `days` days (undated reports
+        # cannot be placed in a window and are left out)
+        since = ((today or datetime.date.today()) - datetime.timedelta(days=days)).isoformat()
+        # without table statistics the planner prefers the patient index for the GROUP BY and
+        # scans every row; the partial index covers the query and only holds flagged rows
+        sql = ("SELECT patient_id, analyte, COUNT(*) AS abnormal_count, MAX(report_date) AS last_date"
+               " FROM results INDEXED BY results_abnormal WHERE flag IS NOT NULL AND report_date >= ?")
+        params = [since]
+        if analyte:
+            sql += " AND analyte = ?"
+            params.append(analyte)
+        return self._query(sql + " GROUP BY patient_id, analyte ORDER BY last_date DESC, patient_id", params)
+
+    def analytes(self, patient_id):
+        # analytes with at least one numeric value, for picking a trend
+        return self._query("SELECT DISTINCT analyte FROM results WHERE patient_id = ? AND value IS NOT NULL"
+                           " ORDER BY analyte", [patient_id])['analyte'].tolist()
+
+    def patients(self):
+        return self._query("SELECT patient_id, MAX(patient_name) AS name, COUNT(*) AS reports,"
+                           " MAX(report_date) AS last_date FROM reports GROUP BY patient_id ORDER BY patient_id")
@@ -0,0 +1,92 @@
+import pytest
+
+import pipeline
+from analytes import NameResolver, resolve_test_name
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Haemoglobin", "Hemoglobin"),
+    ("Heamoglobin", "Hemoglobin"),
+    ("Hemoglobin (Hb)", "Hemoglobin"),
+    ("MCHC", "MCHC"),
+    ("Glycated Hemoglobin", "HbA1c"),
+    ("Platelate Count", "Platelet"),
+    ("Serum Creatinine", "Creatinine"),
+    ("Glucose Fasting", "Glucose (Fasting)"),
+    ("Fasting Blood Sugar", "Glucose (Fasting)"),
+    ("Blood Sugar (Fasting)", "Glucose (Fasting)"),
+    ("Random Blood Sugar", "Glucose (Random)"),
+    ("Post Prandial Blood Sugar", "Glucose (Post Prandial)"),
+    ("Blood Sugar PP (2 hrs post prandial)", "Glucose (Post Prandial)"),
+    ("Blood Sugar", "Glucose"),
+    ("Bilirubin Direct", "Bilirubin (Direct)"),
+    ("HDL Cholesterol", "HDL Cholesterol"),
+    ("Albumin/Globulin Ratio", "A/G Ratio"),
+    ("A/G Ratio", "A/G Ratio"),
+    ("Serum Globulin", "Globulin"),
+    ("HCV (Tri-dot)", "HCV"),
+])
+def test_resolves_known_names(raw, expected):
+    assert resolve_test_name(raw) == expected
+
+@pytest.mark.parametrize("raw, expected", [
+    # one misread, dropped or doubled letter
+    ("Haemoglobim", "Hemoglobin"),
+    ("Hemoglobn", "Hemoglobin"),
+    ("S. Creatimine", "Creatinine"),
+    ("Triglycerlde", "Triglycerides"),
+    ("Totai Cholesterol", "Total Cholesterol"),
+])
+def test_corrects_near_misses(raw, expected):
+    assert resolve_test_name(raw) == expected
+
+@pytest.mark.parametrize("raw", [
+    "Myoglobin",
+    "Creatine Kinase (CK)",
+    "Creatine Phosphokinase",
+    "CK-MB",
+    "CPK",
+    "Creatine",
+    "Thyroglobulin",
+    "Anti-Thyroglobulin Antibody",
+    "Immunoglobulin E",
+    "Non HDL Cholesterol",
+    "Non-HDL Cholesterol",
+    "Cholesterol/HDL Ratio",
+    "LDL/HDL Ratio",
+    "LDL / HDL Ratio",
+    "TC/HDL Ratio",
+    "BUN/Creatinine Ratio",
+    "Urine Albumin/Creatinine Ratio",
+    "Microalbumin",
+])
+def test_does_not_resolve_other_tests(raw):
+    assert resolve_test_name(raw) == raw
+
+def test_not_interpreted_row_only_outranks_rows_below():
+    resolver = NameResolver([("Globulin", "globulin", "substring"),
+                             ("-", "thyroglobulin", "substring"),
+                             ("Hemoglobin", "globin", "substring")])
+    assert resolver.resolve("Thyroglobulin") == "Globulin"
+    assert resolver.resolve("Myoglobin") == "Hemoglobin"
+    assert "-" not in resolver.analytes
+
+def test_other_tests_are_not_flagged():
+    report = pipeline.analyze_text("Myoglobin 50 ng/mL\n"
+                                   "Creatine Kinase (CK) 150 U/L\n"
+                                   "Cholesterol/HDL Ratio 4.2\n"
+                                   "LDL/HDL Ratio 2.9\n"
+                                   "Non HDL Cholesterol 160 mg/dL\n"
+                                   "Thyroglobulin 20 ng/mL\n")
+    assert [r['Test'] for r in report['results']] == ["Myoglobin", "Creatine Kinase (CK)", "Cholesterol/HDL Ratio",
+                                                      "LDL/HDL Ratio", "Non HDL Cholesterol", "Thyroglobulin"]
+    assert all(r['Flag'] is None for r in report['results'])
+    assert report['abnormal_count'] == 0
+
+def test_blood_sugar_wordings_use_their_own_ranges():
+    report = pipeline.analyze_text("Random Blood Sugar 150 mg/dl\n"
+                                   "RBS 150 mg/dl\n"
+                                   "Post Prandial Blood Sugar 130 mg/dl\n"
+                                   "Fasting Blood Sugar 95 mg/dl\n")
+    assert [(r['Test'], r['Flag']) for r in report['results']] == [
+        ("Glucose (Random)", None), ("Glucose (Random)", None), ("Glucose (Post Prandial)", None),
+        ("Glucose (Fasting)", None)]
@@ -0,0 +1,61 @@
+import json
+import os
+
+import batch
+from store import ResultStore
+
+REPORT = "Patient Name: {name} Age: 40 Sex: F\nDate: 12/03/2024\nHemoglobin {hb} g/dL\n"
+
+def _write(path, name, hb):
+    path.write_text(REPORT.format(name=name, hb=hb), encoding="utf-8")
+    return path
+
+def test_manifest_patient_ids(tmp_path):
+    _write(tmp_path / "a.txt", "Jane Doe", 10.5)
+    _write(tmp_path / "b.txt", "Jane Doe", 12.5)
+    _write(tmp_path / "c.txt", "Mary Roe", 12.0)
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# path<TAB>patient ID\na.txt\tMRN-1\nb.txt\tMRN-2\nc.txt\n", encoding="utf-8")
+    assert batch.read_manifest(str(manifest))[0] == (str(tmp_path / "a.txt"), "MRN-1")
+    db = str(tmp_path / "store.sqlite")
+    batch.main(["-m", str(manifest), "-o", str(tmp_path / "out.jsonl"), "-j", "1", "-q", "--store", db])
+    store = ResultStore(db)
+    assert sorted(store.patients()['patient_id']) == ["MRN-1", "MRN-2", "name:mary roe|F|1984"]
+    store.close()
+
+def test_patient_id_option(tmp_path):
+    _write(tmp_path / "a.txt", "Jane Doe", 10.5)
+    _write(tmp_path / "b.txt", "J. Doe", 12.5)
+    db = str(tmp_path / "store.sqlite")
+    batch.main([str(tmp_path), "-o", str(tmp_path / "out.jsonl"), "-j", "1", "-q", "--store", db,
+                "--patient-id", "MRN-7"])
+    store = ResultStore(db)
+    assert store.patients()['reports'].tolist() == [2]
+    assert store.series("MRN-7", "Hemoglobin")['value'].tolist() == [10.5, 12.5]
+    store.close()
+
+def _rows(path):
+    with open(path, encoding="utf-8") as fh:
+        return fh.read().splitlines()
+
+def test_resume_after_crash_redoes_unrecorded_reports(tmp_path):
+    for i in range(4):
+        _write(tmp_path / f"r{i}.txt", f"Patient {i}", 10 + i)
+    out, ck = tmp_path / "out.csv", tmp_path / "ck.jsonl"
+    args = [str(tmp_path), "-o", str(out), "-c", str(ck), "-j", "1", "--chunk-size", "1", "-q"]
+    batch.main(args)
+    complete = _rows(out)
+    entries = _rows(ck)
+    assert len(entries) == 4
+    # crash: reports 0-1 checkpointed, report 2 written but not recorded, report 3 torn mid-row
+    offset_2 = json.loads(entries[1])['offset']
+    offset_3 = json.loads(entries[2])['offset']
+    with open(out, 'r+b') as fh:
+        fh.truncate(offset_3 + 20)
+    with open(ck, 'w', encoding="utf-8") as fh:
+        fh.write("\n".join(entries[:2]) + "\n" + entries[2][:15])
+    assert os.path.getsize(out) > offset_2
+    batch.main(args)
+    resumed = _rows(out)
+    assert len(resumed) == len(complete) and sorted(resumed) == sorted(complete)
+    assert resumed[0] == complete[0]
@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import bench_suite  # noqa: E402
+
+APP = '''
+import re
+import streamlit as st
+from streamlit import session_state
+
+RANGES = {'hemoglobin': (13.0, 18.0)}
+st.set_page_config(page_title="x")
+title = st.title("Analyzer")
+
+def parse_lab_lines(text):
+    return [ln for ln in text.splitlines() if re.search(r"\\d", ln)]
+
+if st.button("Analyze"):
+    st.write(parse_lab_lines("Hb 12"))
+'''
+
+def test_app_functions_skip_the_streamlit_ui(tmp_path):
+    path = tmp_path / "app.py"
+    path.write_text(APP, encoding="utf-8")
+    module = bench_suite._app_functions(str(path))
+    assert module.parse_lab_lines("Hb 12\nnote") == ["Hb 12"]
+    assert module.RANGES == {'hemoglobin': (13.0, 18.0)}
+    assert not hasattr(module, 'title') and not hasattr(module, 'st')
+
+def test_revision_without_pipeline_or_app_is_not_comparable(tmp_path, monkeypatch):
+    # load_pipeline changes directory and sys.path; both are restored afterwards
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+    monkeypatch.chdir(os.getcwd())
+    assert bench_suite.run_suite(str(tmp_path), pages=1, repeat=1, noise=0.0) is None
@@ -0,0 +1,41 @@
+from cache import ResultCache, cache_key
+
+def test_cache_key_depends_on_bytes_and_settings():
+    assert cache_key(b"abc", kind="text") == cache_key(b"abc", kind="text")
+    assert cache_key(b"abc", kind="text") != cache_key(b"abd", kind="text")
+    assert cache_key(b"abc", kind="image", clarity=90) != cache_key(b"abc", kind="image", clarity=80)
+    assert cache_key(b"abc", a=1, b=2) == cache_key(b"abc", b=2, a=1)
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_memory_bytes=60)
+    for key in "abc":
+        cache.put(key, {'v': key * 10})
+    assert cache.get("a") is not None
+    cache.put("d", {'v': "d" * 10})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("d") is not None
+    assert cache.stats()['evictions'] == 1
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    ResultCache(disk_dir=str(tmp_path)).put("k", {'results': [1, 2]})
+    cache = ResultCache(disk_dir=str(tmp_path))
+    assert cache.get("k") == {'results': [1, 2]}
+    assert cache.get("k") == {'results': [1, 2]}
+    stats = cache.stats()
+    assert (stats['disk_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 0)
+
+def test_disk_tier_is_bounded(tmp_path):
+    cache = ResultCache(disk_dir=str(tmp_path), max_disk_bytes=100)
+    for i in range(10):
+        cache.put(f"k{i}", {'v': "x" * 30})
+    assert cache.stats()['disk_bytes'] <= 100
+    assert ResultCache(disk_dir=str(tmp_path)).get("k9") is not None
+
+def test_get_or_compute_and_clear(tmp_path):
+    cache = ResultCache(disk_dir=str(tmp_path))
+    calls = []
+    compute = lambda: calls.append(1) or {'n': len(calls)}
+    assert cache.get_or_compute("k", compute) == {'n': 1}
+    assert cache.get_or_compute("k", compute) == {'n': 1}
+    cache.clear()
+    assert cache.get_or_compute("k", compute) == {'n': 2}
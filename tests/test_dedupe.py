@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+import dedupe
+
+TEXT = ("Patient Name: Jane Doe Age: 40 Sex: F\nHemoglobin 11.2 g/dL\nWBC 7200 /cumm\nPlatelet Count 2.5 lakhs\n"
+        "ESR 18 mm/hr\nFasting Glucose 96 mg/dL\nSerum Creatinine 0.9 mg/dL\nHBsAg Non Reactive\n")
+
+def _fp(data, text=TEXT):
+    fp = dedupe.file_fingerprint(data, 'text')
+    return dedupe.add_text_fingerprint(fp, text, {'Name': "Jane Doe"})
+
+@pytest.fixture
+def index(tmp_path):
+    idx = dedupe.DedupeIndex(str(tmp_path / "idx"))
+    yield idx
+    idx.close()
+
+def test_exact_match(index):
+    fp = _fp(b"one")
+    doc = index.add(fp, source="a.txt", cache_key="k1")
+    assert index.find_exact(fp['sha256'])['id'] == doc
+    assert index.find_exact(_fp(b"two")['sha256']) is None
+
+def test_text_near_duplicate(index):
+    index.add(_fp(b"one"), source="a.txt")
+    # the same report re-exported: different bytes, case, spacing and punctuation
+    copy = _fp(b"two", TEXT.upper().replace("\n", "  \n").replace(":", " :"))
+    match = index.find_similar_text(copy['text'], copy['digest'])
+    assert match is not None and match['source'] == "a.txt" and match['match'] == 'text'
+
+def test_changed_value_is_not_a_duplicate(index):
+    index.add(_fp(b"one"), source="a.txt")
+    other = _fp(b"two", TEXT.replace("11.2", "12.2"))
+    assert index.find_similar_text(other['text'], other['digest']) is None
+    assert dedupe.compare(_fp(b"one"), other) is None
+
+def test_page_hashes_before_and_after_compaction(index):
+    rng = random.Random(1)
+    docs = []
+    for i in range(50):
+        fp = dedupe.file_fingerprint(f"scan{i}".encode(), 'image')
+        fp['images'] = [rng.getrandbits(64), rng.getrandbits(64)]
+        fp['pages'] = 2
+        docs.append((index.add(fp, source=f"s{i}.png"), fp['images']))
+    for compacted in (False, True):
+        if compacted:
+            index.compact()
+        doc, hashes = docs[17]
+        near = [hashes[0] ^ 0b101, hashes[1] ^ (1 << 63)]
+        assert index.find_similar_pages(near)['id'] == doc
+        assert index.find_similar_pages([hashes[0] ^ 0b1111, hashes[1]]) is None
+        assert index.find_similar_pages(near[:1]) is None
+
+def test_readers_see_writes(index, tmp_path):
+    reader = dedupe.DedupeIndex(str(tmp_path / "idx"), readonly=True)
+    fp = _fp(b"one")
+    index.add(fp, source="a.txt")
+    reader.refresh()
+    assert reader.find_similar_text(fp['text'], fp['digest'])['source'] == "a.txt"
+    reader.close()
+
+def _scan(i, rng):
+    fp = dedupe.file_fingerprint(f"scan{i}".encode(), 'image')
+    fp['images'], fp['pages'] = [rng.getrandbits(64)], 1
+    return fp
+
+def test_compaction_during_reader_refresh(index, tmp_path, monkeypatch):
+    # a compaction landing between the reader's two file reads must not leave it with
+    # bands that point past its records
+    rng = random.Random(2)
+    index.add_many([(_scan(i, rng), f"s{i}.png", None, None) for i in range(10)])
+    index.compact()
+    reader = dedupe.DedupeIndex(str(tmp_path / "idx"), readonly=True)
+    later = [_scan(i, rng) for i in range(10, 20)]
+    getsize = dedupe.os.path.getsize
+
+    def racing_getsize(path):
+        size = getsize(path)
+        if later:
+            batch = later[:]
+            later.clear()
+            index.add_many([(fp, "late.png", None, None) for fp in batch])
+            index.compact()
+        return size
+
+    monkeypatch.setattr(dedupe.os.path, 'getsize', racing_getsize)
+    reader.refresh()
+    monkeypatch.setattr(dedupe.os.path, 'getsize', getsize)
+    assert reader._bands.shape[1] <= len(reader)
+    assert reader.find_similar_pages([rng.getrandbits(64)]) is None
+    reader.refresh()
+    assert len(reader) == 20
+    reader.close()
+
+def test_bands_ahead_of_records(index, tmp_path):
+    rng = random.Random(3)
+    reader = dedupe.DedupeIndex(str(tmp_path / "idx"), readonly=True)
+    scans = [_scan(i, rng) for i in range(10)]
+    index.add_many([(fp, f"s{i}.png", None, None) for i, fp in enumerate(scans)])
+    index.compact()
+    # a reader holding records from before the writes and bands from after them
+    reader._bands = dedupe.np.load(index._bands_path, mmap_mode='r')
+    assert len(reader) == 0 and reader.find_similar_pages(scans[3]['images']) is None
+    reader.refresh()
+    assert reader.find_similar_pages(scans[3]['images'])['source'] == "s3.png"
+    reader.close()
+
+def test_batch_dedupe_index_needs_a_cache(tmp_path, capsys):
+    import batch
+    (tmp_path / "a.txt").write_text(TEXT)
+    with pytest.raises(SystemExit):
+        batch.main([str(tmp_path / "a.txt"), "-o", str(tmp_path / "out.jsonl"), "-q",
+                    "--dedupe-index", str(tmp_path / "idx")])
+    assert "--dedupe-index needs --cache-dir" in capsys.readouterr().err
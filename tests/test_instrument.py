@@ -0,0 +1,55 @@
+from instrument import Metrics, Trace
+
+def test_counters_and_gauges():
+    m = Metrics(prefix="t")
+    m.inc('reports_total', help_text="Reports analyzed", kind='pdf', status='ok')
+    m.inc('reports_total', 2, kind='pdf', status='ok')
+    m.inc('reports_total', status='error', kind='image')
+    m.set('queue_depth', 3, help_text="Files waiting")
+    m.set('queue_depth', 1.5)
+    assert m.render() == (
+        "# HELP t_queue_depth Files waiting\n"
+        "# TYPE t_queue_depth gauge\n"
+        "t_queue_depth 1.5\n"
+        "# HELP t_reports_total Reports analyzed\n"
+        "# TYPE t_reports_total counter\n"
+        't_reports_total{kind="image",status="error"} 1\n'
+        't_reports_total{kind="pdf",status="ok"} 3\n')
+
+def test_histogram_buckets_are_cumulative():
+    m = Metrics(prefix="t", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        m.observe('stage_seconds', value, stage='parse')
+    assert m.render().splitlines() == [
+        "# TYPE t_stage_seconds histogram",
+        't_stage_seconds_bucket{le="0.1",stage="parse"} 1',
+        't_stage_seconds_bucket{le="1",stage="parse"} 3',
+        't_stage_seconds_bucket{le="+Inf",stage="parse"} 4',
+        't_stage_seconds_sum{stage="parse"} 4.05',
+        't_stage_seconds_count{stage="parse"} 4',
+    ]
+
+def test_label_values_are_escaped():
+    m = Metrics(prefix="t")
+    m.inc('reports_total', kind='a "b"\\c\nd')
+    assert m.render().splitlines()[-1] == 't_reports_total{kind="a \\"b\\"\\\\c\\nd"} 1'
+
+def test_observe_report():
+    trace = Trace()
+    trace.add('extract', 0.2, 0.1, pages=2)
+    trace.add('parse', 0.01, lines=40)
+    m = Metrics(prefix="t", buckets=(0.1,))
+    m.observe_report({'kind': 'pdf', 'trace': trace.to_list()})
+    m.observe_report({'kind': 'pdf', 'cached': True})
+    m.observe_report({'error': 'unreadable'})
+    text = m.render()
+    for line in ('t_reports_total{kind="pdf",status="ok"} 1',
+                 't_reports_total{kind="pdf",status="cached"} 1',
+                 't_reports_total{kind="unknown",status="error"} 1',
+                 't_stage_seconds_bucket{le="0.1",stage="extract"} 0',
+                 't_stage_seconds_bucket{le="0.1",stage="parse"} 1',
+                 't_stage_cpu_seconds_total{stage="extract"} 0.1',
+                 't_stage_pages_total{stage="extract"} 2',
+                 't_stage_lines_total{stage="parse"} 40'):
+        assert line in text.splitlines()
+    assert 't_stage_lines_total{stage="extract"}' not in text
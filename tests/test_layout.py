@@ -0,0 +1,99 @@
+import os
+import sys
+from io import BytesIO
+
+import layout
+import ocr
+import pipeline
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from corpus import render_pdf  # noqa: E402
+
+def _row(y, *cells):
+    # cells: (x, text); one box per word, 10 units per character, words 5 units apart
+    words = []
+    for x, text in cells:
+        for word in text.split():
+            words.append((x, y, x + 10 * len(word), y + 12, word))
+            x += 10 * len(word) + 5
+    return words
+
+def test_words_from_tsv():
+    tsv = ("level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n"
+           "5\t1\t1\t1\t1\t1\t10\t20\t50\t12\t96\tHemoglobin\n"
+           "5\t1\t1\t1\t1\t2\t200\t20\t30\t12\t-1\t\n"
+           "5\t1\t1\t1\t1\t3\t300\t21\t30\t12\t91\t11.2\n")
+    assert layout.words_from_tsv(tsv) == [(10, 20, 60, 32, "Hemoglobin"), (300, 21, 330, 33, "11.2")]
+
+def test_rows_and_cells():
+    words = _row(100, (0, "Total Cholesterol"), (300, "230"), (400, "mg/dL")) + _row(103, (600, "< 200"))
+    rows = layout.group_rows(words)
+    assert len(rows) == 1
+    assert [text for _, _, text in layout.row_cells(rows[0], 12 * layout.CELL_GAP)] == \
+           ["Total Cholesterol", "230", "mg/dL", "< 200"]
+
+def test_table_rows_use_columns_and_printed_range():
+    words = (_row(0, (0, "Patient Name: Jane Doe")) +
+             _row(40, (0, "Test Name"), (300, "Result"), (400, "Unit"), (600, "Reference Range")) +
+             _row(60, (0, "Hemoglobin"), (300, "11.2 L"), (400, "g/dL"), (600, "13.0 - 17.0")) +
+             _row(80, (0, "HBsAg"), (300, "Non Reactive")))
+    tests, lines = layout.read_tables([words], pipeline.parse_lab_line)
+    hb, hbsag = tests
+    assert (hb['name'], hb['value_raw'], hb['unit'], hb['reference']) == ("Hemoglobin", "11.2", "g/dL", "13.0 - 17.0")
+    assert (hbsag['name'], hbsag['value_raw'], hbsag['type']) == ("HBsAg", "Non Reactive", "qualitative")
+    assert lines[0].split() == ["Patient", "Name:", "Jane", "Doe"]
+
+def test_pdf_page_words_follow_the_text_layer():
+    from PyPDF2 import PdfReader
+    pdf = render_pdf([["Hemoglobin   11.2   g/dL   13.0 - 17.0", "WBC   7200   /cumm   4000 - 11000"]])
+    words = layout.pdf_page_words(PdfReader(BytesIO(pdf)).pages[0])
+    rows = [" ".join(w[4] for w in row) for row in layout.group_rows(words)]
+    assert rows == ["Hemoglobin 11.2 g/dL 13.0 - 17.0", "WBC 7200 /cumm 4000 - 11000"]
+
+HEADER = ["Patient Name: Jane Doe   Age: 40   Sex: F", "Test Name      Result    Unit      Reference Range",
+          "Hemoglobin     11.2      g/dL      13.0 - 17.0"]
+
+def _no_word_boxes(monkeypatch):
+    def fail(page):
+        raise AssertionError("layout pass ran")
+    monkeypatch.setattr(pipeline, 'pdf_page_words', fail)
+
+def test_layout_pass_skipped_when_no_line_prints_a_range(monkeypatch):
+    # the collection time parses as a test, but prints no range either
+    pdf = render_pdf([[HEADER[0], "Test Name      Result    Unit", "Hemoglobin     11.2      g/dL",
+                       "Sample collected at 10:30"]])
+    plain = pipeline.analyze_bytes(pdf, "a.pdf")
+    _no_word_boxes(monkeypatch)
+    assert pipeline.analyze_bytes(pdf, "a.pdf", layout=True)['results'] == plain['results']
+
+def test_layout_pass_runs_for_a_test_without_a_range():
+    pdf = render_pdf([HEADER + ["Ammonia        80        umol/L    11 - 32"]])
+    results = {r['Test']: r for r in pipeline.analyze_bytes(pdf, "a.pdf", layout=True)['results']}
+    assert (results['Ammonia']['Flag'], results['Ammonia']['Reference']) == ("High", "11 - 32 umol/L")
+    assert results['Hemoglobin']['Flag'] == "Low"
+
+def test_layout_pass_runs_when_no_tests_are_found(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pipeline, 'pdf_page_words', lambda page: calls.append(page) or [])
+    pipeline.analyze_bytes(render_pdf([HEADER[:1]]), "a.pdf", layout=True)
+    assert len(calls) == 1
+
+def test_printed_range_does_not_depend_on_other_rows():
+    # the table's female range (11.0-16.0) would not flag 12.5; the printed one does, with or
+    # without a row the table has no range for
+    rows = [HEADER[0], HEADER[1], "Hemoglobin     12.5      g/dL      13.0 - 17.0"]
+    for extra in ([], ["Ammonia        80        umol/L    11 - 32"]):
+        results = pipeline.analyze_bytes(render_pdf([rows + extra]), "a.pdf", layout=True)['results']
+        hb, = [r for r in results if r['Test'] == 'Hemoglobin']
+        assert (hb['Flag'], hb['Reference']) == ("Low", "13.0 - 17.0 g/dL")
+
+def test_ocr_words_offset_by_preprocessed_height(monkeypatch):
+    from PIL import Image
+    # preprocessing doubles the size (e.g. a 150 DPI scan rescaled to 300); boxes come back in
+    # the doubled frame, so the second image starts below the first one's doubled height
+    monkeypatch.setattr(ocr, 'preprocess', lambda img, clarity: img.resize((img.width * 2, img.height * 2)))
+    tsv = ("level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n"
+           "5\t1\t1\t1\t1\t1\t10\t150\t50\t12\t96\tWord\n")
+    monkeypatch.setattr(ocr, 'recognize_data', lambda img: tsv)
+    images = [Image.new("L", (100, 100), 255), Image.new("L", (100, 100), 255)]
+    assert [w[1] for w in pipeline._ocr_words(images, 90)] == [150, 350]
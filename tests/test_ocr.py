@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+
+import ocr
+
+def _page(angle):
+    rng = np.random.default_rng(3)
+    page = Image.new("L", (1240, 1754), 255)
+    draw = ImageDraw.Draw(page)
+    for y in range(60, 1700, 40):
+        draw.text((80, y), "Haemoglobin 13.5 g/dL 13.0 - 17.0   Platelets 2.5 lakhs/cumm", fill=20)
+    speckle = (rng.random((1754, 1240)) < 0.01) * 120
+    page = Image.fromarray(np.clip(np.asarray(page, dtype=np.int16) - speckle, 0, 255).astype(np.uint8))
+    page = page.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    page.info['dpi'] = (300, 300)
+    return page
+
+def _reference(img, clarity):
+    # preprocessing as one whole-page pass
+    img = ocr.rescale_to_dpi(img.convert("L"))
+    if clarity >= ocr.CLARITY_DESKEW:
+        img = ocr.deskew(img)
+    if clarity >= ocr.CLARITY_DENOISE:
+        img = img.filter(ImageFilter.MedianFilter(3))
+    if clarity >= ocr.CLARITY_BINARIZE:
+        img = ocr.binarize(img, clarity)
+    return img
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ocr.OcrPool(2)
+    yield pool
+    pool.shutdown()
+
+@pytest.mark.parametrize("angle", [0.0, 2.0, -3.5])
+@pytest.mark.parametrize("clarity", [70, 80, 90])
+def test_preprocess_in_strips_matches_whole_page(pool, angle, clarity):
+    page = _page(angle)
+    expected = np.asarray(_reference(page, clarity))
+    assert np.array_equal(np.asarray(ocr.preprocess(page, clarity)), expected)
+    assert np.array_equal(np.asarray(ocr.preprocess(page, clarity, pool=pool)), expected)
+
+def _lined(height, gap_free=None):
+    # text-like rows every 40 px; gap_free=(y0, y1) fills that stretch with ink (no blank row)
+    page = Image.new("L", (400, height), 255)
+    draw = ImageDraw.Draw(page)
+    for y in range(20, height - 20, 40):
+        draw.rectangle((20, y, 380, y + 12), fill=0)
+    if gap_free:
+        draw.rectangle((20, gap_free[0], 380, gap_free[1]), fill=0)
+    return page
+
+def test_split_bands_cuts_on_blank_rows():
+    page = _lined(3000)
+    bands, overlapped = ocr.split_bands(page)
+    assert len(bands) == 3 and overlapped == [False, False, False]
+    assert sum(b.height for b in bands) == page.height
+    rows = np.vstack([np.asarray(b) for b in bands])
+    assert np.array_equal(rows, np.asarray(page))
+
+def test_split_bands_overlaps_without_a_blank_row():
+    page = _lined(3000, gap_free=(1050, 1350))
+    bands, overlapped = ocr.split_bands(page)
+    assert overlapped[0] is False and overlapped[1] is True
+    assert sum(b.height for b in bands) > page.height
+
+def test_small_page_is_one_band():
+    bands, overlapped = ocr.split_bands(_lined(1000))
+    assert len(bands) == 1 and overlapped == [False]
+
+def test_stitch_keeps_repeated_lines_at_clean_cuts():
+    texts = ["Hemoglobin 11.2\nRemarks: see below\n", "Remarks: see below\nWBC 7200\n"]
+    assert ocr.stitch(texts, [False, False]).splitlines() == \
+        ["Hemoglobin 11.2", "Remarks: see below", "Remarks: see below", "WBC 7200"]
+
+def test_stitch_drops_lines_read_twice_in_an_overlap():
+    texts = ["Hemoglobin 11.2\nPlatelets 2.5 lakhs\nESR 18\n", "platelets  2.5 lakhs\nESR 18\nWBC 7200\n"]
+    assert ocr.stitch(texts, [False, True]).splitlines() == \
+        ["Hemoglobin 11.2", "Platelets 2.5 lakhs", "ESR 18", "WBC 7200"]
+
+def test_ocr_image_keeps_lines_repeated_across_a_clean_cut(monkeypatch):
+    monkeypatch.setattr(ocr, 'recognize', lambda band: "Page continues\n")
+    page = _lined(3000)
+    page.info['dpi'] = (300, 300)
+    assert ocr.ocr_image(page, clarity=50, workers=1).splitlines() == ["Page continues"] * 3
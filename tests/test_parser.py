@@ -0,0 +1,68 @@
+import io
+import os
+import re
+import sys
+
+import pytest
+
+import pipeline
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from corpus import make_report_lines  # noqa: E402
+
+def _reference_parse(text):
+    # the line parser as it was in app.py, one uncompiled search after another
+    tests = []
+    for ln in [ln.strip() for ln in text.splitlines() if ln.strip()]:
+        ln_clean = re.sub(r'\s{2,}', ' ', ln)
+        m = re.search(r'\b(HBsAg|HBs Ag|HBs|VDRL|V\.D\.R\.L|V D R L|HCV|H\.C\.V|Tri[- ]Dot|H\.B & H\.B|H\.B & H\.B s Ag)\b.*?[:\-]?\s*([A-Za-z \-\(\)0-9/:]+)', ln_clean, re.IGNORECASE)
+        if m:
+            tests.append({'name': m.group(1).strip(), 'value_raw': m.group(2).strip(), 'type': 'qualitative', 'line': ln_clean})
+            continue
+        m = re.search(r'([A-Za-z .%()&/-]{3,50})\s+(:\s*)?(-?\d{1,3}\.?\d+)\s*([A-Za-z/%µμlhL]*)', ln_clean)
+        if m:
+            tests.append({'name': m.group(1).strip(), 'value_raw': m.group(3).strip(), 'unit': m.group(4).strip(), 'type': 'numeric', 'line': ln_clean})
+            continue
+        m = re.search(r'([A-Za-z .]{2,40})\s+[:\-]?\s*(\d{2,7}\.?\d*)\s*(?:/|per)?\s*([A-Za-z/%µμlhL]*)', ln_clean)
+        if m:
+            tests.append({'name': m.group(1).strip(), 'value_raw': m.group(2).strip(), 'unit': m.group(3).strip(), 'type': 'numeric', 'line': ln_clean})
+            continue
+        m = re.search(r'([A-Za-z .&/()-]{3,40})\s*[:\-]?\s*(Negative|Positive|Reactive|Non\s*-\s*Reactive|Non\s*Reactive|Non-Reactive|Not detected|Detected)', ln_clean, re.IGNORECASE)
+        if m:
+            tests.append({'name': m.group(1).strip(), 'value_raw': m.group(2).strip(), 'type': 'qualitative', 'line': ln_clean})
+    return tests
+
+EDGE_LINES = [
+    "HBsAg : Non Reactive", "H.B & H.B s Ag   Negative", "Tri-Dot (HCV) Non - Reactive", "VDRL Reactive 1:8",
+    "Urine sugar Negative", "Dengue NS1 Not detected", "Platelet 250000", "WBC Count : 7200 /cumm",
+    "Hämoglobin 11,2 g/dL", "Ｈemoglobin 11.2 g/dL", "ſerum ſodium: Negative", "Lab no. 0034521",
+    "random words here", "   ", "ESR 40 mm/1st hr", "Serum Creatinine : 2.1 mg / dl",
+]
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_the_original_parser(seed):
+    pages = make_report_lines(pages=3, noise=0.3, seed=seed)
+    text = "\n".join(ln for page in pages for ln in page) + "\n" + "\n".join(EDGE_LINES)
+    assert pipeline.parse_lab_lines(text) == _reference_parse(text)
+
+def test_generator_accepts_text_lines_and_files():
+    text = "\n".join(EDGE_LINES)
+    expected = _reference_parse(text)
+    assert list(pipeline.iter_lab_lines(text)) == expected
+    assert list(pipeline.iter_lab_lines(text.splitlines())) == expected
+    assert list(pipeline.iter_lab_lines(io.StringIO(text))) == expected
+
+def test_generator_is_lazy():
+    consumed = []
+
+    def lines():
+        for ln in ["Hemoglobin 11.2 g/dL", "WBC 7200 /cumm", "ESR 18 mm/hr"]:
+            consumed.append(ln)
+            yield ln
+
+    tests = pipeline.iter_lab_lines(lines())
+    assert next(tests)['name'] == "Hemoglobin" and len(consumed) == 1
+
+def test_overlong_lines_are_bounded():
+    test = pipeline.parse_lab_line("Hemoglobin 11.2 g/dL " + "x" * 10 * pipeline.MAX_LINE_LENGTH)
+    assert test['value_raw'] == "11.2" and len(test['line']) <= pipeline.MAX_LINE_LENGTH
@@ -0,0 +1,33 @@
+import os
+import sys
+from io import BytesIO
+
+import pytest
+
+import pipeline
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from corpus import render_pdf  # noqa: E402
+
+# more pages than chunks, so each worker gets interleaved page sets
+PAGES = [[f"Page {i} Hemoglobin {10 + i}.5 g/dL"] for i in range(12)]
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+def test_pages_come_back_in_document_order(workers):
+    events = []
+    text = pipeline.extract_text_from_pdf(BytesIO(render_pdf(PAGES)), workers=workers,
+                                          on_progress=lambda *e: events.append(e))
+    assert [ln for ln in text.splitlines() if ln.strip()] == [ln for page in PAGES for ln in page]
+    assert events[-1] == (pipeline.STAGE_EXTRACT, 12, 12)
+
+def test_page_without_text_keeps_its_place():
+    # no text layer and nothing to rasterize: the page contributes nothing, the rest stay in order
+    pages = PAGES[:5] + [[]] + PAGES[5:8]
+    serial = pipeline._extract_pdf_pages(render_pdf(pages), None, 1, pipeline.DEFAULT_CLARITY)
+    parallel = pipeline._extract_pdf_pages(render_pdf(pages), None, 2, pipeline.DEFAULT_CLARITY)
+    assert parallel == serial and parallel[5] == "" and len(parallel) == 9
+
+def test_word_boxes_in_parallel_match_serial():
+    data = render_pdf(PAGES)
+    serial = pipeline._extract_pdf_pages(data, None, 1, pipeline.DEFAULT_CLARITY, layout=True)
+    assert pipeline._extract_pdf_pages(data, None, 2, pipeline.DEFAULT_CLARITY, layout=True) == serial
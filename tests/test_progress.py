@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pipeline
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from corpus import render_pdf  # noqa: E402
+
+TEXT = "Patient Name: Jane Doe Age: 40 Sex: F\nHemoglobin 11.2 g/dL\nWBC 7200 /cumm\n\nnotes\nESR 40 mm/hr\n"
+
+def _record(events):
+    return lambda stage, done, total: events.append((stage, done, total))
+
+def _check(events, stages):
+    assert [s for s in dict.fromkeys(stage for stage, _, _ in events)] == list(stages)
+    for stage in stages:
+        seen = [(done, total) for s, done, total in events if s == stage]
+        dones = [d for d, _ in seen]
+        assert dones == sorted(dones) and seen[-1][0] == seen[-1][1]
+
+def test_text_reports_every_stage_in_order():
+    events = []
+    report = pipeline.analyze_bytes(TEXT.encode(), "r.txt", on_progress=_record(events))
+    _check(events, pipeline.STAGES)
+    # one parse step per non-blank line, the interpret total is the number of tests
+    assert [e for e in events if e[0] == pipeline.STAGE_PARSE][-1] == (pipeline.STAGE_PARSE, 5, 5)
+    assert [e for e in events if e[0] == pipeline.STAGE_INTERPRET][-1][2] == len(report['results']) == 3
+    assert report['work'] == {pipeline.STAGE_EXTRACT: 1, pipeline.STAGE_PARSE: 5, pipeline.STAGE_INTERPRET: 3}
+
+def test_pdf_extraction_counts_pages():
+    events = []
+    pages = [["Hemoglobin 11.2 g/dL"], ["WBC 7200 /cumm"], ["ESR 40 mm/hr"]]
+    pipeline.analyze_bytes(render_pdf(pages), "r.pdf", on_progress=_record(events), workers=1)
+    extract = [(d, t) for s, d, t in events if s == pipeline.STAGE_EXTRACT]
+    assert extract == [(0, 3), (1, 3), (2, 3), (3, 3)]
+
+def test_no_callback_is_fine():
+    assert pipeline.analyze_text(TEXT)['results']
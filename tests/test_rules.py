@@ -0,0 +1,89 @@
+import pytest
+
+import pipeline
+import rules
+
+def _interpret(lines, sex="Male", age="40"):
+    tests = pipeline.parse_lab_lines("\n".join(lines))
+    return pipeline.interpret_tests(tests, {'Sex': sex, 'Age': age})
+
+def _flags(results):
+    return [(r['Test'], r['Value'], r['Flag'], r['Note'], r['Reference']) for r in results]
+
+# flags, notes and printed references the per-analyte loop gave before the rule table
+@pytest.mark.parametrize("sex, line, expected", [
+    ("Male", "Hemoglobin 12.1 g/dL", ("Hemoglobin", 12.1, "Low", "Possible anemia", "13.0-18.0 g/dL")),
+    ("Male", "Hemoglobin 19.0 g/dL", ("Hemoglobin", 19.0, "High", "Above expected", "13.0-18.0 g/dL")),
+    ("Male", "Hemoglobin 15.0 g/dL", ("Hemoglobin", 15.0, None, "", "13.0-18.0 g/dL")),
+    ("Female", "Hemoglobin 10.5 g/dL", ("Hemoglobin", 10.5, "Low", "Possible anemia", "11.0-16.0 g/dL")),
+    ("Female", "Hemoglobin 16.5 g/dL", ("Hemoglobin", 16.5, "High", "Above expected", "11.0-16.0 g/dL")),
+    ("", "Hemoglobin 17.8 g/dL", ("Hemoglobin", 17.8, "High", "Above expected", "11.0-17.5 g/dL")),
+    ("Male", "WBC 3500 /cumm", ("WBC", 3500.0, "Low", "Leukopenia", "4000-11000 /µL")),
+    ("Male", "WBC 12500 /cumm", ("WBC", 12500.0, "High", "Leukocytosis (infection/inflammation)", "4000-11000 /µL")),
+    ("Male", "Platelet Count 120000 /cumm", ("Platelet", 120000.0, "Low", "Thrombocytopenia", "150000-450000 /µL")),
+    ("Male", "Platelet Count 2.5 lakhs/cumm", ("Platelet", 250000, None, "", "150000-450000 /µL")),
+    ("Male", "ESR 25 mm/hr", ("ESR", 25.0, "High", "Elevated ESR (inflammation)", "≤20 mm/hr")),
+    ("Female", "ESR 25 mm/hr", ("ESR", 25.0, None, "", "≤30 mm/hr")),
+    ("Male", "RBC 3.9 million/cumm", ("RBC", 3.9, "Low", "Low RBC (possible anemia)", "4.2-6.0 million/µL")),
+    ("Male", "Fasting Glucose 130 mg/dL", ("Glucose (Fasting)", 130.0, "High", "Hyperglycemia", "70-100 mg/dL")),
+    ("Male", "Glucose Fasting 60 mg/dL", ("Glucose (Fasting)", 60.0, "Low", "Hypoglycemia", "70-100 mg/dL")),
+    ("Male", "Serum Creatinine 1.6 mg/dL", ("Creatinine", 1.6, "Abnormal", "Renal function abnormality",
+                                            "0.6-1.3 mg/dL")),
+])
+def test_matches_previous_loop(sex, line, expected):
+    assert _flags(_interpret([line], sex=sex)) == [expected]
+
+@pytest.mark.parametrize("line, expected", [
+    ("Hemoglobin 12.0 g/dL", (None, "11.0-14.5 g/dL")),
+    ("Hemoglobin 15.0 g/dL", ("High", "11.0-14.5 g/dL")),
+    ("Hemoglobin 10.5 g/dL", ("Low", "11.0-14.5 g/dL")),
+])
+def test_paediatric_hemoglobin_band(line, expected):
+    result, = _interpret([line], sex="Male", age="6")
+    assert (result['Flag'], result['Reference']) == expected
+
+def test_paediatric_band_needs_a_known_age():
+    result, = _interpret(["Hemoglobin 12.0 g/dL"], sex="Male", age="")
+    assert (result['Flag'], result['Reference']) == ("Low", "13.0-18.0 g/dL")
+
+@pytest.mark.parametrize("line, expected", [
+    ("Random Blood Glucose 130 mg/dL", ("Glucose (Random)", None, "70-200 mg/dL")),
+    ("Post Prandial Glucose 130 mg/dL", ("Glucose (Post Prandial)", None, "70-140 mg/dL")),
+    ("Post Prandial Glucose 150 mg/dL", ("Glucose (Post Prandial)", "High", "70-140 mg/dL")),
+    ("SGPT 80 U/L", ("ALT (SGPT)", "High", "≤41 U/L")),
+    ("Serum Sodium 128 mmol/L", ("Sodium", "Low", "135-145 mmol/L")),
+    ("TSH 6.2 mIU/L", ("TSH", "High", "0.4-4.0 mIU/L")),
+])
+def test_new_analytes(line, expected):
+    result, = _interpret([line])
+    assert (result['Test'], result['Flag'], result['Reference']) == expected
+
+def test_printed_range_wins_over_table():
+    tests = [{'name': 'Hemoglobin', 'value_raw': '12.5', 'unit': 'g/dL', 'type': 'numeric', 'line': '',
+              'reference': '12.0 - 15.0'}]
+    result, = rules.interpret_rows([(tests, {'Sex': 'Male', 'Age': '40'})])[0]
+    assert (result['Flag'], result['Reference']) == (None, "12.0 - 15.0 g/dL")
+
+def test_load_rules_reads_blanks():
+    rule = rules.DEFAULT_RULE_INDEX['Hemoglobin'][0]
+    assert (rule.sex, rule.low, rule.high, rule.unit) == ('M', 13.0, 18.0, 'g/dL')
+    assert rule.age_min != rule.age_min and rule.age_max != rule.age_max
+    assert rules.canonical_units(rules.DEFAULT_RULES)['WBC'] == '/µL'
+
+def test_converted_counts_stay_whole():
+    result, = _interpret(["Platelet Count 2.5 lakhs/cumm"])
+    assert type(result['Value']) is int and result['Original Value'] == 2.5
+    result, = _interpret(["Hemoglobin 12.1 g/dL"])
+    assert type(result['Value']) is float
+
+@pytest.mark.parametrize("line", ["Serum Creatinine 150 U/L", "Hemoglobin 130 mg/dL"])
+def test_unconvertible_unit_is_not_flagged(line):
+    result, = _interpret([line])
+    assert result['Flag'] is None
+    assert result['Note'] == rules.UNIT_NOT_RECOGNISED
+
+def test_unconvertible_unit_still_uses_printed_range():
+    tests = [{'name': 'Creatinine', 'value_raw': '150', 'unit': 'U/L', 'type': 'numeric', 'line': '',
+              'reference': '20 - 100'}]
+    result, = rules.interpret_rows([(tests, {})])[0]
+    assert (result['Flag'], result['Reference']) == ("Abnormal", "20 - 100 U/L")
@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from service import AnalysisService, HttpError, LocalClient
+
+REPORT = b"Patient Name: Test Person\nAge: 40 Sex: Male\nHemoglobin 11.2 g/dL\nHBsAg Non Reactive\n"
+
+@pytest.fixture
+def service():
+    executor = ThreadPoolExecutor(2)
+    svc = AnalysisService(workers=2, batch_window=0.2, batch_max_items=2, executor=executor)
+    yield svc
+    svc.close()
+    executor.shutdown()
+
+def _run(coro):
+    return asyncio.run(coro)
+
+def test_analyze(service):
+    status, report = _run(LocalClient(service).analyze(REPORT, "report.txt"))
+    assert status == 200
+    assert report['basic']['Name'] == "Test Person"
+    assert [(r['Test'], r['Flag']) for r in report['results']] == [("Hemoglobin", "Low"), ("HBsAg", None)]
+
+def test_filename_is_url_encoded(service):
+    status, report = _run(LocalClient(service).analyze(REPORT, "Smith & Co #1 report.txt"))
+    assert status == 200
+    assert report['source'] == "Smith & Co #1 report.txt"
+
+def test_batch_and_errors(service):
+    client = LocalClient(service)
+    status, payload = _run(client.analyze_batch([(REPORT, "a.txt", None), (REPORT, "b.txt", None)]))
+    assert status == 200 and [r['source'] for r in payload['reports']] == ["a.txt", "b.txt"]
+    assert _run(client.analyze(REPORT, "report.exe"))[0] == 415
+    assert _run(client.request('POST', "/analyze/batch", b'{"files": 1}'))[0] == 400
+    assert _run(client.request('GET', "/nowhere"))[0] == 404
+    assert _run(client.request('GET', "/analyze"))[0] == 405
+
+def test_full_batch_cancels_its_window_timer(service):
+    async def scenario():
+        client = LocalClient(service)
+        # two jobs fill a batch and flush it at once; its timer must not close the next window early
+        await asyncio.gather(client.analyze(REPORT, "a.txt"), client.analyze(REPORT, "b.txt"))
+        assert service._timers == {}
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        status, report = await client.analyze(REPORT, "c.txt")
+        return status, loop.time() - started
+    status, waited = _run(scenario())
+    assert status == 200
+    assert waited >= 0.15
+    assert service.stats['batches'] == 2
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1.5"])
+def test_bad_content_length_is_400(service, length):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(f"POST /analyze HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode('latin-1'))
+        reader.feed_eof()
+        return await service._read_request(reader)
+    with pytest.raises(HttpError) as exc:
+        _run(read())
+    assert exc.value.status == 400
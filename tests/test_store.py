@@ -0,0 +1,114 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from store import ResultStore, birth_year, parse_report_date, patient_key, patient_label
+
+JANE = "name:jane doe|F|1984"
+
+def _report(name="Jane Doe", date="12/03/2024", hb=10.5, flag="Low", age="40", sex="F"):
+    return {'basic': {'Name': name, 'Age': age, 'Sex': sex, 'Report Date': date},
+            'results': [{'Test': "Hemoglobin", 'Value': hb, 'Unit': "g/dL", 'Flag': flag},
+                        {'Test': "HBsAg", 'Value': "Negative", 'Unit': "", 'Flag': None}]}
+
+@pytest.fixture
+def store():
+    s = ResultStore(':memory:')
+    yield s
+    s.close()
+
+@pytest.mark.parametrize("text, iso", [
+    ("12/03/2024", "2024-03-12"),
+    ("12-03-24", "2024-03-12"),
+    ("03/25/2024", "2024-03-25"),
+    ("2024-03-12", "2024-03-12"),
+    ("31/02/2024", None),
+    ("", None),
+])
+def test_parse_report_date_is_day_first(text, iso):
+    assert parse_report_date(text) == iso
+
+def test_patient_key():
+    assert patient_key("MRN-1", "Jane Doe") == "MRN-1"
+    assert patient_key(None, "  Jane   DOE ", "Female", 1984) == JANE
+    assert patient_key(None, "Jane Doe") == "name:jane doe||"
+    assert patient_key(None, "") is None
+    assert patient_label(JANE) == "Jane Doe" and patient_label("MRN-1") == "MRN-1"
+    assert birth_year("40", "2024-03-12") == 1984 and birth_year("", "2024-03-12") is None
+
+def test_namesakes_are_kept_apart(store):
+    store.add_report(_report(age="40", sex="F"))
+    store.add_report(_report(age="72", sex="F"))
+    store.add_report(_report(age="40", sex="M"))
+    assert sorted(store.patients()['patient_id']) == ["name:jane doe|F|1952", JANE, "name:jane doe|M|1984"]
+
+def test_age_drift_keeps_one_patient(store):
+    # 40 in March 2024 and 40 again in January 2025 (birthday not yet passed): one year off
+    store.add_report(_report(date="12/03/2024", age="40"))
+    store.add_report(_report(date="10/01/2025", age="40", hb=11.0))
+    store.add_report(_report(date="10/04/2025", age="41", hb=11.5))
+    assert store.patients()['patient_id'].tolist() == [JANE]
+    assert store.series(JANE, "Hemoglobin")['value'].tolist() == [10.5, 11.0, 11.5]
+
+def test_explicit_id(store):
+    store.add_report(_report(), patient_id="MRN-1")
+    assert store.patients()['patient_id'].tolist() == ["MRN-1"]
+
+def test_add_report_is_idempotent(store):
+    assert store.add_report(_report()) is not None
+    assert store.add_report(_report()) is None
+    assert store.patients()['reports'].tolist() == [1]
+
+def test_series_and_trend(store):
+    store.add_report(_report(date="01/01/2024", hb=10.5))
+    store.add_report(_report(date="01/02/2024", hb=12.0, flag=None))
+    series = store.series(JANE, "Hemoglobin")
+    assert series['report_date'].tolist() == ["2024-01-01", "2024-02-01"]
+    assert series['value'].tolist() == [10.5, 12.0]
+    assert store.analytes(JANE) == ["Hemoglobin"]
+
+def test_abnormal_since(store):
+    store.add_report(_report(name="A", date="01/03/2024"))
+    store.add_report(_report(name="B", date="01/01/2023"))
+    recent = store.abnormal_since(90, today=datetime.date(2024, 4, 1))
+    assert recent['patient_id'].tolist() == ["name:a|F|1984"]
+    assert store.abnormal_since(90, analyte="HBsAg", today=datetime.date(2024, 4, 1)).empty
+
+def test_report_without_patient_is_not_stored(store):
+    assert store.add_report(_report(name="")) is None
+
+def test_undated_report_is_stored_undated(store):
+    store.add_report(_report(date="", hb=9.0), today=datetime.date(2024, 4, 1))
+    store.add_report(_report(date="01/03/2024"))
+    series = store.series(JANE, "Hemoglobin")
+    assert series['report_date'].fillna("undated").tolist() == ["2024-03-01", "undated"]
+    assert series['value'].tolist() == [10.5, 9.0]
+    assert store.abnormal_since(90, today=datetime.date(2024, 4, 1))['abnormal_count'].tolist() == [1]
+
+def test_old_store_is_migrated(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE reports (id INTEGER PRIMARY KEY, patient_id TEXT NOT NULL, patient_name TEXT,
+            report_date TEXT NOT NULL, date_printed INTEGER NOT NULL, source TEXT,
+            fingerprint TEXT NOT NULL UNIQUE, stored_at TEXT NOT NULL);
+        CREATE TABLE results (report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+            patient_id TEXT NOT NULL, analyte TEXT NOT NULL, report_date TEXT NOT NULL,
+            value REAL, value_text TEXT, unit TEXT, flag TEXT);
+        INSERT INTO reports VALUES (1, 'name:jane doe', 'Jane Doe', '2024-03-12', 1, 'a.txt', 'f1', '2024-03-12T10:00:00');
+        INSERT INTO reports VALUES (2, 'name:jane doe', 'Jane Doe', '2024-05-02', 0, 'b.txt', 'f2', '2024-05-02T10:00:00');
+        INSERT INTO results VALUES (1, 'name:jane doe', 'Hemoglobin', '2024-03-12', 10.5, NULL, 'g/dL', 'Low');
+        INSERT INTO results VALUES (2, 'name:jane doe', 'Hemoglobin', '2024-05-02', 11.0, NULL, 'g/dL', 'Low');
+    """)
+    conn.close()
+    store = ResultStore(path)
+    series = store.series("name:jane doe", "Hemoglobin")
+    assert series['report_date'].fillna("undated").tolist() == ["2024-03-12", "undated"]
+    assert store.add_report(_report(date="")) is not None
+    store.close()
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'results_by_patient', 'results_abnormal', 'results_by_report'} <= indexes
+    conn.close()
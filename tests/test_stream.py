@@ -0,0 +1,54 @@
+from io import BytesIO
+
+import pipeline
+
+PAGE1 = "Patient Name: John Doe\nHemoglobin 12.0 g/dL\nWBC 7200 /cumm\n"
+PAGE2 = "Age: 40 Sex: M Date: 12/03/2024\nPlatelet Count 250000 /cumm\n"
+
+def _stream(pages, monkeypatch, **kwargs):
+    read = []
+
+    def pages_iter(fileobj, kind, clarity):
+        for page in pages:
+            read.append(page)
+            yield page
+
+    monkeypatch.setattr(pipeline, 'iter_page_texts', pages_iter)
+    events = []
+    for event, payload in pipeline.analyze_stream(BytesIO(), "report.txt", **kwargs):
+        events.append((event, payload, len(read)))
+    return events
+
+def test_results_follow_the_first_page(monkeypatch):
+    events = _stream([PAGE1, PAGE2], monkeypatch)
+    first = {event: pages for event, _, pages in reversed(events)}
+    assert first['basic'] == 1 and first['results'] == 1
+    assert [e for e, _, _ in events] == ['basic', 'results', 'basic', 'revised', 'results', 'done']
+
+def test_late_age_and_sex_revise_sent_results(monkeypatch):
+    events = _stream([PAGE1, PAGE2], monkeypatch)
+    basics = [p for e, p, _ in events if e == 'basic']
+    assert basics[0]['Name'] == "John Doe" and basics[0]['Age'] == ""
+    assert basics[-1] == {'Name': "John Doe", 'Sex': "M", 'Age': "40", 'Report Date': "12/03/2024"}
+    sent = next(p for e, p, _ in events if e == 'results')
+    revised = next(p for e, p, _ in events if e == 'revised')
+    assert [r['Test'] for r in revised] == [r['Test'] for r in sent]
+    # 12.0 g/dL is within the range for unknown sex and low for a man
+    assert sent[0]['Flag'] is None and revised[0]['Flag'] == "Low"
+    assert events[-1][1]['abnormal_count'] == 1
+
+def test_complete_header_on_first_page(monkeypatch):
+    page1 = "Patient Name: Jane Doe Age: 40 Sex: F Date: 12/03/2024\nHemoglobin 10.5 g/dL\n"
+    events = _stream([page1, PAGE2], monkeypatch)
+    assert [e for e, _, _ in events] == ['basic', 'results', 'results', 'done']
+    assert events[-1][1] == {'pages': 2, 'lines': 4, 'tests': 2, 'abnormal_count': 1}
+
+def test_stream_matches_whole_text(monkeypatch):
+    events = _stream([PAGE1, PAGE2], monkeypatch, chunk_tests=1)
+    results = []
+    for event, payload, _ in events:
+        if event == 'results':
+            results.extend(payload)
+        elif event == 'revised':
+            results[:len(payload)] = payload
+    assert results == pipeline.analyze_text(PAGE1 + PAGE2)['results']
@@ -0,0 +1,66 @@
+import pytest
+
+import pipeline
+import rules
+from rules import DEFAULT_UNITS
+from units import unit_key
+
+@pytest.mark.parametrize("raw, key", [
+    ("x10^3/µL", "10^3/ul"),
+    ("x10³/µL", "10^3/ul"),
+    ("10*3/uL", "10^3/ul"),
+    ("thou/cumm", "10^3/ul"),
+    ("Lakhs/cumm", "10^5/ul"),
+    ("lakhs", "10^5/ul"),
+    ("million/cumm", "10^6/ul"),
+    ("mlllion/cumm", "10^6/ul"),
+    ("gm/dl", "g/dl"),
+    ("gm%", "g/dl"),
+    ("µmol/L", "umol/l"),
+    ("mm/1st hr", "mm/hr"),
+    ("", ""),
+])
+def test_unit_key(raw, key):
+    assert unit_key(raw) == key
+
+@pytest.mark.parametrize("analyte, value, unit, expected, canonical", [
+    ("WBC", 7.5, "x10^3/µL", 7500.0, "/µL"),
+    ("Platelet", 2.5, "lakhs/cumm", 250000.0, "/µL"),
+    ("Platelet", 150, "x10^3/uL", 150000.0, "/µL"),
+    ("Glucose (Fasting)", 5.5, "mmol/L", 99.088, "mg/dL"),
+    ("Creatinine", 88.4, "µmol/L", 1.0, "mg/dL"),
+    ("Hemoglobin", 135, "g/L", 13.5, "g/dL"),
+])
+def test_converts_into_canonical_unit(analyte, value, unit, expected, canonical):
+    num, out_unit, converted, source, unrecognised = DEFAULT_UNITS.convert_one(analyte, value, unit)
+    assert num == pytest.approx(expected, rel=1e-4)
+    assert (out_unit, converted, source, unrecognised) == (canonical, True, unit, False)
+
+def test_canonical_unit_is_kept():
+    assert DEFAULT_UNITS.convert_one("Hemoglobin", 13.5, "gm/dl") == (13.5, "gm/dl", False, "gm/dl", False)
+
+def test_scaled_unit_found_in_line():
+    num, unit, converted, source, _ = DEFAULT_UNITS.convert_one("WBC", 7.5, "", line="WBC 7.5 x10^3/uL")
+    assert (num, unit, converted) == (7500.0, "/µL", True)
+
+@pytest.mark.parametrize("analyte, unit", [("Creatinine", "U/L"), ("Hemoglobin", "mg/dL"), ("RBC", "mmol/L")])
+def test_unconvertible_unit_is_unrecognised(analyte, unit):
+    num, out_unit, converted, _, unrecognised = DEFAULT_UNITS.convert_one(analyte, 150.0, unit)
+    assert (num, out_unit, converted, unrecognised) == (150.0, unit, False, True)
+
+def test_missing_unit_or_unknown_analyte_is_not_unrecognised():
+    assert not DEFAULT_UNITS.convert_one("Creatinine", 1.2, "")[4]
+    assert not DEFAULT_UNITS.convert_one("Myoglobin", 50.0, "ng/mL")[4]
+    assert not DEFAULT_UNITS.convert_one("Myoglobin", float('nan'), "ng/mL")[4]
+
+# units the line parser cuts short are compared as before, not marked unrecognised
+@pytest.mark.parametrize("line, expected", [
+    ("ESR 40 mm/1st hr", ("ESR", "High")),
+    ("Platelets 90000 /cu mm", ("Platelet", "Low")),
+    ("RBC Count 3.1 mill/cu.mm", ("RBC", "Low")),
+    ("Serum Creatinine : 2.1 mg / dl", ("Creatinine", "Abnormal")),
+])
+def test_truncated_unit_is_still_compared(line, expected):
+    result, = pipeline.interpret_tests(pipeline.parse_lab_lines(line), {'Sex': 'Male', 'Age': '40'})
+    assert (result['Test'], result['Flag']) == expected
+    assert result['Note'] != rules.UNIT_NOT_RECOGNISED
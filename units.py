@@ -0,0 +1,98 @@
+import csv
+import math
+import os
+import re
+from functools import lru_cache
+
+DEFAULT_FACTORS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "units.csv")
+
+# -------------------------
+# Unit spelling normalization
+# -------------------------
+_SUPERSCRIPT_DIGITS = str.maketrans({'⁰': '0', '¹': '1', '²': '2', '³': '3', '⁴': '4',
+                                     '⁵': '5', '⁶': '6', '⁷': '7', '⁸': '8', '⁹': '9'})
+# "m[il]{4}on" also reads OCR'd "mlllion", "milllon" ...
+_SCALE_RE = re.compile(r'^(?:10[\^*](\d+)|(lakhs?|lacs?)|(thou(?:sands?)?|k)|(m[il]{4}ons?|mill?))')
+_SCALE_WORDS = {2: 5, 3: 3, 4: 6}
+_NUMERATOR_ALIASES = {'gm': 'g', 'gms': 'g', 'gram': 'g', 'grams': 'g', 'cells': '', 'cell': '', 'iu': 'u'}
+_DENOMINATOR_ALIASES = {'cumm': 'ul', 'cu.mm': 'ul', 'cmm': 'ul', 'mm3': 'ul', 'mm^3': 'ul',
+                        'hour': 'hr', 'h': 'hr', '1sthr': 'hr', '1sthour': 'hr', 'hr1': 'hr'}
+_PERCENT_ALIASES = {'g%': 'g/dl', 'gm%': 'g/dl', 'gms%': 'g/dl', 'mg%': 'mg/dl'}
+
+@lru_cache(maxsize=4096)
+def unit_key(raw):
+    # spelling-independent key for a unit: "Lakhs/cumm" -> "10^5/ul", "x10³/µL" -> "10^3/ul"
+    s = str(raw or '').strip().lower()
+    if not s:
+        return ''
+    s = re.sub(r'([⁰¹²³⁴⁵⁶⁷⁸⁹]+)', lambda m: '^' + m.group(1).translate(_SUPERSCRIPT_DIGITS), s)
+    s = s.replace('µ', 'u').replace('μ', 'u').replace('×', 'x').replace('**', '^').replace(' ', '')
+    s = re.sub(r'\bper\b|per(?=[a-z])', '/', s)
+    s = s.lstrip('x*')
+    if s in _PERCENT_ALIASES:
+        return _PERCENT_ALIASES[s]
+    scale = ''
+    m = _SCALE_RE.match(s)
+    if m:
+        exp = m.group(1) or _SCALE_WORDS[next(i for i in (2, 3, 4) if m.group(i))]
+        scale = f"10^{exp}"
+        s = s[m.end():]
+    num, _, den = s.partition('/')
+    num = _NUMERATOR_ALIASES.get(num, num)
+    den = _DENOMINATOR_ALIASES.get(den, den)
+    if scale and not num and not den:
+        # "2.5 lakhs" on a cell count means lakhs per microlitre
+        den = 'ul'
+    key = scale + num
+    if den:
+        key += '/' + den
+    return key
+
+# A scaled count unit somewhere in the line, for results whose unit the line parser
+# could not capture (e.g. "WBC 7.5 x10^3/uL" or "Platelets (lakhs) 2.5").
+_SCALED_UNIT_IN_LINE = re.compile(r'((?:[x×*]\s*)?10\s*(?:\^|\*\*)?\s*(?:\d+|[⁰¹²³⁴⁵⁶⁷⁸⁹]+)\s*/\s*[a-zµμ.]+\d?'
+                                  r'|lakhs?|lacs?|millions?)', re.IGNORECASE)
+
+# -------------------------
+# Registry
+# -------------------------
+class UnitRegistry:
+    def __init__(self, factor_rows, canonical_units):
+        # canonical_units: analyte -> unit text; factor_rows: (analyte, unit text, factor)
+        self.canonical_units = dict(canonical_units)
+        factors = {}
+        for analyte, unit in self.canonical_units.items():
+            factors[(analyte, unit_key(unit))] = 1.0
+        for analyte, unit, factor in factor_rows:
+            factors[(analyte, unit_key(unit))] = float(factor)
+        # precomputed (analyte, unit key) -> factor table
+        self._factors = factors
+        # every unit the tables know, for any analyte; a key outside it is more likely a unit
+        # the parser cut short ("mm/" of "mm/1st hr") than a different unit
+        self._known_keys = frozenset(key for _, key in factors)
+
+    @classmethod
+    def from_csv(cls, canonical_units, path=DEFAULT_FACTORS_PATH):
+        with open(path, encoding="utf-8", newline='') as fh:
+            rows = [(r['analyte'].strip(), r['unit'].strip(), r['factor'])
+                    for r in csv.DictReader(ln for ln in fh if not ln.startswith('#'))]
+        return cls(rows, canonical_units)
+
+    def convert_one(self, analyte, value, unit, line=None):
+        # returns (canonical value, canonical unit text, converted, unit converted from,
+        # unrecognised); a result whose unit is unknown or already canonical keeps its value
+        # and unit. Unrecognised: the unit is a known one with no factor into the analyte's
+        # canonical unit (creatinine in U/L), so the value cannot be compared with its ranges.
+        unit = '' if unit is None else str(unit)
+        factor = self._factors.get((analyte, unit_key(unit)), math.nan)
+        source = unit
+        if line is not None and factor != factor and value == value:
+            m = _SCALED_UNIT_IN_LINE.search(str(line))
+            if m:
+                factor = self._factors.get((analyte, unit_key(m.group(1))), math.nan)
+                source = m.group(1)
+        if factor != factor or factor == 1.0 or value != value:
+            unrecognised = (factor != factor and value == value and analyte in self.canonical_units
+                            and unit_key(source) in self._known_keys)
+            return value, unit, False, source, unrecognised
+        return round(value * factor, 6), self.canonical_units.get(analyte, ''), True, source, False